@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 
 
 class User(AbstractUser):
@@ -7,6 +9,7 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=30, blank=True, verbose_name='Имя')
     last_name = models.CharField(max_length=30, blank=True, verbose_name='Фамилия')
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, verbose_name='Аватар')
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Производные аватара')
     bio = models.TextField(max_length=500, blank=True, verbose_name='Биография')
     created_at=models.DateTimeField(auto_now_add=True, verbose_name='Дата регистрации')
     updated_at=models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
@@ -19,6 +22,10 @@ class User(AbstractUser):
         db_table = 'users'
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            # gin_trgm_ops требует pg_trgm: миграция с этим индексом начинается с TrigramExtension()
+            GinIndex(OpClass(Upper('username'), name='gin_trgm_ops'), name='users_username_trgm'),
+        ]
 
     def __str__(self):
         return self.email
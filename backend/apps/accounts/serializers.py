@@ -1,8 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from config.loaders import BatchListSerializer, BatchLoadedField, CountLoader
 from .models import User
 
+# Количество постов и комментариев по автору, GROUP BY на всю страницу пользователей
+POSTS_COUNT = CountLoader('frontpage.Post', 'author')
+COMMENTS_COUNT = CountLoader('comments.Comment', 'author')
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """Сериализатор для регистрации пользователя"""
@@ -66,8 +71,8 @@ class UserLoginSerializer(serializers.Serializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     """Сериализатор для профиля пользователя"""
     full_name = serializers.ReadOnlyField()
-    posts_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    posts_count = BatchLoadedField(POSTS_COUNT)
+    comments_count = BatchLoadedField(COMMENTS_COUNT)
 
     class Meta:
         model = User
@@ -77,22 +82,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'posts_count', 'comments_count'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
-
-    def get_posts_count(self, obj):
-        """Безопасное получение количества постов"""
-        try:
-            return obj.posts.count()
-        except AttributeError:
-            # Если атрибут posts не существует, возвращаем 0
-            return 0
-    
-    def get_comments_count(self, obj):
-        """Безопасное получение количества комментариев"""
-        try:
-            return obj.comments.count()
-        except AttributeError:
-            # Если атрибут comments не существует, возвращаем 0
-            return 0
+        list_serializer_class = BatchListSerializer
 
 
 class UserUpdateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from config.images import needs_refresh, schedule_refresh
+from .models import User
+from .tasks import generate_avatar_derivatives
+
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, update_fields=None, **kwargs):
+    """ Новый аватар: производные генерируются в фоне после коммита """
+    if needs_refresh(instance, 'avatar', update_fields):
+        schedule_refresh(generate_avatar_derivatives, instance.pk)
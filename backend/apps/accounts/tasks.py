@@ -0,0 +1,11 @@
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from config.images import refresh_derivatives
+
+
+@shared_task
+def generate_avatar_derivatives(user_id):
+    """Производные аватара (размеры WebP/JPEG и blurhash)"""
+    return refresh_derivatives(get_user_model(), user_id, 'avatar', settings.AVATAR_WIDTHS)
@@ -1,3 +1,37 @@
 from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
-# Create your tests here.
+from apps.comments.models import Comment
+from apps.frontpage.models import Post
+from .models import User
+from .serializers import UserProfileSerializer
+
+
+class UserProfileSerializerTests(TestCase):
+    """Счетчики профиля загружаются пакетно: число запросов не зависит от числа пользователей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='x')
+            for i in range(4)
+        ]
+        for i, user in enumerate(cls.users):
+            for n in range(i):
+                post = Post.objects.create(title=f'Post {i}-{n}', slug=f'post-{i}-{n}', content='text', author=user)
+                Comment.objects.create(post=post, author=cls.users[0], content='comment')
+
+    def serialize(self, users):
+        request = Request(APIRequestFactory().get('/'))
+        return UserProfileSerializer(users, many=True, context={'request': request}).data
+
+    def test_counts_in_constant_queries(self):
+        for users in (self.users[:1], self.users):
+            with self.subTest(users=len(users)):
+                # По запросу на счетчик постов и комментариев
+                with self.assertNumQueries(2):
+                    data = self.serialize(users)
+                self.assertEqual([row['posts_count'] for row in data], list(range(len(users))))
+        self.assertEqual(data[0]['comments_count'], 6)
+        self.assertEqual([row['comments_count'] for row in data[1:]], [0, 0, 0])
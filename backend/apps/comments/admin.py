@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from .models import Comment
+from .services import CommentCounterService
 
 
 @admin.register(Comment)
@@ -11,7 +13,7 @@ class CommentAdmin(admin.ModelAdmin):
     )
     list_filter = ('is_active', 'created_at', 'updated_at')
     search_fields = ('content', 'author__username', 'post__title')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'replies_count')
     raw_id_fields = ('author', 'post', 'parent')
     list_editable = ('is_active',)
     
@@ -20,7 +22,7 @@ class CommentAdmin(admin.ModelAdmin):
             'fields': ('post', 'author', 'parent', 'content')
         }),
         ('Status', {
-            'fields': ('is_active',)
+            'fields': ('is_active', 'replies_count')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -45,14 +47,41 @@ class CommentAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('author', 'post', 'parent')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            CommentCounterService.comment_created(obj)
+        elif 'is_active' in form.changed_data:
+            CommentCounterService.apply([(obj.post_id, obj.parent_id)], 1 if obj.is_active else -1)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Comment.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        """Удаление с ответами (CASCADE) списывает счетчики всех удаленных активных комментариев"""
+        with transaction.atomic():
+            ids = set(queryset.values_list('id', flat=True))
+            level = ids
+            while level:
+                level = set(
+                    Comment.objects.filter(parent_id__in=level).values_list('id', flat=True)
+                ) - ids
+                ids |= level
+            removed = list(
+                Comment.objects.filter(id__in=ids, is_active=True)
+                .values_list('post_id', 'parent_id')
+            )
+            Comment.objects.filter(id__in=ids).delete()
+            CommentCounterService.apply(removed, -1)
+
     actions = ['make_active', 'make_inactive']
 
     def make_active(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = CommentCounterService.set_active(queryset, True)
         self.message_user(request, f'{updated} комментариев были отмечены как активные.')
     make_active.short_description = "Отметить выбранные комментарии как активные"
 
     def make_inactive(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = CommentCounterService.set_active(queryset, False)
         self.message_user(request, f'{updated} комментариев были отмечены как неактивные.')
     make_inactive.short_description = "Отметить выбранные комментарии как неактивные"
@@ -8,6 +8,7 @@ class Comment(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies', verbose_name='Родительский комментарий')
     content = models.TextField(verbose_name='Текст комментария')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
+    replies_count = models.PositiveIntegerField(default=0, verbose_name='Количество ответов')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
@@ -18,16 +19,13 @@ class Comment(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['post', '-created_at']),
+            models.Index(fields=['post', '-updated_at']),
             models.Index(fields=['author', '-created_at']),
             models.Index(fields=['parent', '-created_at']),
         ]
     def __str__(self):
         return f'Комментарий от {self.author.username} к посту {self.post.title}'
     
-    @property
-    def replies_count(self):
-        return self.replies.filter(is_active=True).count()
-    
     @property
     def is_reply(self):
-        return self.parent is not None
+        return self.parent_id is not None
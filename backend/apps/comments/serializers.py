@@ -1,9 +1,13 @@
+from django.db import transaction
 from rest_framework import serializers
+from config.fieldsets import SparseFieldsetMixin
+from config.images import variants_representation
 from .models import Comment
+from .services import CommentCounterService
 from apps.frontpage.models import Post
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Базовый сериализатор для комментариев"""
     author_info = serializers.SerializerMethodField()
     replies_count = serializers.ReadOnlyField()
@@ -17,13 +21,18 @@ class CommentSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['author', 'is_active']
+        field_dependencies = {
+            'author_info': {'select_related': ['author']},
+            'is_reply': {'only': ['parent']},
+        }
 
     def get_author_info(self, obj):
         return {
             'id': obj.author.id,
             'username': obj.author.username,
             'full_name': obj.author.full_name,
-            'avatar': obj.author.avatar.url if obj.author.avatar else None
+            'avatar': obj.author.avatar.url if obj.author.avatar else None,
+            'avatar_variants': variants_representation(obj.author.avatar, obj.author.avatar_variants),
         }
     
 
@@ -53,7 +62,10 @@ class CommentCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
-        return super().create(validated_data)
+        with transaction.atomic():
+            comment = super().create(validated_data)
+            CommentCounterService.comment_created(comment)
+        return comment
     
 
 class CommentUpdateSerializer(serializers.ModelSerializer):
@@ -70,11 +82,28 @@ class CommentDetailSerializer(CommentSerializer):
 
     class Meta(CommentSerializer.Meta):
         fields = CommentSerializer.Meta.fields + ['replies']
+        field_dependencies = {
+            **CommentSerializer.Meta.field_dependencies,
+            'replies': {'only': ['parent']},
+        }
 
     def get_replies(self, obj):
-        if obj.parent is None:  # Показываем ответы только для основных комментариев
-            replies = obj.replies.filter(is_active=True).order_by('created_at')
+        if obj.parent_id is None:  # Показываем ответы только для основных комментариев
+            replies = list(obj.replies.filter(is_active=True).select_related('author').order_by('created_at'))
+            for reply in replies:
+                reply.parent = obj
             return CommentSerializer(replies, many=True, context=self.context).data
         return []
+
+
+class CommentTreeSerializer(CommentSerializer):
+    """Комментарий с вложенными ответами из CommentTreeService.load (tree_replies)"""
+    replies = serializers.SerializerMethodField()
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['replies']
+
+    def get_replies(self, obj):
+        return CommentTreeSerializer(obj.tree_replies, many=True, context=self.context).data
     
     
\ No newline at end of file
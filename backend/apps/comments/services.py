@@ -0,0 +1,266 @@
+import logging
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from apps.frontpage.models import Post
+from apps.frontpage.services import CategoryFeedService, PostBatchService
+from config.cache import ObjectCache, invalidate_cache_tags
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+
+class CommentCounterService:
+    """
+    Денормализованные счетчики активных комментариев:
+    Post.comments_count (все активные комментарии поста) и
+    Comment.replies_count (активные ответы на комментарий).
+    """
+
+    RECONCILE_CHUNK_SIZE = 1000
+
+    @staticmethod
+    def comment_created(comment: Comment):
+        if comment.is_active:
+            CommentCounterService.apply([(comment.post_id, comment.parent_id)], 1)
+
+    @staticmethod
+    def deactivate(comment: Comment) -> bool:
+        """Мягкое удаление: условный UPDATE исключает двойное списание"""
+        with transaction.atomic():
+            updated = Comment.objects.filter(pk=comment.pk, is_active=True).update(
+                is_active=False, updated_at=timezone.now()
+            )
+            if updated:
+                CommentCounterService.apply([(comment.post_id, comment.parent_id)], -1)
+        comment.is_active = False
+        return bool(updated)
+
+    @staticmethod
+    def set_active(queryset, is_active: bool) -> int:
+        """Массовое изменение is_active (действия админки)"""
+        with transaction.atomic():
+            changed = list(
+                queryset.filter(is_active=not is_active)
+                .select_for_update()
+                .values_list('id', 'post_id', 'parent_id')
+            )
+            if not changed:
+                return 0
+            Comment.objects.filter(id__in=[row[0] for row in changed]).update(
+                is_active=is_active, updated_at=timezone.now()
+            )
+            CommentCounterService.apply(
+                [(post_id, parent_id) for _, post_id, parent_id in changed],
+                1 if is_active else -1,
+            )
+        return len(changed)
+
+    @staticmethod
+    def apply(rows: Iterable[Tuple[int, Optional[int]]], sign: int):
+        """Применяет изменения счетчиков: по одному UPDATE на таблицу"""
+        post_deltas = Counter()
+        parent_deltas = Counter()
+        for post_id, parent_id in rows:
+            post_deltas[post_id] += sign
+            if parent_id is not None:
+                parent_deltas[parent_id] += sign
+
+        if not post_deltas:
+            return
+        with transaction.atomic():
+            CommentCounterService._apply_deltas(Post, 'comments_count', post_deltas)
+            CommentCounterService._apply_deltas(Comment, 'replies_count', parent_deltas)
+        # Набор активных комментариев и счетчики ответов изменились;
+        # comments_count есть и в кешированных виджетах и лентах категорий
+        CommentTreeService.invalidate(post_deltas)
+        PostBatchService.invalidate(post_deltas)
+        invalidate_cache_tags('posts')
+        CategoryFeedService.invalidate(
+            Post.objects.filter(pk__in=post_deltas).order_by().values_list('category_id', flat=True).distinct()
+        )
+
+    @staticmethod
+    def _apply_deltas(model, field: str, deltas: Dict[int, int]):
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        delta = Case(
+            *[When(pk=pk, then=Value(value)) for pk, value in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        model.objects.filter(pk__in=deltas).update(**{field: Greatest(F(field) + delta, 0)})
+
+    @staticmethod
+    def reconcile(chunk_size: int = RECONCILE_CHUNK_SIZE) -> Dict:
+        """Исправляет расхождения счетчиков, обходя таблицы порциями по id"""
+        post_comments = Comment.objects.filter(
+            post=OuterRef('pk'), is_active=True
+        ).order_by().values('post').annotate(total=Count('pk')).values('total')
+        replies = Comment.objects.filter(
+            parent=OuterRef('pk'), is_active=True
+        ).order_by().values('parent').annotate(total=Count('pk')).values('total')
+
+        fixed_posts = CommentCounterService._reconcile_model(
+            Post, 'comments_count', Coalesce(Subquery(post_comments), 0), chunk_size
+        )
+        fixed_comments = CommentCounterService._reconcile_model(
+            Comment, 'replies_count', Coalesce(Subquery(replies), 0), chunk_size
+        )
+        if fixed_posts or fixed_comments:
+            logger.warning(
+                f"Comment counters drift repaired: {fixed_posts} posts, {fixed_comments} comments"
+            )
+        return {'fixed_posts': fixed_posts, 'fixed_comments': fixed_comments}
+
+    @staticmethod
+    def _reconcile_model(model, field: str, actual, chunk_size: int) -> int:
+        fixed = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not chunk:
+                return fixed
+            last_pk = chunk[-1]
+            fixed += model.objects.filter(pk__in=chunk).exclude(
+                **{field: actual}
+            ).update(**{field: actual})
+
+
+class CommentTreeService:
+    """
+    Деревья комментариев постов.
+
+    Ветки загружаются одним рекурсивным CTE по Comment.parent для любого
+    числа постов: активные комментарии и активные ответы на них вместе с
+    авторами. Вложенность собирается в Python за O(n). Готовые
+    представления хранятся в кеше по посту (ObjectCache); версия поста
+    меняется после коммита при создании, изменении и мягком удалении его комментариев.
+    """
+
+    AUTHOR_FIELDS = ('id', 'username', 'first_name', 'last_name', 'avatar', 'avatar_variants')
+    trees = ObjectCache('comments:tree', 'COMMENT_TREE_CACHE_TIMEOUT')
+
+    @staticmethod
+    def load(post_id: int, max_depth: Optional[int] = None, limit: Optional[int] = None) -> List[Comment]:
+        """
+        Корневые комментарии (новые сверху) с ответами в tree_replies (старые сверху).
+        max_depth - сколько уровней ответов загружать, limit - сколько всего комментариев:
+        при обрезке сохраняются верхние уровни.
+        """
+        return CommentTreeService.load_many([post_id], max_depth, limit)[post_id]
+
+    @staticmethod
+    def load_many(post_ids: Iterable[int], max_depth: Optional[int] = None, limit: Optional[int] = None) -> Dict[int, List[Comment]]:
+        """Деревья нескольких постов одним запросом (limit - на каждый пост)"""
+        post_ids = list(post_ids)
+        roots = {post_id: [] for post_id in post_ids}
+        if not post_ids:
+            return roots
+
+        User = get_user_model()
+        using = router.db_for_read(Comment)
+        connection = connections[using]
+        quote = connection.ops.quote_name
+
+        comment_fields = [field.attname for field in Comment._meta.concrete_fields]
+        author_fields = [User._meta.get_field(name).attname for name in CommentTreeService.AUTHOR_FIELDS]
+        columns = [f'c.{quote(Comment._meta.get_field(name).column)}' for name in comment_fields] + [
+            f'u.{quote(User._meta.get_field(name).column)}' for name in author_fields
+        ]
+        table, users = quote(Comment._meta.db_table), quote(User._meta.db_table)
+
+        params = [post_ids]
+        depth_condition = ''
+        if max_depth is not None:
+            depth_condition = 'AND t.depth < %s'
+            params.append(max_depth)
+        limit_condition = ''
+        if limit is not None:
+            limit_condition = 'WHERE r.position <= %s'
+            params.append(limit)
+
+        sql = f"""
+            WITH RECURSIVE tree (id, post_id, depth) AS (
+                SELECT c.id, c.post_id, 0 FROM {table} c
+                WHERE c.post_id = ANY(%s) AND c.parent_id IS NULL AND c.is_active
+                UNION ALL
+                SELECT c.id, c.post_id, t.depth + 1 FROM {table} c
+                JOIN tree t ON c.parent_id = t.id
+                WHERE c.post_id = t.post_id AND c.is_active {depth_condition}
+            ),
+            ranked AS (
+                SELECT t.id, ROW_NUMBER() OVER (
+                    PARTITION BY t.post_id
+                    ORDER BY t.depth, CASE WHEN t.depth = 0 THEN c.created_at END DESC, c.created_at, c.id
+                ) AS position
+                FROM tree t
+                JOIN {table} c ON c.id = t.id
+            )
+            SELECT {', '.join(columns)} FROM ranked r
+            JOIN {table} c ON c.id = r.id
+            JOIN {users} u ON u.id = c.author_id
+            {limit_condition}
+            ORDER BY c.post_id, r.position
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        # Внутри поста родитель всегда идет раньше ответов (сортировка по глубине)
+        nodes = {}
+        split = len(comment_fields)
+        for row in rows:
+            comment = Comment.from_db(using, comment_fields, row[:split])
+            comment.author = User.from_db(using, author_fields, row[split:])
+            comment.tree_replies = []
+            if comment.parent_id is None:
+                roots[comment.post_id].append(comment)
+            else:
+                parent = nodes[comment.parent_id]
+                comment.parent = parent
+                parent.tree_replies.append(comment)
+            nodes[comment.pk] = comment
+        return roots
+
+    @staticmethod
+    def get_tree(post_id: int, build: Callable[[], List[Dict]]) -> List[Dict]:
+        """Представление дерева из кеша; build() строит его при промахе"""
+        return CommentTreeService.trees.get_many([post_id], lambda post_ids: {post_id: build()})[post_id]
+
+    @staticmethod
+    def get_trees(post_ids: Iterable[int], build: Callable[[List[int]], Dict[int, List[Dict]]]) -> Dict[int, List[Dict]]:
+        """Представления деревьев постов из кеша одним get_many; build(ids) строит промахи"""
+        return CommentTreeService.trees.get_many(post_ids, build)
+
+    @staticmethod
+    def invalidate(post_ids: Iterable[int]):
+        """Новая версия деревьев постов (после коммита транзакции)"""
+        CommentTreeService.trees.invalidate(post_ids)
+
+    @staticmethod
+    def select(tree: List[Dict], names: Optional[Set[str]] = None, max_depth: Optional[int] = None) -> List[Dict]:
+        """Окно дерева: только поля names (None - все) и max_depth уровней ответов"""
+        if names is None and max_depth is None:
+            return tree
+
+        def node(item, depth):
+            result = {key: value for key, value in item.items() if names is None or key in names}
+            if 'replies' in result:
+                result['replies'] = (
+                    [] if max_depth is not None and depth >= max_depth
+                    else [node(reply, depth + 1) for reply in item['replies']]
+                )
+            return result
+
+        return [node(item, 0) for item in tree]
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Comment
+from .services import CommentTreeService
+
+
+@receiver(post_save, sender=Comment)
+def comment_post_save(sender, instance, **kwargs):
+    """ Новый или отредактированный комментарий: снимок дерева поста устарел """
+    CommentTreeService.invalidate([instance.post_id])
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .services import CommentCounterService
+
+
+@shared_task
+def reconcile_comment_counters():
+    """Сверка денормализованных счетчиков комментариев с фактическими данными"""
+    return CommentCounterService.reconcile()
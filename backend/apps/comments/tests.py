@@ -1,3 +1,311 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.frontpage.models import Category, Post
+from config.redis_client import get_redis
+from .admin import CommentAdmin
+from .models import Comment
+from .services import CommentCounterService, CommentTreeService
+
+
+def clear_redis(pattern):
+    """Удаляет ключи Redis приложения, которые трогает тест"""
+    client = get_redis()
+    keys = client.keys(pattern)
+    if keys:
+        client.delete(*keys)
+
+
+def shape(nodes):
+    """Дерево как вложенные пары (id, ответы) - для представлений и объектов load()"""
+    if nodes and isinstance(nodes[0], dict):
+        return [(node['id'], shape(node.get('replies', []))) for node in nodes]
+    return [(node.pk, shape(node.tree_replies)) for node in nodes]
+
+
+class CommentTreeTestCase(TestCase):
+    """
+    Дерево поста:
+        r1 (0 мин): a (1): a1 (3); b (2): e (4, удален)
+        r2 (10): c (11)
+        r3 (20, удален): d (21)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.post = Post.objects.create(title='Post', slug='post', content='text', author=cls.author)
+        cls.started = timezone.now() - timedelta(days=1)
+
+        cls.r1 = cls.comment(0)
+        cls.a = cls.comment(1, cls.r1)
+        cls.a1 = cls.comment(3, cls.a)
+        cls.b = cls.comment(2, cls.r1)
+        cls.comment(4, cls.b, is_active=False)
+        cls.r2 = cls.comment(10)
+        cls.c = cls.comment(11, cls.r2)
+        r3 = cls.comment(20, is_active=False)
+        cls.comment(21, r3)
+
+    @classmethod
+    def comment(cls, minutes, parent=None, post=None, is_active=True):
+        comment = Comment.objects.create(
+            post=post or cls.post, author=cls.author, parent=parent, content=f'at {minutes}', is_active=is_active,
+        )
+        Comment.objects.filter(pk=comment.pk).update(created_at=cls.started + timedelta(minutes=minutes))
+        return comment
+
+    def setUp(self):
+        clear_redis('*comments:tree*')
+        self.addCleanup(clear_redis, '*comments:tree*')
+
+    def full_tree(self):
+        r1, r2 = self.r1.pk, self.r2.pk
+        return [(r2, [(self.c.pk, [])]), (r1, [(self.a.pk, [(self.a1.pk, [])]), (self.b.pk, [])])]
+
+
+class CommentTreeServiceTests(CommentTreeTestCase):
+    """Загрузка деревьев рекурсивным CTE"""
+
+    def test_roots_newest_first_replies_oldest_first(self):
+        self.assertEqual(shape(CommentTreeService.load(self.post.pk)), self.full_tree())
+
+    def test_tree_is_loaded_in_one_query(self):
+        with self.assertNumQueries(1):
+            roots = CommentTreeService.load(self.post.pk)
+            self.assertEqual(roots[1].tree_replies[0].author.username, 'author')
+
+    def test_limit_keeps_upper_levels(self):
+        # 2 корня и 2 первых по времени ответа первого уровня; c и a1 не помещаются
+        roots = CommentTreeService.load(self.post.pk, limit=4)
+        self.assertEqual(shape(roots), [(self.r2.pk, []), (self.r1.pk, [(self.a.pk, []), (self.b.pk, [])])])
+
+    def test_max_depth(self):
+        roots = CommentTreeService.load(self.post.pk, max_depth=1)
+        self.assertEqual(shape(roots), [(self.r2.pk, [(self.c.pk, [])]), (self.r1.pk, [(self.a.pk, []), (self.b.pk, [])])])
+
+    def test_limit_applies_per_post(self):
+        other = Post.objects.create(title='Other', slug='other', content='text', author=self.author)
+        roots = [self.comment(minutes, post=other) for minutes in range(3)]
+        empty = Post.objects.create(title='Empty', slug='empty', content='text', author=self.author)
+
+        trees = CommentTreeService.load_many([self.post.pk, other.pk, empty.pk], limit=2)
+        self.assertEqual(shape(trees[self.post.pk]), [(self.r2.pk, []), (self.r1.pk, [])])
+        self.assertEqual(shape(trees[other.pk]), [(roots[2].pk, []), (roots[1].pk, [])])
+        self.assertEqual(trees[empty.pk], [])
+
+
+class PostCommentsViewTests(CommentTreeTestCase):
+    """Комментарии поста: окно ?depth= и сброс кешированного дерева"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = f'/api/v1/comments/post/{self.post.pk}/'
+
+    def comments(self, query=''):
+        response = self.client.get(f'{self.url}{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['comments']
+
+    def test_depth_window(self):
+        self.assertEqual(shape(self.comments()), self.full_tree())
+        self.assertEqual(shape(self.comments('?depth=0')), [(self.r2.pk, []), (self.r1.pk, [])])
+        self.assertEqual(
+            shape(self.comments('?depth=1')),
+            [(self.r2.pk, [(self.c.pk, [])]), (self.r1.pk, [(self.a.pk, []), (self.b.pk, [])])],
+        )
+
+    def test_tree_is_served_from_cache(self):
+        self.comments()
+        with mock.patch.object(CommentTreeService, 'load_many', wraps=CommentTreeService.load_many) as load_many:
+            self.assertEqual(shape(self.comments('?depth=1&fields=id,replies')), shape(self.comments('?depth=1')))
+        self.assertFalse(load_many.called)
+
+    def test_new_reply_invalidates_tree(self):
+        self.comments()
+        with self.captureOnCommitCallbacks(execute=True):
+            reply = Comment.objects.create(post=self.post, author=self.author, parent=self.c, content='new')
+            CommentCounterService.comment_created(reply)
+        self.assertEqual(shape(self.comments())[0], (self.r2.pk, [(self.c.pk, [(reply.pk, [])])]))
+
+    def test_edit_invalidates_tree(self):
+        self.comments()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.get(pk=self.a1.pk)
+            comment.content = 'edited'
+            comment.save()
+        self.assertEqual(self.comments()[1]['replies'][0]['replies'][0]['content'], 'edited')
+
+    def test_soft_delete_invalidates_tree(self):
+        self.comments()
+        with self.captureOnCommitCallbacks(execute=True):
+            CommentCounterService.deactivate(Comment.objects.get(pk=self.a.pk))
+        self.assertEqual(shape(self.comments()), [(self.r2.pk, [(self.c.pk, [])]), (self.r1.pk, [(self.b.pk, [])])])
+
+    def test_etag_depends_on_fieldset_and_depth(self):
+        def etag(query=''):
+            response = self.client.get(f'{self.url}{query}')
+            self.assertEqual(response.status_code, 200)
+            return response['ETag']
+
+        full = etag()
+        # Порядок и пробелы в списке полей валидатор не меняют
+        self.assertEqual(etag('?fields=id,replies'), etag('?fields= replies,id,'))
+        self.assertNotEqual(etag('?fields=id,replies'), full)
+        self.assertNotEqual(etag('?omit=content'), full)
+        self.assertEqual(etag('?depth=abc'), full)
+        self.assertNotEqual(etag('?depth=1'), full)
+
+        response = self.client.get(f'{self.url}?fields=id,replies', HTTP_IF_NONE_MATCH=full)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['comments'][0]), {'id', 'replies'})
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=full).status_code, 304)
+
+
+class CommentCounterTests(TestCase):
+    """Счетчики comments_count и replies_count: по одному UPDATE на таблицу в одной транзакции"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_superuser(email='admin@example.com', username='admin', password='x')
+        cls.category = Category.objects.create(name='News', slug='news')
+        cls.post = Post.objects.create(
+            title='Post', slug='post', content='text', author=cls.author, category=cls.category,
+        )
+        cls.root = Comment.objects.create(post=cls.post, author=cls.author, content='root')
+        CommentCounterService.comment_created(cls.root)
+
+    def setUp(self):
+        for pattern in ('*response:*', '*cache_tag:*', '*category_feed:*', '*posts:object*'):
+            clear_redis(pattern)
+            self.addCleanup(clear_redis, pattern)
+
+    def reply(self, **kwargs):
+        return Comment.objects.create(post=self.post, author=self.author, parent=self.root, content='reply', **kwargs)
+
+    def assertCounts(self, comments_count, replies_count):
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, comments_count)
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).replies_count, replies_count)
+
+    def test_create_deactivate_and_reactivate(self):
+        reply = self.reply()
+        # SAVEPOINT, UPDATE posts, UPDATE comments, RELEASE, категории для сброса лент
+        with self.assertNumQueries(5):
+            CommentCounterService.comment_created(reply)
+        self.assertCounts(2, 1)
+
+        with self.assertNumQueries(8):
+            self.assertTrue(CommentCounterService.deactivate(reply))
+        self.assertCounts(1, 0)
+
+        # Повторное удаление не списывает счетчики второй раз
+        reply = Comment.objects.get(pk=reply.pk)
+        with self.assertNumQueries(3):
+            self.assertFalse(CommentCounterService.deactivate(reply))
+        self.assertCounts(1, 0)
+
+        self.assertEqual(CommentCounterService.set_active(Comment.objects.filter(pk=reply.pk), True), 1)
+        self.assertCounts(2, 1)
+
+    def test_inactive_comment_is_not_counted(self):
+        reply = self.reply(is_active=False)
+        with self.assertNumQueries(0):
+            CommentCounterService.comment_created(reply)
+        self.assertCounts(1, 0)
+
+    def test_admin_bulk_actions(self):
+        replies = [self.reply() for _ in range(3)]
+        CommentCounterService.apply([(self.post.pk, self.root.pk)] * 3, 1)
+        self.assertCounts(4, 3)
+
+        self.client.force_login(self.author)
+        url = '/admin/comments/comment/'
+        selected = [reply.pk for reply in replies[:2]] + [self.root.pk]
+        self.client.post(url, {'action': 'make_inactive', '_selected_action': selected})
+        self.assertCounts(1, 1)
+        # Уже неактивные комментарии пропускаются
+        self.client.post(url, {'action': 'make_active', '_selected_action': [replies[0].pk, replies[2].pk]})
+        self.assertCounts(2, 2)
+
+    def test_admin_save_model(self):
+        model_admin = CommentAdmin(Comment, admin.site)
+        request = RequestFactory().post('/admin/')
+        request.user = self.author
+
+        reply = Comment(post=self.post, author=self.author, parent=self.root, content='reply')
+        model_admin.save_model(request, reply, mock.Mock(changed_data=[]), change=False)
+        self.assertCounts(2, 1)
+
+        reply.is_active = False
+        model_admin.save_model(request, reply, mock.Mock(changed_data=['is_active']), change=True)
+        self.assertCounts(1, 0)
+
+        reply.content = 'edited'
+        model_admin.save_model(request, reply, mock.Mock(changed_data=['content']), change=True)
+        self.assertCounts(1, 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.reply()
+        self.reply(is_active=False)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=10)
+        Comment.objects.filter(pk=self.root.pk).update(replies_count=0)
+
+        # По порции на таблицу: id порции, UPDATE расходящихся, пустая следующая порция
+        with self.assertNumQueries(6):
+            self.assertEqual(CommentCounterService.reconcile(), {'fixed_posts': 1, 'fixed_comments': 1})
+        self.assertCounts(2, 1)
+        self.assertEqual(CommentCounterService.reconcile(), {'fixed_posts': 0, 'fixed_comments': 0})
+
+    def test_cached_post_lists_are_invalidated(self):
+        client = APIClient()
+        feed = f'/api/v1/posts/categories/{self.category.slug}/posts/'
+        self.assertEqual(client.get('/api/v1/posts/recent/').data[0]['comments_count'], 1)
+        self.assertEqual(client.get(feed).data['posts'][0]['comments_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CommentCounterService.comment_created(self.reply())
+        self.assertEqual(client.get('/api/v1/posts/recent/').data[0]['comments_count'], 2)
+        self.assertEqual(client.get(feed).data['posts'][0]['comments_count'], 2)
+
+
+class MyCommentsViewTests(TestCase):
+    """Queryset списка строится по полям CommentSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        post = Post.objects.create(title='Post', slug='post', content='text', author=cls.author)
+        cls.comments = [
+            Comment.objects.create(post=post, author=cls.author, content=f'comment {i}') for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_queries_do_not_grow_with_rows(self):
+        for count in (1, 5):
+            Comment.objects.exclude(pk__in=[comment.pk for comment in self.comments[:count]]).update(is_active=False)
+            with self.subTest(comments=count):
+                # COUNT(*) и страница
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/v1/comments/my-comments/')
+                self.assertEqual(len(response.data['results']), count)
+                self.assertEqual(response.data['results'][0]['author_info']['username'], 'author')
+            Comment.objects.update(is_active=True)
+
+    def test_optimization_header_only_in_debug(self):
+        self.assertNotIn('X-Queryset-Optimization', self.client.get('/api/v1/comments/my-comments/'))
+        with override_settings(DEBUG=True):
+            response = self.client.get('/api/v1/comments/my-comments/')
+        self.assertEqual(
+            response['X-Queryset-Optimization'],
+            'select_related=author; only=author,content,created_at,id,is_active,parent,replies_count,updated_at',
+        )
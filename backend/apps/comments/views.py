@@ -3,7 +3,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.http import http_date
 
 from apps.comments.serializers import CommentSerializer
 from .models import Comment
@@ -11,26 +14,34 @@ from .serializers import (
     CommentSerializer, 
     CommentCreateSerializer,
     CommentUpdateSerializer,
-    CommentDetailSerializer
+    CommentDetailSerializer,
+    CommentTreeSerializer,
 )
 
 from .permissions import IsAuthorOrReadOnly
+from .services import CommentCounterService, CommentTreeService
 from apps.frontpage.models import Post
+from apps.frontpage.services import PostVersionService
+from config.batch import batch_ids, batch_response
+from config.conditional import ConditionalListMixin, make_etag, not_modified_response
+from config.fieldsets import QuerysetOptimizationMixin, optimize_queryset, requested_fieldset, selected_field_names
+from config.pagination import KeysetCursorPagination
 
 
-class CommentListCreateView(generics.ListCreateAPIView):
+class CommentListCreateView(QuerysetOptimizationMixin, ConditionalListMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['post', 'author', 'parent']
     search_fields = ['content']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    pagination_class = KeysetCursorPagination
+    etag_fields = ('pk', 'updated_at', 'replies_count')
     
     def get_queryset(self):
         return Comment.objects.filter(is_active=True).select_related(
             'post', 
             'author', 
-            'parent'
             )
         
     def get_serializer_class(self):
@@ -38,7 +49,7 @@ class CommentListCreateView(generics.ListCreateAPIView):
             return CommentCreateSerializer
         return CommentSerializer
 
-class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CommentDetailView(QuerysetOptimizationMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Comment.objects.filter(is_active=True).select_related('post', 'author')
     serializer_class = CommentDetailSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -50,10 +61,9 @@ class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
     
     def perform_destroy(self, instance):
         """Магкое удаление - помечаем как неактивный """
-        instance.is_active = False
-        instance.save()
+        CommentCounterService.deactivate(instance)
 
-class MyCommentsView(generics.ListCreateAPIView):
+class MyCommentsView(QuerysetOptimizationMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -63,35 +73,77 @@ class MyCommentsView(generics.ListCreateAPIView):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return Comment.objects.filter(is_active=True).select_related('post', 'parent')
+        # Связи и колонки добавляет QuerysetOptimizationMixin по полям CommentSerializer
+        return Comment.objects.filter(is_active=True)
     
     
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])        
 def post_comments(request, post_id):
         """Комментарии к определенному посту """
-        post = get_object_or_404(Post, id=post_id, status='published')
-        
-        """ Только основные комментарии """
-        comments = Comment.objects.filter(
-            post=post, 
-            parent=None, 
-            is_active=True
-        ).select_related('author').prefetch_related(
-            'replies__author'
-        ).order_by('-created_at')
-        
-        serializer = CommentSerializer(comments, many=True, context = {'request': request})
-        return Response({
+        state = PostVersionService.get_state(id=post_id, status='published')
+        if state is None:
+            raise Http404
+        selected = selected_field_names(request, CommentTreeSerializer.Meta.fields)
+        depth = request.query_params.get('depth', '')
+        depth = int(depth) if depth.isdigit() else None
+        etag = make_etag(
+            state['pk'], state['updated_at'], state['comments_count'], state['last_comment_at'],
+            request.accepted_media_type, requested_fieldset(request), depth,
+        )
+        last_modified = max(value for value in (state['updated_at'], state['last_comment_at']) if value is not None)
+        not_modified = not_modified_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if not_modified is not None:
+            return not_modified
+
+        post = get_object_or_404(Post.objects.only('id', 'title', 'slug', 'comments_count'), id=post_id, status='published')
+
+        # Дерево целиком из снимка в кеше; ?depth=N - только N уровней ответов
+        tree = CommentTreeService.get_tree(post.id, lambda: CommentTreeSerializer(
+            CommentTreeService.load(post.id, limit=settings.COMMENT_TREE_MAX_NODES), many=True
+        ).data)
+        comments = CommentTreeService.select(tree, selected, depth)
+
+        response = Response({
             'post': {
                 'id': post.id,
                 'title': post.title,
                 'slug': post.slug,
                 },
-                'comments': serializer.data,
-                'comments_count': post.comments.filter(is_active=True).count()
+                'comments': comments,
+                'comments_count': post.comments_count
                 
             })
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def comments_batch(request):
+    """
+    Деревья комментариев постов по ?post_ids=1,2,3: {id поста: дерево} и missing.
+    Деревья берутся из кеша одним get_many, промахи строятся одним запросом.
+    """
+    post_ids = batch_ids(request, 'post_ids')
+    counts = dict(
+        Post.objects.filter(pk__in=post_ids, status='published').values_list('pk', 'comments_count')
+    )
+    trees = CommentTreeService.get_trees(counts, lambda missing_ids: {
+        post_id: CommentTreeSerializer(roots, many=True).data
+        for post_id, roots in CommentTreeService.load_many(missing_ids, limit=settings.COMMENT_TREE_MAX_NODES).items()
+    })
+
+    names = selected_field_names(request, CommentTreeSerializer.Meta.fields)
+    depth = request.query_params.get('depth', '')
+    found = {
+        post_id: {
+            'comments': CommentTreeService.select(tree, names, int(depth) if depth.isdigit() else None),
+            'comments_count': counts[post_id],
+        }
+        for post_id, tree in trees.items()
+    }
+    return batch_response(post_ids, found)
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])        
@@ -103,10 +155,11 @@ def comment_replies(request, comment_id):
             parent=parent_comment, 
             is_active=True
         ).select_related('author').order_by('-created_at')
+        replies = optimize_queryset(replies, CommentSerializer, request)
         
         serializer = CommentSerializer(replies, many=True, context = {'request': request})
         return Response({
             'parent_comment': CommentSerializer(parent_comment, context = {'request': request}).data,
             'replies': serializer.data,
-            'replies_count': replies.count()
+            'replies_count': parent_comment.replies_count
         })
@@ -9,11 +9,12 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'published_posts_count')
 
     def posts_count(self, obj):
-        return obj.posts.count()
+        return obj.published_posts_count
     posts_count.short_description = 'Счетчик постов'
+    posts_count.admin_order_field = 'published_posts_count'
 
 
 @admin.register(Post)
@@ -25,7 +26,7 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('status', 'category', 'created_at', 'updated_at')
     search_fields = ('title', 'content', 'author__username')
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ('created_at', 'updated_at', 'views_count')
+    readonly_fields = ('created_at', 'updated_at', 'views_count', 'comments_count')
     raw_id_fields = ('author',)
     
     fieldsets = (
@@ -36,7 +37,7 @@ class PostAdmin(admin.ModelAdmin):
             'fields': ('category', 'author', 'status')
         }),
         ('Statistics', {
-            'fields': ('views_count', 'created_at', 'updated_at'),
+            'fields': ('views_count', 'comments_count', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
@@ -0,0 +1,22 @@
+from django.contrib.postgres.search import SearchQuery
+from rest_framework import filters
+
+from .models import Post
+
+
+def build_search_query(text):
+    """Запрос в синтаксисе веб-поиска: фразы в кавычках, OR, исключение через минус"""
+    return SearchQuery(text, config=Post.SEARCH_CONFIG, search_type='websearch')
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Поиск по полю search_vector (GIN-индекс) вместо ILIKE по title/content.
+    Параметр запроса тот же - ?search=.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not text:
+            return queryset
+        return queryset.filter(search_vector=build_search_query(text))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from apps.frontpage.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполнить анонсы постов (excerpt) порциями по диапазонам id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер диапазона id')
+        parser.add_argument('--all', action='store_true', help='Пересчитать и уже заполненные анонсы')
+
+    def handle(self, *args, **options):
+        bounds = Post.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write('Постов нет')
+            return
+
+        chunk_size = options['chunk_size']
+        updated = 0
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            queryset = Post.objects.filter(id__range=(start, start + chunk_size - 1))
+            if not options['all']:
+                queryset = queryset.filter(excerpt='').exclude(content='')
+            updated += queryset.update(excerpt=Post.excerpt_expression())
+
+        self.stdout.write(self.style.SUCCESS(f'Анонсы обновлены: {updated} постов'))
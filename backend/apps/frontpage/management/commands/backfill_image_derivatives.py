@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.frontpage.models import Post
+from config.cache import invalidate_cache_tags
+from config.images import build_derivatives, store_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Сгенерировать производные изображений постов и аватаров в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Количество процессов')
+        parser.add_argument('--all', action='store_true', help='Пересобрать и уже готовые производные')
+
+    def handle(self, *args, **options):
+        sources = [
+            (Post, 'image', settings.POST_IMAGE_WIDTHS),
+            (get_user_model(), 'avatar', settings.AVATAR_WIDTHS),
+        ]
+        jobs = []
+        for model, field_name, widths in sources:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list('pk', field_name, f'{field_name}_variants').iterator()
+            for pk, name, previous in rows:
+                if options['all'] or (previous or {}).get('source') != name:
+                    jobs.append((model, pk, field_name, name, widths, previous or {}))
+
+        if not jobs:
+            self.stdout.write('Нет изображений без производных')
+            return
+
+        # Обработка изображений - в дочерних процессах без БД, запись - здесь
+        connections.close_all()
+        stored = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(build_derivatives, name, widths): (model, pk, field_name, previous)
+                for model, pk, field_name, name, widths, previous in jobs
+            }
+            for future in as_completed(futures):
+                model, pk, field_name, previous = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{model._meta.label} {pk}: {e}')
+                    continue
+                stored += store_derivatives(model, pk, field_name, variants, previous)
+
+        invalidate_cache_tags('posts')
+        self.stdout.write(
+            self.style.SUCCESS(f'Производные сохранены: {stored} из {len(jobs)} изображений, ошибок: {failed}')
+        )
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from apps.frontpage.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполнить поисковые векторы постов параллельными порциями по диапазонам id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер диапазона id')
+        parser.add_argument('--workers', type=int, default=4, help='Количество параллельных потоков')
+        parser.add_argument('--all', action='store_true', help='Пересчитать и уже заполненные векторы')
+
+    def handle(self, *args, **options):
+        bounds = Post.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write('Постов нет')
+            return
+
+        chunk_size = options['chunk_size']
+        ranges = [
+            (start, start + chunk_size - 1)
+            for start in range(bounds['low'], bounds['high'] + 1, chunk_size)
+        ]
+        only_empty = not options['all']
+
+        def fill(id_range):
+            # Каждый поток работает в своем соединении с БД
+            try:
+                queryset = Post.objects.filter(id__range=id_range)
+                if only_empty:
+                    queryset = queryset.filter(search_vector__isnull=True)
+                return queryset.update(search_vector=Post.search_vector_expression())
+            finally:
+                connections.close_all()
+
+        updated = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for count in executor.map(fill, ranges):
+                updated += count
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Поисковые векторы обновлены: {updated} постов ({len(ranges)} порций)')
+        )
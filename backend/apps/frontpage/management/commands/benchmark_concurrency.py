@@ -0,0 +1,65 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Пропускная способность запущенного сервера при большом числе открытых соединений. '
+        'Запускается дважды: против gunicorn с sync-воркерами (config.wsgi) и с uvicorn-воркерами (config.asgi)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Адрес, например http://127.0.0.1:8000/api/v1/posts/recent/')
+        parser.add_argument('--connections', type=int, default=1000, help='Одновременно открытых соединений')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность замера, с')
+        parser.add_argument('--timeout', type=float, default=60, help='Таймаут одного запроса, с')
+        parser.add_argument('--header', action='append', default=[], help='Заголовок "Имя: значение" (можно несколько)')
+
+    def handle(self, *args, **options):
+        headers = dict(header.split(':', 1) for header in options['header'])
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+        latencies, errors, elapsed = asyncio.run(self.run(options, headers))
+
+        total = len(latencies) + sum(errors.values())
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{options['url']}: {options['connections']} соединений, {elapsed:.1f} с"
+        ))
+        self.stdout.write(f'  запросов: {total}, успешных: {len(latencies)}, {len(latencies) / elapsed:,.0f} запр./с')
+        if latencies:
+            latencies.sort()
+            self.stdout.write(
+                f'  задержка, мс: p50 {statistics.median(latencies) * 1000:.0f}, '
+                f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}, '
+                f'макс. {latencies[-1] * 1000:.0f}'
+            )
+        for error, count in sorted(errors.items()):
+            self.stdout.write(self.style.WARNING(f'  {error}: {count}'))
+
+    async def run(self, options, headers):
+        limits = httpx.Limits(max_connections=options['connections'], max_keepalive_connections=options['connections'])
+        latencies, errors = [], {}
+        started = time.perf_counter()
+        deadline = started + options['duration']
+
+        async def client_loop(client):
+            # Каждое соединение держится открытым (keep-alive) и отправляет запросы подряд
+            while time.perf_counter() < deadline:
+                request_started = time.perf_counter()
+                try:
+                    response = await client.get(options['url'], headers=headers)
+                    await response.aread()
+                except httpx.HTTPError as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    continue
+                if response.status_code >= 400:
+                    errors[f'HTTP {response.status_code}'] = errors.get(f'HTTP {response.status_code}', 0) + 1
+                else:
+                    latencies.append(time.perf_counter() - request_started)
+
+        async with httpx.AsyncClient(limits=limits, timeout=options['timeout']) as client:
+            await asyncio.gather(*(client_loop(client) for _ in range(options['connections'])))
+        return latencies, errors, time.perf_counter() - started
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.frontpage.models import Post
+from apps.frontpage.serializers import PostListRowSerializer, PostListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнить скорость PostListSerializer и быстрого пути по строкам (строк в секунду)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Количество постов в списке')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество повторов (берется лучший)')
+        parser.add_argument('--query', default='', help='Параметры запроса, например fields=id,title')
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get(f"/api/v1/posts/?{options['query']}"))
+        queryset = Post.objects.with_subscription_info().defer('content').filter(
+            status='published'
+        ).order_by('-created_at')
+        limit = options['rows']
+
+        def models_path():
+            posts = queryset[:limit]
+            return JSONRenderer().render(
+                PostListSerializer(posts, many=True, context={'request': request}).data
+            )
+
+        def rows_path():
+            rows = PostListRowSerializer.rows(queryset, request)[:limit]
+            return JSONRenderer().render(
+                PostListRowSerializer(rows, many=True, context={'request': request}).data
+            )
+
+        results = {}
+        for label, run in (('PostListSerializer', models_path), ('PostListRowSerializer', rows_path)):
+            best, content = None, None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                content = run()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = (best, content)
+
+        count = len(queryset[:limit])
+        if not count:
+            self.stdout.write('Нет опубликованных постов')
+            return
+
+        for label, (best, _) in results.items():
+            self.stdout.write(f'{label}: {count / best:,.0f} строк/с ({best * 1000:.1f} мс на {count} строк)')
+
+        slow, fast = results['PostListSerializer'], results['PostListRowSerializer']
+        self.stdout.write(f'Ускорение: x{slow[0] / fast[0]:.1f}')
+        if slow[1] == fast[1]:
+            self.stdout.write(self.style.SUCCESS('Ответы совпадают байт в байт'))
+        else:
+            self.stdout.write(self.style.ERROR('Ответы различаются'))
@@ -0,0 +1,92 @@
+import gzip
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.comments.models import Comment
+from apps.comments.serializers import CommentSerializer
+from apps.frontpage.models import Post
+from apps.frontpage.serializers import PostListSerializer
+from config.renderers import MessagePackRenderer, ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Сравнить время рендеринга и размер ответа JSONRenderer, orjson и MessagePack на страницах ленты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10, help='Количество страниц ленты')
+        parser.add_argument('--page-size', type=int, default=20, help='Постов на странице')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов рендеринга (берется лучший)')
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/v1/posts/'))
+        context = {'request': request}
+        page_size = options['page_size']
+
+        posts = list(
+            Post.objects.with_subscription_info().defer('content').filter(status='published')
+            .order_by('-created_at')[:options['pages'] * page_size]
+        )
+        if not posts:
+            self.stdout.write('Нет опубликованных постов')
+            return
+
+        # Страницы в том виде, в каком их отдает лента (с курсорами)
+        payloads = {
+            'лента': [
+                {
+                    'next': f'http://testserver/api/v1/posts/?cursor=page{index + 1}',
+                    'previous': None,
+                    'results': PostListSerializer(posts[start:start + page_size], many=True, context=context).data,
+                    'pinned_posts_count': 0,
+                }
+                for index, start in enumerate(range(0, len(posts), page_size))
+            ],
+        }
+        comments = list(
+            Comment.objects.filter(is_active=True).select_related('author', 'parent')
+            .order_by('-created_at')[:options['pages'] * page_size]
+        )
+        if comments:
+            payloads['комментарии'] = [{
+                'next': None, 'previous': None,
+                'results': CommentSerializer(comments, many=True, context=context).data,
+            }]
+
+        renderers = (
+            ('JSONRenderer', JSONRenderer()),
+            ('ORJSONRenderer', ORJSONRenderer()),
+            ('MessagePackRenderer', MessagePackRenderer()),
+        )
+        for name, pages in payloads.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {len(pages)} стр.'))
+            rendered = {}
+            for label, renderer in renderers:
+                best = None
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    contents = [renderer.render(page, renderer.media_type) for page in pages]
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                rendered[label] = contents
+                size = sum(len(content) for content in contents)
+                gzipped = sum(len(gzip.compress(content)) for content in contents)
+                self.stdout.write(
+                    f'  {label}: {best / len(pages) * 1000:.2f} мс/стр., '
+                    f'{size / len(pages) / 1024:.1f} КиБ/стр. (gzip {gzipped / len(pages) / 1024:.1f} КиБ)'
+                )
+
+            same_json = rendered['JSONRenderer'] == rendered['ORJSONRenderer']
+            same_data = all(
+                json.loads(content) == msgpack.unpackb(packed, raw=False)
+                for content, packed in zip(rendered['JSONRenderer'], rendered['MessagePackRenderer'])
+            )
+            self.stdout.write(
+                f'  orjson совпадает с JSONRenderer байт в байт: {"да" if same_json else "нет"}; '
+                f'MessagePack содержит те же данные: {"да" if same_data else "нет"}'
+            )
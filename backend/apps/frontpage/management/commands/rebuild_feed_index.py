@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from apps.frontpage.services import FeedService
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать индекс ленты постов в Redis'
+
+    def handle(self, *args, **options):
+        result = FeedService.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Индекс ленты пересобран: {result['published_posts']} постов, "
+                f"{result['pinned_posts']} закрепленных"
+            )
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from apps.comments.services import CommentCounterService
+from apps.frontpage.services import CategoryService, PinStateService
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать денормализованные счетчики и закрепления постов'
+
+    def handle(self, *args, **options):
+        categories = CategoryService.reconcile()
+        comments = CommentCounterService.reconcile()
+        pins = PinStateService.sweep()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Счетчики пересчитаны: категорий {categories['fixed_categories']}, "
+                f"постов {comments['fixed_posts']}, комментариев {comments['fixed_comments']}, "
+                f"закреплений {pins['updated_posts']}"
+            )
+        )
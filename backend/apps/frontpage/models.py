@@ -1,5 +1,11 @@
+import re
+
 from django.db import models
+from django.db.models.functions import Concat, Left, Length, Upper
+from django.db.models.lookups import GreaterThan
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.utils.text import slugify
 from django.urls import reverse
 
@@ -8,6 +14,7 @@ class Category(models.Model):
     name = models.CharField(max_length=255, verbose_name='Название категории')
     slug = models.SlugField(max_length=255, unique=True, blank=True, verbose_name='URL')
     description = models.TextField(blank=True, verbose_name='Описание')
+    published_posts_count = models.PositiveIntegerField(default=0, verbose_name='Опубликованных постов')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
 
     class Meta:
@@ -15,6 +22,10 @@ class Category(models.Model):
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
         ordering = ['name']
+        indexes = [
+            # gin_trgm_ops требует pg_trgm: миграция с этим индексом начинается с TrigramExtension()
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='categories_name_trgm'),
+        ]
 
     def __str__(self):
         return self.name
@@ -25,33 +36,39 @@ class Category(models.Model):
         super().save(*args, **kwargs)
         
 class PostManager(models.Manager):
+    def get_queryset(self):
+        # Поисковый вектор нужен только в WHERE, в объекты его не загружаем
+        return super().get_queryset().defer('search_vector')
+
     def published(self):
         return self.filter(status='published')
     
     def pinned_posts(self):
         """ Закрепленные посты. """
         return self.filter(
-            pin_info__isnull=False,
-            pin_info__user__subscription__status='active',
-            pin_info__user__subscription__end_date__gt=models.functions.Now(),
-            status='published'
-        ).select_related(
-            'pin_info',
-            'pin_info__user',
-            'pin_info__user__subscription',
-        ).order_by('-pin_info__pinned_at')
+            status='published',
+            is_effectively_pinned=True,
+        ).select_related('author', 'category').order_by('-pinned_at')
     
     def regular_posts(self):
         """ Обычные (незакрепленные) посты. """
-        return self.filter(pin_info__isnull=True, status='published')
+        return self.filter(is_effectively_pinned=False, status='published')
         
+    def feed_queryset(self):
+        """ Лента с закрепленными постами первыми (сортировка в БД). """
+        return self.order_by(
+            '-is_effectively_pinned',
+            models.F('pinned_at').desc(nulls_last=True),
+            '-created_at',
+        )
+
     def with_subscription_info(self):
         """ Информация о подписке автора. """
         return self.select_related(
             'author',
             'author__subscription',
             'category'
-        ).prefetch_related('pin_info')
+        )
         
 class Post(models.Model):
     """ Модель поста блога с поддержкой закрепления. """
@@ -63,15 +80,36 @@ class Post(models.Model):
     title = models.CharField(max_length=255, verbose_name='Название поста')
     slug = models.SlugField(max_length=255, unique=True, blank=True, verbose_name='URL')
     content = models.TextField(verbose_name='Контент')   
+    excerpt = models.TextField(blank=True, editable=False, verbose_name='Анонс')
     image = models.ImageField(upload_to='posts/', blank=True, null=True, verbose_name='Изображение')
+    # Производные изображения (размеры, форматы, blurhash), см. config.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Производные изображения')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, related_name='posts', verbose_name='Категория')
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts', verbose_name='Автор')
     status = models.CharField(max_length=10, choices=STATUS, default='published', verbose_name='Статус')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     views_count = models.PositiveIntegerField(default=0, verbose_name='Количество просмотров')
+    comments_count = models.PositiveIntegerField(default=0, verbose_name='Количество комментариев')
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name='Поисковый вектор')
+    # Действующее закрепление (закрепил пользователь с активной подпиской),
+    # поддерживается PinStateService
+    is_effectively_pinned = models.BooleanField(default=False, editable=False, verbose_name='Закреплен')
+    pinned_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Дата закрепления')
+    pin_expires_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Закреплен до')
     
     objects = PostManager()
+
+    SEARCH_CONFIG = 'russian'
+    EXCERPT_LENGTH = 200
+    # Хвост обрезки: последние пробелы и недописанное слово (синтаксис общий для re и PostgreSQL)
+    EXCERPT_TAIL = r'\s+\S*\Z'
+    # Поля, которые меняются только отдельными UPDATE (счетчики, закрепление);
+    # полное сохранение поста их не перезаписывает
+    MANAGED_FIELDS = (
+        'views_count', 'comments_count', 'search_vector', 'image_variants',
+        'is_effectively_pinned', 'pinned_at', 'pin_expires_at',
+    )
     
     class Meta:
         db_table = 'posts'
@@ -84,6 +122,20 @@ class Post(models.Model):
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['category', '-created_at']),
             models.Index(fields=['author', '-created_at']),
+            models.Index(fields=['status', '-views_count']),
+            GinIndex(fields=['search_vector'], name='posts_search_vector_gin'),
+            # Как и categories_name_trgm, создается после TrigramExtension() в миграции
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='posts_title_trgm'),
+            models.Index(
+                fields=['-pinned_at'],
+                condition=models.Q(is_effectively_pinned=True),
+                name='posts_effective_pins',
+            ),
+            models.Index(
+                fields=['pin_expires_at'],
+                condition=models.Q(is_effectively_pinned=True),
+                name='posts_pin_expiry',
+            ),
         ]
 
     def __str__(self):
@@ -92,18 +144,75 @@ class Post(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+
+        update_fields = kwargs.get('update_fields')
+        deferred = self.get_deferred_fields()
+        if 'content' not in deferred:
+            self.excerpt = self.make_excerpt(self.content)
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in self.MANAGED_FIELDS
+                and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
+
+        if update_fields is None or {'title', 'content'} & set(update_fields):
+            Post.objects.filter(pk=self.pk).update(search_vector=Post.search_vector_expression())
+
+    @classmethod
+    def make_excerpt(cls, content):
+        """
+        Анонс для списков: до EXCERPT_LENGTH символов контента по границе
+        слова (слово без пробелов длиннее анонса обрезается как есть).
+        """
+        if len(content) > cls.EXCERPT_LENGTH:
+            cut = re.sub(cls.EXCERPT_TAIL, '', content[:cls.EXCERPT_LENGTH + 1])
+            return cut[:cls.EXCERPT_LENGTH] + '...'
+        return content
+
+    @classmethod
+    def excerpt_expression(cls):
+        """ То же, что make_excerpt, но на стороне БД (для массового заполнения). """
+        cut = models.Func(
+            Left('content', cls.EXCERPT_LENGTH + 1), models.Value(cls.EXCERPT_TAIL), models.Value(''),
+            function='REGEXP_REPLACE', output_field=models.TextField(),
+        )
+        return models.Case(
+            models.When(
+                GreaterThan(Length('content'), cls.EXCERPT_LENGTH),
+                then=Concat(Left(cut, cls.EXCERPT_LENGTH), models.Value('...')),
+            ),
+            default='content',
+            output_field=models.TextField(),
+        )
+
+    @classmethod
+    def search_vector_expression(cls):
+        """ Вектор полнотекстового поиска: заголовок весит больше контента. """
+        return (
+            SearchVector('title', weight='A', config=cls.SEARCH_CONFIG)
+            + SearchVector('content', weight='B', config=cls.SEARCH_CONFIG)
+        )
     
+    @classmethod
+    def get_posts_for_feed(cls):
+        """ Лента: предвычисленный индекс, если он собран, иначе сортировка в БД. """
+        from .services import FeedIndex, FeedService
+
+        if FeedService.is_ready():
+            return FeedIndex()
+        return cls.objects.feed_queryset().filter(status='published').select_related('author', 'category').defer('content')
+
     def get_absolute_url(self):
         return reverse('post-detail', args=[self.slug])    
     
-    @property
-    def comments_count(self):
-        return self.comments.filter(is_active=True).count()
-    
     @property
     def is_pinned(self):
-        return hasattr(self, 'pin_info') and self.pin_info is not None
+        return self.is_effectively_pinned
     
     @property
     def can_be_pinned_by_user(self):
@@ -113,13 +222,18 @@ class Post(models.Model):
     
     # @property
     def can_be_pinned_by(self, user):
+        return Post.pinnable_by(self.author_id, self.status, user)
+
+    @staticmethod
+    def pinnable_by(author_id, status, user):
+        """ Может ли пользователь закрепить пост с таким автором и статусом (годится и для поста из кеша) """
         if not user or not user.is_authenticated:
             return False
         
-        if self.author != user:
+        if author_id != user.pk:
             return False
         
-        if self.status != 'published':
+        if status != 'published':
             return False
         
         if not hasattr(user, 'subscription') or not user.subscription.is_active:
@@ -128,19 +242,46 @@ class Post(models.Model):
         return True
     
     def increment_views(self):
-        self.views_count += 1
-        self.save(update_fields=['views_count'])
+        """ Просмотр копится в буфере Redis и переносится в БД периодической задачей """
+        from .services import ViewCounterService
+
+        ViewCounterService.record_view(self.pk)
+
+    @property
+    def current_views_count(self):
+        """ Просмотры с учетом еще не перенесенных в БД """
+        if not hasattr(self, '_pending_views'):
+            from .services import ViewCounterService
+
+            self._pending_views = ViewCounterService.pending_for([self.pk]).get(self.pk, 0)
+        return self.views_count + self._pending_views
     
     def get_pinned_info(self):
-        if not self.is_pinned:
-            return {
-                'is_pinned': True,
-                'pinned_at': self.pin_info.pinned_at,
-                'pinned_by': {
-                    'id': self.pin_info.user.id,
-                    'username': self.pin_info.user.username,
-                    'has_active_subscription': self.pin_info.user.subscription.is_active,
-                }
-            }
-        
-        return {'is_pinned': False}
+        if not self.is_effectively_pinned:
+            return {'is_pinned': False}
+
+        pin = next(iter(self.pin_info.all()), None)
+        return {
+            'is_pinned': True,
+            'pinned_at': self.pinned_at,
+            'pinned_by': {
+                'id': pin.user.id,
+                'username': pin.user.username,
+                'has_active_subscription': True,
+            } if pin else None,
+        }
+
+
+class AppliedViewBatch(models.Model):
+    """
+    Пакет просмотров из Redis, уже перенесенный в posts.views_count.
+    Записывается в одной транзакции с UPDATE, поэтому повторно доставленный
+    пакет (сбой до удаления из Redis) не применяется дважды.
+    """
+    key = models.CharField(max_length=64, unique=True, verbose_name='Ключ пакета')
+    applied_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата применения')
+
+    class Meta:
+        db_table = 'applied_view_batches'
+        verbose_name = 'Примененный пакет просмотров'
+        verbose_name_plural = 'Примененные пакеты просмотров'
@@ -1,71 +1,262 @@
 from rest_framework import serializers
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models
+from django.utils.functional import cached_property
 from django.utils.text import slugify
+from apps.subscribe.models import PinnedPost
+from config.fieldsets import SparseFieldsetMixin, ordering_columns, selected_field_names
+from config.images import ImageVariantsField, variants_representation
+from config.loaders import BatchListSerializer, BatchLoadedField, FunctionLoader
+from config.rows import as_rows
 from .models import Category, Post
+from .services import ViewCounterService
 
 
 class CategorySerializer(serializers.ModelSerializer):
     """Сериализатор для категорий"""
-    posts_count = serializers.SerializerMethodField()
+    posts_count = serializers.IntegerField(source='published_posts_count', read_only=True)
 
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'posts_count', 'created_at']
         read_only_fields = ['slug', 'created_at']
 
-    def get_posts_count(self, obj):
-        return obj.posts.filter(status='published').count()
-    
     def create(self, validated_data):
         validated_data['slug'] = slugify(validated_data['name'])
         return super().create(validated_data)
     
 
-class PostListSerializer(serializers.ModelSerializer):
+def first_pinned_by(post_ids):
+    """Первый закрепивший каждого поста (как Post.get_pinned_info с pin_info.all())"""
+    result = {}
+    pins = PinnedPost.objects.filter(post_id__in=post_ids).order_by('pinned_at').values_list(
+        'post_id', 'user_id', 'user__username'
+    )
+    for post_id, user_id, username in pins:
+        result.setdefault(post_id, {
+            'id': user_id,
+            'username': username,
+            'has_active_subscription': True,
+        })
+    return result
+
+
+# Закрепивший по id поста, одним запросом на страницу
+PINNED_BY = FunctionLoader(first_pinned_by)
+
+
+def pinned_post_id(post):
+    return post.pk if post.is_effectively_pinned else None
+
+
+def pinned_representation(post, pinned_by):
+    if not post.is_effectively_pinned:
+        return {'is_pinned': False}
+    return {'is_pinned': True, 'pinned_at': post.pinned_at, 'pinned_by': pinned_by}
+
+
+class PendingViewsListSerializer(BatchListSerializer):
+    """Подмешивает непереданные в БД просмотры одним запросом к Redis на страницу"""
+
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'views_count' not in self.child.fields:
+            return super().to_representation(posts)
+        pending = ViewCounterService.pending_for(post.pk for post in posts)
+        for post in posts:
+            post._pending_views = pending.get(post.pk, 0)
+        return super().to_representation(posts)
+
+
+class PostListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Сериализатор для списка постов"""
     author = serializers.StringRelatedField()
+    # Для списка отдаем сохраненный анонс вместо полного контента
+    content = serializers.CharField(source='excerpt', read_only=True)
     category = serializers.StringRelatedField()
+    image_variants = ImageVariantsField('image')
+    views_count = serializers.IntegerField(source='current_views_count', read_only=True)
     comments_count = serializers.ReadOnlyField()
     is_pinned = serializers.ReadOnlyField()
-    pinned_info = serializers.SerializerMethodField()
+    pinned_info = BatchLoadedField(PINNED_BY, key=pinned_post_id)
 
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'content', 'image', 'category',
+            'id', 'title', 'slug', 'content', 'image', 'image_variants', 'category',
             'author', 'status', 'created_at', 'updated_at',
             'views_count', 'comments_count', 'is_pinned', 'pinned_info'
         ]
         read_only_fields = ['slug', 'author', 'views_count']
+        list_serializer_class = PendingViewsListSerializer
+        field_dependencies = {
+            'image_variants': {'only': ['image', 'image_variants']},
+            'views_count': {'only': ['views_count']},
+            'is_pinned': {'only': ['is_effectively_pinned']},
+            'pinned_info': {'only': ['is_effectively_pinned', 'pinned_at']},
+        }
 
-    def get_pinned_info(self, obj):
+    def get_pinned_info(self, obj, pinned_by):
         """Возвращает информацию о закреплении"""
-        return obj.get_pinned_info()
-
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        # Обрезаем контент для списка
-        if len(data['content']) > 200:
-            data['content'] = data['content'][:200] + '...'
-        return data
+        return pinned_representation(obj, pinned_by)
+
     
-class PostDetailSerializer(serializers.ModelSerializer):
+class PostListRowListSerializer(serializers.ListSerializer):
+    """Данные на страницу (отложенные просмотры, закрепившие) - одним запросом каждое"""
+
+    def to_representation(self, data):
+        rows = list(data)
+        names = self.child.field_names
+        self.child.pending = (
+            ViewCounterService.pending_for(row['id'] for row in rows)
+            if 'views_count' in names else {}
+        )
+        self.child.pinned_by = (
+            PINNED_BY.load_many(self.context, [row['id'] for row in rows if row['is_effectively_pinned']])
+            if 'pinned_info' in names else {}
+        )
+        return [self.child.to_representation(row) for row in rows]
+
+
+class PostListRowSerializer(serializers.BaseSerializer):
+    """
+    Быстрый путь PostListSerializer для списков только для чтения.
+
+    Работает со строками .values() (колонки автора и категории берутся
+    JOIN-ом) вместо объектов модели и собирает словари заранее
+    подготовленными функциями полей. Результат совпадает с
+    PostListSerializer байт в байт (см. tests.py), включая ?fields=/?omit=.
+    """
+    datetime_field = serializers.DateTimeField()
+
+    # Поле ответа -> (колонки .values(), функция (сериализатор, строка) -> значение)
+    FIELDS = {
+        'id': (('id',), lambda self, row: row['id']),
+        'title': (('title',), lambda self, row: row['title']),
+        'slug': (('slug',), lambda self, row: row['slug']),
+        'content': (('excerpt',), lambda self, row: row['excerpt']),
+        'image': (('image',), lambda self, row: self.image_url(row['image'])),
+        'image_variants': (
+            ('image', 'image_variants'),
+            lambda self, row: variants_representation(row['image'], row['image_variants'], self.request),
+        ),
+        'category': (('category__name',), lambda self, row: row['category__name']),
+        # str(User) - email
+        'author': (('author__email',), lambda self, row: row['author__email']),
+        'status': (('status',), lambda self, row: row['status']),
+        'created_at': (('created_at',), lambda self, row: self.datetime_field.to_representation(row['created_at'])),
+        'updated_at': (('updated_at',), lambda self, row: self.datetime_field.to_representation(row['updated_at'])),
+        'views_count': (('views_count',), lambda self, row: row['views_count'] + self.pending.get(row['id'], 0)),
+        'comments_count': (('comments_count',), lambda self, row: row['comments_count']),
+        'is_pinned': (('is_effectively_pinned',), lambda self, row: row['is_effectively_pinned']),
+        'pinned_info': (('is_effectively_pinned', 'pinned_at'), lambda self, row: self.pinned_info(row)),
+    }
+
+    class Meta:
+        list_serializer_class = PostListRowListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = {}
+        self.pinned_by = {}
+
+    @staticmethod
+    def enabled():
+        return settings.FAST_LIST_SERIALIZATION
+
+    @classmethod
+    def selected_fields(cls, request):
+        selected = selected_field_names(request, PostListSerializer.Meta.fields)
+        return [
+            name for name in PostListSerializer.Meta.fields
+            if selected is None or name in selected
+        ]
+
+    @classmethod
+    def rows(cls, queryset, request, keep=()):
+        """Строки для выбранных полей; keep - колонки, нужные представлению (ETag, сортировка)"""
+        columns = {'id', 'is_effectively_pinned'}
+        for name in cls.selected_fields(request):
+            columns.update(cls.FIELDS[name][0])
+        for name in {*keep, *ordering_columns(queryset)}:
+            name = 'id' if name == 'pk' else name
+            if name in {field.attname for field in Post._meta.concrete_fields}:
+                columns.add(name)
+        return as_rows(queryset, *sorted(columns))
+
+    @property
+    def request(self):
+        return self.context.get('request')
+
+    @cached_property
+    def accessors(self):
+        return [(name, self.FIELDS[name][1]) for name in self.selected_fields(self.request)]
+
+    @property
+    def field_names(self):
+        return [name for name, _ in self.accessors]
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def pinned_info(self, row):
+        if not row['is_effectively_pinned']:
+            return {'is_pinned': False}
+        return {
+            'is_pinned': True,
+            'pinned_at': row['pinned_at'],
+            'pinned_by': self.pinned_by.get(row['id']),
+        }
+
+    def to_representation(self, row):
+        return {name: accessor(self, row) for name, accessor in self.accessors}
+
+
+class PostSearchSerializer(PostListSerializer):
+    """Результат полнотекстового поиска с релевантностью и подсветкой"""
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ['rank', 'headline']
+        # Аннотации поискового запроса
+        field_dependencies = {**PostListSerializer.Meta.field_dependencies, 'rank': {}, 'headline': {}}
+
+
+class PostDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Сериализатор для детального просмотра поста"""
     author_info = serializers.SerializerMethodField()
     category_info = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField('image')
+    views_count = serializers.IntegerField(source='current_views_count', read_only=True)
     comments_count = serializers.ReadOnlyField()
     is_pinned = serializers.ReadOnlyField()
-    pinned_info = serializers.SerializerMethodField()
+    pinned_info = BatchLoadedField(PINNED_BY, key=pinned_post_id)
     can_pin = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'content', 'image', 'category',
+            'id', 'title', 'slug', 'content', 'image', 'image_variants', 'category',
             'category_info', 'author', 'author_info', 'status',
             'created_at', 'updated_at', 'views_count', 'comments_count',
             'is_pinned', 'pinned_info', 'can_pin'
         ]
         read_only_fields = ['slug', 'author', 'views_count']
+        list_serializer_class = BatchListSerializer
+        field_dependencies = {
+            'image_variants': {'only': ['image', 'image_variants']},
+            'author_info': {'select_related': ['author']},
+            'category_info': {'select_related': ['category']},
+            'views_count': {'only': ['views_count']},
+            'is_pinned': {'only': ['is_effectively_pinned']},
+            'pinned_info': {'only': ['is_effectively_pinned', 'pinned_at']},
+            'can_pin': {'only': ['author', 'status']},
+        }
 
     def get_author_info(self, obj):
         author = obj.author
@@ -73,7 +264,8 @@ class PostDetailSerializer(serializers.ModelSerializer):
             'id': author.id,
             'username': author.username,
             'full_name': author.full_name,
-            'avatar': author.avatar.url if author.avatar else None
+            'avatar': author.avatar.url if author.avatar else None,
+            'avatar_variants': variants_representation(author.avatar, author.avatar_variants),
         }
     
     def get_category_info(self, obj):
@@ -85,8 +277,8 @@ class PostDetailSerializer(serializers.ModelSerializer):
             }
         return None
     
-    def get_pinned_info(self, obj):
-        return obj.get_pinned_info()
+    def get_pinned_info(self, obj, pinned_by):
+        return pinned_representation(obj, pinned_by)
     
     def get_can_pin(self, obj):
         """Проверяет, может ли текущий пользователь закрпить пост"""
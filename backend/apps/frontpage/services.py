@@ -0,0 +1,999 @@
+import hashlib
+import json
+import logging
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection, connections, router, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, Greatest, Now, RowNumber, Upper
+from django.utils import timezone
+
+from apps.comments.models import Comment
+from apps.subscribe.models import PinnedPost, Subscription
+from config.cache import ObjectCache, invalidate_cache_tags
+from config.redis_client import get_redis
+from .models import AppliedViewBatch, Category, Post
+
+logger = logging.getLogger(__name__)
+
+
+class FeedIndex:
+    """
+    Ленивая последовательность постов ленты поверх индекса в Redis.
+    Поддерживает count() и срезы, поэтому подходит для стандартных пагинаторов.
+    Посты загружаются из queryset (можно подменить, например, на строки .values()).
+    """
+
+    def __init__(self, queryset=None):
+        if queryset is None:
+            queryset = Post.objects.select_related('author', 'category').defer('content')
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = FeedService.count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start = item.start or 0
+            stop = item.stop if item.stop is not None else self.count()
+            ids = FeedService.get_ids(start, stop)
+            return self._fetch(ids)
+        return self[item:item + 1][0]
+
+    def keyset_page(self, position: Optional[Dict], limit: int) -> Tuple[List[Post], Optional[Dict]]:
+        """Страница для курсорной пагинации: (посты, позиция следующей страницы)"""
+        ids, next_position = FeedService.get_page(position, limit)
+        return self._fetch(ids), next_position
+
+    def _fetch(self, ids: List[int]) -> List[Post]:
+        """Один запрос id__in с сохранением порядка индекса"""
+        if not ids:
+            return []
+        posts = {post.pk: post for post in self.queryset.filter(pk__in=ids)}
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+class FeedService:
+    """
+    Предвычисленный индекс ленты.
+
+    feed:published - sorted set опубликованных постов (score = created_at)
+    feed:pinned - sorted set действующих закреплений (score = pinned_at)
+    feed:pinned:expires - окончание подписки закрепившего (unix time)
+    """
+
+    PUBLISHED_KEY = 'feed:published'
+    PINNED_KEY = 'feed:pinned'
+    PINNED_EXPIRES_KEY = 'feed:pinned:expires'
+    READY_KEY = 'feed:ready'
+    REBUILD_CHUNK_SIZE = 5000
+
+    @staticmethod
+    def is_ready() -> bool:
+        try:
+            return bool(get_redis().exists(FeedService.READY_KEY))
+        except redis.RedisError as e:
+            logger.warning(f"Feed index unavailable: {e}")
+            return False
+
+    @staticmethod
+    def count() -> int:
+        return get_redis().zcard(FeedService.PUBLISHED_KEY)
+
+    @staticmethod
+    def _active_pinned_ids(client) -> List[int]:
+        """Закрепленные посты в порядке закрепления (новые первыми), без истекших"""
+        pipe = client.pipeline()
+        pipe.zrevrange(FeedService.PINNED_KEY, 0, -1)
+        pipe.hgetall(FeedService.PINNED_EXPIRES_KEY)
+        pinned, expires = pipe.execute()
+
+        now = timezone.now().timestamp()
+        return [
+            int(post_id) for post_id in pinned
+            if float(expires.get(post_id, 0)) > now
+        ]
+
+    @staticmethod
+    def get_ids(start: int, stop: int) -> List[int]:
+        """
+        ID постов ленты в диапазоне [start, stop):
+        сначала закрепленные, затем остальные по дате создания.
+        """
+        client = get_redis()
+        pinned = FeedService._active_pinned_ids(client)
+        pinned_count = len(pinned)
+
+        ids = pinned[start:stop]
+        if stop <= pinned_count:
+            return ids
+
+        # Позиция в обычной части ленты -> позиция в feed:published
+        regular_start = max(start, pinned_count) - pinned_count
+        limit = stop - max(start, pinned_count)
+
+        if pinned:
+            pipe = client.pipeline()
+            for post_id in pinned:
+                pipe.zrevrank(FeedService.PUBLISHED_KEY, post_id)
+            ranks = sorted(rank for rank in pipe.execute() if rank is not None)
+        else:
+            ranks = []
+
+        offset = regular_start
+        for rank in ranks:
+            if rank <= offset:
+                offset += 1
+
+        pinned_set = {str(post_id) for post_id in pinned}
+        members = client.zrevrange(
+            FeedService.PUBLISHED_KEY, offset, offset + limit + len(ranks) - 1
+        )
+        regular = [int(m) for m in members if m not in pinned_set][:limit]
+        return ids + regular
+
+    @staticmethod
+    def get_page(position: Optional[Dict], limit: int) -> Tuple[List[int], Optional[Dict]]:
+        """
+        Keyset-страница ленты. Позиция {'o': n} - смещение внутри закрепленных,
+        {'v': score, 'm': id} - последний выданный обычный пост.
+        """
+        client = get_redis()
+        pinned = FeedService._active_pinned_ids(client)
+        position = position or {'o': 0}
+
+        if 'o' in position:
+            offset = int(position['o'])
+            ids = pinned[offset:offset + limit]
+            if len(ids) == limit:
+                has_more = (
+                    offset + limit < len(pinned)
+                    or client.zcard(FeedService.PUBLISHED_KEY) > len(pinned)
+                )
+                return ids, ({'o': offset + limit} if has_more else None)
+            max_score, last_member = '+inf', None
+        else:
+            ids = []
+            max_score, last_member = float(position['v']), str(position['m'])
+
+        need = limit - len(ids)
+        pinned_set = {str(post_id) for post_id in pinned}
+        collected = []
+        start = 0
+        batch_size = need + len(pinned) + 1
+        # Одинаковые score Redis упорядочивает по member в обратном
+        # лексикографическом порядке, курсор сравнивает так же
+        while len(collected) <= need:
+            batch = client.zrevrangebyscore(
+                FeedService.PUBLISHED_KEY, max_score, '-inf',
+                start=start, num=batch_size, withscores=True
+            )
+            if not batch:
+                break
+            start += len(batch)
+            for member, score in batch:
+                if member in pinned_set:
+                    continue
+                if last_member is not None and score == max_score and member >= last_member:
+                    continue
+                collected.append((member, score))
+
+        regular = collected[:need]
+        next_position = None
+        if len(collected) > need and regular:
+            member, score = regular[-1]
+            next_position = {'v': score, 'm': member}
+        return ids + [int(member) for member, _ in regular], next_position
+
+    @staticmethod
+    def _pinned_entry(post_id: int) -> Optional[Dict]:
+        """Действующее закрепление поста (если есть)"""
+        return Post.objects.filter(
+            pk=post_id, status='published', is_effectively_pinned=True
+        ).values('pinned_at', 'pin_expires_at').first()
+
+    @staticmethod
+    def sync_post(post_id: int):
+        """Приводит записи поста в индексе к текущему состоянию в БД"""
+        try:
+            post = Post.objects.filter(pk=post_id).values('status', 'created_at').first()
+            if post is None or post['status'] != 'published':
+                FeedService.remove_post(post_id)
+                return
+
+            client = get_redis()
+            pipe = client.pipeline()
+            pipe.zadd(FeedService.PUBLISHED_KEY, {post_id: post['created_at'].timestamp()})
+            FeedService._queue_pin(pipe, post_id, FeedService._pinned_entry(post_id))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error syncing post {post_id} into feed index: {e}")
+
+    @staticmethod
+    def sync_pin(post_id: int):
+        """Обновляет только закрепленную часть индекса для поста"""
+        try:
+            pipe = get_redis().pipeline()
+            FeedService._queue_pin(pipe, post_id, FeedService._pinned_entry(post_id))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error syncing pin of post {post_id} into feed index: {e}")
+
+    @staticmethod
+    def _queue_pin(pipe, post_id: int, entry: Optional[Dict]):
+        if entry:
+            pipe.zadd(FeedService.PINNED_KEY, {post_id: entry['pinned_at'].timestamp()})
+            pipe.hset(FeedService.PINNED_EXPIRES_KEY, post_id, entry['pin_expires_at'].timestamp())
+        else:
+            pipe.zrem(FeedService.PINNED_KEY, post_id)
+            pipe.hdel(FeedService.PINNED_EXPIRES_KEY, post_id)
+
+    @staticmethod
+    def remove_post(post_id: int):
+        try:
+            pipe = get_redis().pipeline()
+            pipe.zrem(FeedService.PUBLISHED_KEY, post_id)
+            pipe.zrem(FeedService.PINNED_KEY, post_id)
+            pipe.hdel(FeedService.PINNED_EXPIRES_KEY, post_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error removing post {post_id} from feed index: {e}")
+
+    @staticmethod
+    def rebuild() -> Dict:
+        """Полная пересборка индекса с атомарной подменой ключей"""
+        client = get_redis()
+        tmp_published = f'{FeedService.PUBLISHED_KEY}:rebuild'
+        tmp_pinned = f'{FeedService.PINNED_KEY}:rebuild'
+        tmp_expires = f'{FeedService.PINNED_EXPIRES_KEY}:rebuild'
+        client.delete(tmp_published, tmp_pinned, tmp_expires)
+
+        published_count = 0
+        batch = {}
+        posts = Post.objects.filter(status='published').values_list('id', 'created_at')
+        for post_id, created_at in posts.iterator(chunk_size=FeedService.REBUILD_CHUNK_SIZE):
+            batch[post_id] = created_at.timestamp()
+            if len(batch) >= FeedService.REBUILD_CHUNK_SIZE:
+                client.zadd(tmp_published, batch)
+                published_count += len(batch)
+                batch = {}
+        if batch:
+            client.zadd(tmp_published, batch)
+            published_count += len(batch)
+
+        pins = list(Post.objects.filter(
+            status='published',
+            is_effectively_pinned=True,
+            pin_expires_at__gt=timezone.now(),
+        ).values_list('id', 'pinned_at', 'pin_expires_at'))
+
+        pipe = client.pipeline()
+        for post_id, pinned_at, end_date in pins:
+            pipe.zadd(tmp_pinned, {post_id: pinned_at.timestamp()})
+            pipe.hset(tmp_expires, post_id, end_date.timestamp())
+        pipe.execute()
+
+        # Подмена одной транзакцией: читатели видят либо старый, либо новый индекс
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(FeedService.PUBLISHED_KEY, FeedService.PINNED_KEY, FeedService.PINNED_EXPIRES_KEY)
+        if published_count:
+            pipe.rename(tmp_published, FeedService.PUBLISHED_KEY)
+        if pins:
+            pipe.rename(tmp_pinned, FeedService.PINNED_KEY)
+            pipe.rename(tmp_expires, FeedService.PINNED_EXPIRES_KEY)
+        pipe.set(FeedService.READY_KEY, timezone.now().isoformat())
+        pipe.execute()
+
+        logger.info(f"Feed index rebuilt: {published_count} posts")
+        return {'published_posts': published_count, 'pinned_posts': len(pins)}
+
+
+class ViewCounterService:
+    """
+    Буферизованный счетчик просмотров.
+
+    Просмотры копятся в хеше Redis (post_views:pending) и периодически
+    переносятся в БД одним UPDATE ... FROM (VALUES ...). Перед записью буфер
+    переименовывается в пакет post_views:batch:<uuid>, который удаляется
+    только после коммита, поэтому сбой посередине не теряет просмотры:
+    незавершенные пакеты применяются при следующем запуске.
+
+    Запуски не пересекаются (блокировка в Redis), а примененный пакет
+    отмечается в AppliedViewBatch в той же транзакции, поэтому пакет,
+    доставленный повторно после сбоя, не учитывается дважды.
+    """
+
+    PENDING_KEY = 'post_views:pending'
+    BATCHES_KEY = 'post_views:batches'
+    BATCH_PREFIX = 'post_views:batch:'
+    FLUSH_LOCK_KEY = 'post_views:flush_lock'
+    FLUSH_LOCK_TIMEOUT = 300
+    FLUSH_CHUNK_SIZE = 1000
+    # Отметки хранятся дольше, чем пакет может пролежать в Redis после коммита
+    APPLIED_RETENTION = timedelta(days=7)
+
+    @staticmethod
+    def record_view(post_id: int):
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.hincrby(ViewCounterService.PENDING_KEY, post_id, 1)
+            TrendingService.queue_view(pipe, post_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"View buffer unavailable, writing directly: {e}")
+            Post.objects.filter(pk=post_id).update(views_count=F('views_count') + 1)
+
+    @staticmethod
+    def pending_for(post_ids: Iterable[int]) -> Dict[int, int]:
+        """Еще не записанные в БД просмотры для набора постов"""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return {}
+        try:
+            client = get_redis()
+            keys = [ViewCounterService.PENDING_KEY, *client.smembers(ViewCounterService.BATCHES_KEY)]
+            pipe = client.pipeline()
+            for key in keys:
+                pipe.hmget(key, post_ids)
+            pending = dict.fromkeys(post_ids, 0)
+            for values in pipe.execute():
+                for post_id, value in zip(post_ids, values):
+                    if value:
+                        pending[post_id] += int(value)
+            return pending
+        except redis.RedisError as e:
+            logger.warning(f"View buffer unavailable: {e}")
+            return {}
+
+    @staticmethod
+    def flush() -> Dict:
+        """Переносит накопленные просмотры в БД; параллельный запуск пропускается"""
+        client = get_redis()
+        lock = client.lock(ViewCounterService.FLUSH_LOCK_KEY, timeout=ViewCounterService.FLUSH_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            logger.info("View flush already running, skipping")
+            return {'flushed_posts': 0, 'skipped': True}
+
+        try:
+            flushed_posts = 0
+
+            # Пакеты, оставшиеся после упавшего запуска
+            for batch_key in client.smembers(ViewCounterService.BATCHES_KEY):
+                flushed_posts += ViewCounterService._apply_batch(client, batch_key)
+
+            if client.exists(ViewCounterService.PENDING_KEY):
+                batch_key = f'{ViewCounterService.BATCH_PREFIX}{uuid.uuid4().hex}'
+                pipe = client.pipeline(transaction=True)
+                pipe.sadd(ViewCounterService.BATCHES_KEY, batch_key)
+                pipe.rename(ViewCounterService.PENDING_KEY, batch_key)
+                try:
+                    pipe.execute()
+                except redis.ResponseError:
+                    # Буфер исчез между проверкой и переименованием
+                    client.srem(ViewCounterService.BATCHES_KEY, batch_key)
+                else:
+                    flushed_posts += ViewCounterService._apply_batch(client, batch_key)
+
+            AppliedViewBatch.objects.filter(
+                applied_at__lt=timezone.now() - ViewCounterService.APPLIED_RETENTION
+            ).delete()
+        finally:
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                logger.warning("View flush lock expired before release")
+
+        return {'flushed_posts': flushed_posts}
+
+    @staticmethod
+    def _apply_batch(client, batch_key: str) -> int:
+        rows = [
+            (int(post_id), int(delta))
+            for post_id, delta in client.hgetall(batch_key).items()
+            if int(delta)
+        ]
+
+        try:
+            with transaction.atomic():
+                # Отметка о пакете в той же транзакции, что и UPDATE:
+                # пакет, уже примененный до сбоя, упрется в уникальный ключ
+                AppliedViewBatch.objects.create(key=batch_key)
+                if rows:
+                    table = connection.ops.quote_name(Post._meta.db_table)
+                    with connection.cursor() as cursor:
+                        for i in range(0, len(rows), ViewCounterService.FLUSH_CHUNK_SIZE):
+                            chunk = rows[i:i + ViewCounterService.FLUSH_CHUNK_SIZE]
+                            values = ', '.join(['(%s, %s)'] * len(chunk))
+                            cursor.execute(
+                                f'UPDATE {table} AS p SET views_count = p.views_count + v.delta '
+                                f'FROM (VALUES {values}) AS v(id, delta) WHERE p.id = v.id',
+                                [value for row in chunk for value in row],
+                            )
+        except IntegrityError:
+            logger.warning(f"View batch {batch_key} was already applied, dropping it")
+            rows = []
+
+        ViewCounterService._drop_batch(client, batch_key)
+        return len(rows)
+
+    @staticmethod
+    def _drop_batch(client, batch_key: str):
+        """Удаляет пакет из Redis (только после коммита)"""
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(batch_key)
+        pipe.srem(ViewCounterService.BATCHES_KEY, batch_key)
+        pipe.execute()
+
+
+class CategoryService:
+    """
+    Каталог категорий со счетчиками опубликованных постов.
+
+    Счетчики (Category.published_posts_count) меняются инкрементально при
+    сохранении и удалении постов. Сериализованный список категорий хранится
+    в кеше под ключом с номером версии; версия увеличивается только при
+    изменении категорий или их счетчиков.
+    """
+
+    VERSION_KEY = 'categories:version'
+    LIST_KEY = 'categories:list:v{version}'
+    LIST_TIMEOUT = 60 * 60 * 24
+
+    @staticmethod
+    def get_list(build) -> List[Dict]:
+        """Список категорий из кеша; build() строит его при промахе"""
+        try:
+            version = cache.get_or_set(CategoryService.VERSION_KEY, 1, timeout=None)
+            key = CategoryService.LIST_KEY.format(version=version)
+            data = cache.get(key)
+            if data is None:
+                data = list(build())
+                cache.set(key, data, CategoryService.LIST_TIMEOUT)
+            return data
+        except redis.RedisError as e:
+            logger.warning(f"Category cache unavailable: {e}")
+            return list(build())
+
+    @staticmethod
+    def invalidate():
+        """Новая версия списка (после коммита транзакции)"""
+        transaction.on_commit(CategoryService._bump_version)
+
+    @staticmethod
+    def _bump_version():
+        try:
+            cache.incr(CategoryService.VERSION_KEY)
+        except ValueError:
+            cache.set(CategoryService.VERSION_KEY, 1, timeout=None)
+        except redis.RedisError as e:
+            logger.warning(f"Category cache unavailable: {e}")
+
+    @staticmethod
+    def post_changed(previous: Optional[Tuple[str, Optional[int]]], current: Optional[Tuple[str, Optional[int]]]):
+        """
+        Пересчет счетчиков по изменению поста.
+        previous/current - пары (status, category_id), None - поста нет.
+        """
+        deltas = {}
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is not None and state[0] == 'published' and state[1] is not None:
+                deltas[state[1]] = deltas.get(state[1], 0) + sign
+
+        changed = False
+        for category_id, delta in deltas.items():
+            if delta:
+                changed |= bool(Category.objects.filter(pk=category_id).update(
+                    published_posts_count=Greatest(F('published_posts_count') + delta, 0)
+                ))
+        if changed:
+            CategoryService.invalidate()
+
+    @staticmethod
+    def reconcile() -> Dict:
+        """Пересчитывает счетчики всех категорий и исправляет расхождения"""
+        actual = Coalesce(Subquery(
+            Post.objects.filter(category=OuterRef('pk'), status='published')
+            .order_by().values('category').annotate(total=Count('pk')).values('total')
+        ), 0)
+        fixed = Category.objects.exclude(published_posts_count=actual).update(
+            published_posts_count=actual
+        )
+        if fixed:
+            logger.warning(f"Category counters drift repaired: {fixed} categories")
+            CategoryService.invalidate()
+        return {'fixed_categories': fixed}
+
+
+class CategoryFeedService:
+    """
+    Лента категории.
+
+    Закрепленные посты - отдельный небольшой список в порядке закрепления,
+    остальные идут курсорными страницами по индексу (category, -created_at).
+    Закрепленные и первая страница хранятся в кеше по категории вместе с
+    общей версией; версия меняется после коммита при изменении постов
+    категории, их закрепления и самой категории.
+    """
+
+    PINNED_KEY = 'category_feed:pinned:{category_id}'
+    FIRST_PAGE_KEY = 'category_feed:first_page:{category_id}'
+    VERSION_KEY = 'category_feed:version:{category_id}'
+
+    @staticmethod
+    def pinned_queryset(category_id: int):
+        return Post.objects.filter(
+            category_id=category_id, status='published', is_effectively_pinned=True,
+        ).select_related('author', 'category').defer('content').order_by('pinned_at', 'pk')
+
+    @staticmethod
+    def regular_queryset(category_id: int):
+        return Post.objects.filter(
+            category_id=category_id, status='published', is_effectively_pinned=False,
+        ).select_related('author', 'category').defer('content')
+
+    @staticmethod
+    def get_first_page(category_id: int, build_pinned: Callable[[], List[Dict]], build_page: Callable[[], Dict]) -> Tuple[List[Dict], Dict]:
+        """Закрепленные и первая страница из кеша (одним get_many); устаревшие части строятся заново"""
+        builders = {
+            CategoryFeedService.PINNED_KEY.format(category_id=category_id): build_pinned,
+            CategoryFeedService.FIRST_PAGE_KEY.format(category_id=category_id): build_page,
+        }
+        version_key = CategoryFeedService.VERSION_KEY.format(category_id=category_id)
+        try:
+            values = cache.get_many([*builders, version_key])
+            version = values.get(version_key)
+            if version is None:
+                cache.add(version_key, uuid.uuid4().hex, timeout=None)
+                version = cache.get(version_key)
+        except redis.RedisError as e:
+            logger.warning(f"Category feed cache unavailable: {e}")
+            return build_pinned(), build_page()
+
+        # Версия зафиксирована до построения: изменение во время сборки сделает запись устаревшей
+        result, stale = [], {}
+        for key, build in builders.items():
+            entry = values.get(key)
+            if entry is not None and entry['version'] == version:
+                result.append(entry['data'])
+            else:
+                data = build()
+                result.append(data)
+                stale[key] = {'version': version, 'data': data}
+        if stale:
+            try:
+                cache.set_many(stale, settings.CATEGORY_FEED_CACHE_TIMEOUT)
+            except redis.RedisError as e:
+                logger.warning(f"Category feed cache unavailable: {e}")
+        pinned, page = result
+        return pinned, page
+
+    @staticmethod
+    def invalidate(category_ids: Iterable[Optional[int]]):
+        """Новая версия лент категорий (после коммита транзакции)"""
+        keys = {
+            CategoryFeedService.VERSION_KEY.format(category_id=category_id)
+            for category_id in category_ids if category_id is not None
+        }
+        if not keys:
+            return
+
+        def bump():
+            try:
+                cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+            except redis.RedisError as e:
+                logger.warning(f"Category feed cache unavailable, {len(keys)} feeds not invalidated: {e}")
+
+        transaction.on_commit(bump)
+
+
+class PostBatchService:
+    """
+    Посты по id для пакетного чтения. Представления PostDetailSerializer
+    кешируются по посту (ObjectCache); версия поста меняется после коммита
+    при изменении поста, его закрепления и счетчика комментариев.
+    """
+
+    posts = ObjectCache('posts:object', 'POST_OBJECT_CACHE_TIMEOUT')
+
+    @staticmethod
+    def get_many(post_ids: Iterable[int], build: Callable[[List[int]], Dict[int, Dict]]) -> Dict[int, Dict]:
+        return PostBatchService.posts.get_many(post_ids, build)
+
+    @staticmethod
+    def invalidate(post_ids: Iterable[int]):
+        PostBatchService.posts.invalidate(post_ids)
+
+
+class HomeService:
+    """
+    Секции главной страницы (как у featured/, recent/, popular/ и pinned/).
+
+    Id постов всех секций выбираются одним UNION ALL, сами посты - одним
+    запросом по объединению id, так что пост из нескольких секций
+    загружается (и сериализуется) один раз.
+    """
+
+    RECENT_LIMIT = 10
+    POPULAR_LIMIT = 10
+    FEATURED_PINNED_LIMIT = 3
+    FEATURED_POPULAR_LIMIT = 6
+    FEATURED_PERIOD = timedelta(days=7)
+
+    # Секция -> поле сортировки (по убыванию)
+    ORDERING = {
+        'pinned': 'pinned_at',
+        'recent': 'created_at',
+        'popular': 'views_count',
+        'featured_popular': 'views_count',
+    }
+
+    @staticmethod
+    def section_ids() -> Dict[str, List[int]]:
+        published = Post.objects.filter(status='published')
+        week_ago = timezone.now() - HomeService.FEATURED_PERIOD
+        parts = {
+            'pinned': (Post.objects.pinned_posts(), None),
+            'recent': (published, HomeService.RECENT_LIMIT),
+            'popular': (published, HomeService.POPULAR_LIMIT),
+            # Запас на закрепленные, которые featured исключает из популярных
+            'featured_popular': (
+                published.filter(created_at__gte=week_ago),
+                HomeService.FEATURED_POPULAR_LIMIT + HomeService.FEATURED_PINNED_LIMIT,
+            ),
+        }
+        queries = []
+        for section, (queryset, limit) in parts.items():
+            ordering = F(HomeService.ORDERING[section]).desc()
+            # Номер строки сохраняет порядок секции: порядок строк UNION ALL не гарантирован
+            queryset = queryset.select_related(None).annotate(
+                section=Value(section),
+                position=Window(RowNumber(), order_by=ordering),
+            ).values_list('section', 'pk', 'position').order_by(ordering)
+            queries.append(queryset[:limit] if limit is not None else queryset)
+
+        rows = {section: [] for section in parts}
+        for section, post_id, position in queries[0].union(*queries[1:], all=True):
+            rows[section].append((position, post_id))
+        ids = {section: [post_id for _, post_id in sorted(items)] for section, items in rows.items()}
+
+        pinned = ids['pinned'][:HomeService.FEATURED_PINNED_LIMIT]
+        ids['featured_pinned'] = pinned
+        ids['featured_popular'] = [
+            post_id for post_id in ids['featured_popular'] if post_id not in pinned
+        ][:HomeService.FEATURED_POPULAR_LIMIT]
+        return ids
+
+
+class AutocompleteService:
+    """
+    Подсказки при вводе: посты, категории и авторы.
+
+    Сначала выполняется дешевый поиск по префиксу; запрос по триграммному
+    сходству (pg_trgm, GIN-индексы) нужен, только если префикс не набрал
+    лимит. Результат кешируется на префикс с коротким TTL, а запросы к БД
+    ограничены statement_timeout: при превышении возвращается то, что успели найти.
+    """
+
+    CACHE_KEY = 'autocomplete:{digest}'
+    MIN_LENGTH = 2
+    MAX_LENGTH = 64
+    LIMITS = {'post': 5, 'category': 3, 'author': 3}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(text.replace('\x00', '').split()).lower()[:AutocompleteService.MAX_LENGTH]
+
+    @staticmethod
+    def suggest(text: str) -> List[Dict]:
+        query = AutocompleteService.normalize(text)
+        if len(query) < AutocompleteService.MIN_LENGTH:
+            return []
+
+        key = AutocompleteService.CACHE_KEY.format(
+            digest=hashlib.md5(query.encode('utf-8')).hexdigest()
+        )
+        try:
+            cached = cache.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"Autocomplete cache unavailable: {e}")
+            cached = key = None
+        if cached is not None:
+            return cached
+
+        results = []
+        for kind, queryset, field, fields in AutocompleteService._sources():
+            results.extend(
+                dict(item, type=kind)
+                for item in AutocompleteService._lookup(queryset, field, fields, query, AutocompleteService.LIMITS[kind])
+            )
+        results.sort(key=lambda item: item.pop('score'), reverse=True)
+
+        if key is not None:
+            try:
+                cache.set(key, results, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+            except redis.RedisError as e:
+                logger.warning(f"Autocomplete cache unavailable: {e}")
+        return results
+
+    @staticmethod
+    def _sources():
+        return (
+            ('post', Post.objects.filter(status='published'), 'title', ('id', 'title', 'slug')),
+            ('category', Category.objects.all(), 'name', ('id', 'name', 'slug')),
+            # Только авторы опубликованных постов: иначе подсказки перечисляли бы всех пользователей
+            ('author', get_user_model().objects.filter(
+                Exists(Post.objects.filter(author=OuterRef('pk'), status='published')), is_active=True,
+            ), 'username', ('id', 'username')),
+        )
+
+    @staticmethod
+    def _lookup(queryset, field: str, fields: Tuple[str, ...], query: str, limit: int) -> List[Dict]:
+        found = []
+        # Лимит времени ставится на том же соединении, с которого читаем (реплика или мастер)
+        using = router.db_for_read(queryset.model)
+        queryset = queryset.using(using)
+        try:
+            with transaction.atomic(using=using):
+                with connections[using].cursor() as cursor:
+                    cursor.execute(
+                        "SELECT current_setting('statement_timeout'), set_config('statement_timeout', %s, true)",
+                        [str(settings.AUTOCOMPLETE_STATEMENT_TIMEOUT)],
+                    )
+                    previous_timeout = cursor.fetchone()[0]
+                # Выражение совпадает с триграммным индексом UPPER(<поле>)
+                queryset = queryset.alias(search_key=Upper(field))
+                term = query.upper()
+
+                # Префикс: точные совпадения начала всегда выше похожих
+                found = [
+                    dict(row, score=2.0)
+                    for row in queryset.filter(search_key__startswith=term)
+                    .order_by(field).values(*fields)[:limit]
+                ]
+                if len(found) < limit:
+                    found += [
+                        dict(row, score=row.pop('similarity'))
+                        for row in queryset.filter(search_key__trigram_similar=term)
+                        .exclude(pk__in=[row['id'] for row in found])
+                        .annotate(similarity=TrigramSimilarity('search_key', term))
+                        .order_by('-similarity').values(*fields, 'similarity')[:limit - len(found)]
+                    ]
+                with connections[using].cursor() as cursor:
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [previous_timeout])
+        except DatabaseError as e:
+            logger.warning(f"Autocomplete lookup on {queryset.model._meta.db_table} aborted: {e}")
+        return found
+
+
+class PostVersionService:
+    """
+    Версия поста для условных запросов (ETag/Last-Modified): время изменения
+    поста, последнего изменения комментариев и действующего закрепления,
+    готовность производных изображения, а также подписка автора (от нее
+    зависит can_pin в ответе автору).
+    """
+
+    @staticmethod
+    def get_state(**lookup) -> Optional[Dict]:
+        """Состояние поста одним запросом; None, если поста нет"""
+        return PostVersionService._state_queryset(**lookup).first()
+
+    @staticmethod
+    async def aget_state(**lookup) -> Optional[Dict]:
+        return await PostVersionService._state_queryset(**lookup).afirst()
+
+    @staticmethod
+    def _state_queryset(**lookup):
+        last_comment = Comment.objects.filter(
+            post=OuterRef('pk')
+        ).order_by('-updated_at').values('updated_at')[:1]
+
+        author_subscribed = Subscription.objects.filter(
+            user=OuterRef('author'), status='active', end_date__gt=Now()
+        )
+
+        return Post.objects.filter(**lookup).annotate(
+            last_comment_at=Subquery(last_comment),
+            author_subscribed=Exists(author_subscribed),
+        ).values(
+            'pk', 'author_id', 'updated_at', 'comments_count',
+            'last_comment_at', 'pinned_at', 'image_variants', 'author_subscribed',
+        )
+
+    @staticmethod
+    def last_modified(state: Dict):
+        return max(value for value in (
+            state['updated_at'], state['last_comment_at'], state['pinned_at']
+        ) if value is not None)
+
+
+class PinStateService:
+    """
+    Материализованное состояние закрепления поста.
+
+    Пост закреплен, если он опубликован и его закрепил пользователь с
+    активной неистекшей подпиской. Результат хранится в Post
+    (is_effectively_pinned, pinned_at, pin_expires_at) и пересчитывается
+    при изменении PinnedPost, подписки или статуса поста, а истечение
+    подписок подхватывает периодическая задача sweep().
+    """
+
+    @staticmethod
+    def refresh(post_ids: Iterable[int]) -> int:
+        """Пересчитывает состояние закрепления для постов одним UPDATE"""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return 0
+
+        active_pin = PinnedPost.objects.filter(
+            post=OuterRef('pk'),
+            post__status='published',
+            user__subscription__status='active',
+            user__subscription__end_date__gt=Now(),
+        ).order_by('-pinned_at')
+
+        state = {
+            'is_effectively_pinned': Exists(active_pin),
+            'pinned_at': Subquery(active_pin.values('pinned_at')[:1]),
+            'pin_expires_at': Subquery(active_pin.values('user__subscription__end_date')[:1]),
+        }
+        rows = Post.objects.filter(pk__in=post_ids).annotate(
+            **{f'new_{field}': expression for field, expression in state.items()}
+        ).values('pk', 'category_id', *state, *(f'new_{field}' for field in state))
+        changed = {
+            row['pk']: row['category_id'] for row in rows
+            if any(row[field] != row[f'new_{field}'] for field in state)
+        }
+        if not changed:
+            return 0
+
+        Post.objects.filter(pk__in=changed).update(**state)
+        invalidate_cache_tags('pins')
+        CategoryFeedService.invalidate(set(changed.values()))
+        PostBatchService.invalidate(changed)
+        for post_id in changed:
+            transaction.on_commit(lambda post_id=post_id: FeedService.sync_pin(post_id))
+        return len(changed)
+
+    @staticmethod
+    def refresh_for_user(user_id: int) -> int:
+        """Пересчет постов, закрепленных пользователем (после изменения подписки)"""
+        return PinStateService.refresh(
+            PinnedPost.objects.filter(user_id=user_id).values_list('post_id', flat=True)
+        )
+
+    @staticmethod
+    def sweep() -> Dict:
+        """
+        Снимает закрепления с истекшими подписками и сверяет остальные
+        (изменения подписок через QuerySet.update() не вызывают сигналов).
+        """
+        candidates = set(
+            PinnedPost.objects.values_list('post_id', flat=True)
+        ) | set(
+            Post.objects.filter(is_effectively_pinned=True).values_list('pk', flat=True)
+        )
+        changed = PinStateService.refresh(candidates)
+        if changed:
+            logger.info(f"Pin sweep updated {changed} posts")
+        return {'updated_posts': changed}
+
+
+class TrendingService:
+    """
+    Популярное сейчас: просмотры с экспоненциальным затуханием.
+
+    Просмотры копятся в почасовых хешах post_views:hour:<YYYYMMDDHH>
+    (post_id -> количество). Периодическая задача compute() считает по окну
+    TRENDING_WINDOW_HOURS оценку sum(views_h * 2^(-age_h / half_life))
+    матрично в NumPy и сохраняет готовые top-K списки (общий и по
+    категориям) в Redis, так что чтение - один GET.
+    """
+
+    BUCKET_PREFIX = 'post_views:hour:'
+    TOP_KEY = 'trending:all'
+    CATEGORY_KEY = 'trending:category:{category_id}'
+    CATEGORIES_KEY = 'trending:categories'
+
+    @staticmethod
+    def bucket_key(moment) -> str:
+        return f"{TrendingService.BUCKET_PREFIX}{moment.astimezone(dt_timezone.utc):%Y%m%d%H}"
+
+    @staticmethod
+    def queue_view(pipe, post_id: int):
+        """Добавляет просмотр в текущий часовой бакет (в общем pipeline записи просмотра)"""
+        key = TrendingService.bucket_key(timezone.now())
+        pipe.hincrby(key, post_id, 1)
+        pipe.expire(key, (settings.TRENDING_WINDOW_HOURS + 1) * 3600)
+
+    @staticmethod
+    def get_ids(category_id: Optional[int] = None) -> List[int]:
+        key = (
+            TrendingService.TOP_KEY if category_id is None
+            else TrendingService.CATEGORY_KEY.format(category_id=category_id)
+        )
+        try:
+            value = get_redis().get(key)
+        except redis.RedisError as e:
+            logger.warning(f"Trending lists unavailable: {e}")
+            return []
+        return json.loads(value) if value else []
+
+    @staticmethod
+    def compute() -> Dict:
+        client = get_redis()
+        now = timezone.now()
+        window = settings.TRENDING_WINDOW_HOURS
+        top_k = settings.TRENDING_TOP_K
+
+        pipe = client.pipeline(transaction=False)
+        for age in range(window):
+            pipe.hgetall(TrendingService.bucket_key(now - timedelta(hours=age)))
+        buckets = pipe.execute()
+
+        post_ids = sorted({int(post_id) for bucket in buckets for post_id in bucket})
+        published = dict(
+            Post.objects.filter(pk__in=post_ids, status='published').values_list('pk', 'category_id')
+        ) if post_ids else {}
+        post_ids = [post_id for post_id in post_ids if post_id in published]
+
+        top, by_category = [], {}
+        if post_ids:
+            row_of = {post_id: row for row, post_id in enumerate(post_ids)}
+            counts = np.zeros((len(post_ids), window), dtype=np.float64)
+            for column, bucket in enumerate(buckets):
+                rows = [(row_of[int(k)], int(v)) for k, v in bucket.items() if int(k) in row_of]
+                if rows:
+                    index, values = zip(*rows)
+                    counts[list(index), column] = values
+
+            # Возраст бакета в часах с учетом прошедшей части текущего часа
+            ages = np.arange(window, dtype=np.float64) + now.minute / 60
+            weights = np.exp2(-ages / settings.TRENDING_HALF_LIFE_HOURS)
+            scores = counts @ weights
+
+            ids = np.asarray(post_ids, dtype=np.int64)
+            categories = np.asarray(
+                [published[post_id] or -1 for post_id in post_ids], dtype=np.int64
+            )
+
+            order = np.argsort(-scores, kind='stable')
+            top = ids[order[:top_k]].tolist()
+
+            # Сортировка по (категория, -score): top-K каждой категории - начало ее группы
+            order = np.lexsort((-scores, categories))
+            sorted_categories = categories[order]
+            starts = np.flatnonzero(np.r_[True, sorted_categories[1:] != sorted_categories[:-1]])
+            ends = np.r_[starts[1:], len(order)]
+            for start, end in zip(starts, ends):
+                category_id = int(sorted_categories[start])
+                if category_id != -1:
+                    by_category[category_id] = ids[order[start:min(end, start + top_k)]].tolist()
+
+        stale = {int(c) for c in client.smembers(TrendingService.CATEGORIES_KEY)} - set(by_category)
+        pipe = client.pipeline(transaction=True)
+        pipe.set(TrendingService.TOP_KEY, json.dumps(top))
+        for category_id, ids_list in by_category.items():
+            pipe.set(TrendingService.CATEGORY_KEY.format(category_id=category_id), json.dumps(ids_list))
+        for category_id in stale:
+            pipe.delete(TrendingService.CATEGORY_KEY.format(category_id=category_id))
+        pipe.delete(TrendingService.CATEGORIES_KEY)
+        if by_category:
+            pipe.sadd(TrendingService.CATEGORIES_KEY, *by_category)
+        pipe.execute()
+
+        return {'posts': len(post_ids), 'categories': len(by_category)}
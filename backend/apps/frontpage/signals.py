@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from apps.subscribe.models import Subscription, PinnedPost
+from config.cache import invalidate_cache_tags
+from config.images import needs_refresh, schedule_refresh
+from .models import Category, Post
+from .services import CategoryFeedService, CategoryService, FeedService, PinStateService, PostBatchService
+from .tasks import generate_post_image_derivatives
+
+
+@receiver(pre_save, sender=Post)
+def post_pre_save(sender, instance, update_fields=None, **kwargs):
+    """ Запоминаем статус и категорию до сохранения для счетчиков категорий """
+    if update_fields is not None and not {'status', 'category', 'category_id'} & set(update_fields):
+        instance._previous_category_state = False
+        return
+    previous = None
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).values_list('status', 'category_id').first()
+    instance._previous_category_state = previous
+
+
+@receiver(post_save, sender=Post)
+def post_post_save(sender, instance, created, update_fields=None, **kwargs):
+    """ Обновление индекса ленты и счетчиков категорий после сохранения поста """
+    previous = getattr(instance, '_previous_category_state', None)
+    if previous is not False:
+        current = (instance.status, instance.category_id)
+        if created or previous != current:
+            CategoryService.post_changed(None if created else previous, current)
+        if not created and previous is not None and previous[0] != instance.status:
+            PinStateService.refresh([instance.pk])
+    if needs_refresh(instance, 'image', update_fields):
+        schedule_refresh(generate_post_image_derivatives, instance.pk)
+    invalidate_cache_tags('posts')
+    CategoryFeedService.invalidate({instance.category_id, previous[1] if previous else None})
+    PostBatchService.invalidate([instance.pk])
+    transaction.on_commit(lambda: FeedService.sync_post(instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def post_post_delete(sender, instance, **kwargs):
+    """ Удаление поста из индекса ленты и счетчика категории """
+    post_id = instance.pk
+    CategoryService.post_changed((instance.status, instance.category_id), None)
+    invalidate_cache_tags('posts')
+    CategoryFeedService.invalidate([instance.category_id])
+    PostBatchService.invalidate([post_id])
+    transaction.on_commit(lambda: FeedService.remove_post(post_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    """ Изменение категорий сбрасывает кешированный список и ответы с постами """
+    CategoryService.invalidate()
+    CategoryFeedService.invalidate([instance.pk])
+    invalidate_cache_tags('posts')
+
+
+@receiver(post_save, sender=PinnedPost)
+@receiver(post_delete, sender=PinnedPost)
+def pinned_post_changed(sender, instance, **kwargs):
+    """ Закрепление или открепление поста """
+    PinStateService.refresh([instance.post_id])
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    """ Активация, отмена или истечение подписки влияет на закрепление """
+    PinStateService.refresh_for_user(instance.user_id)
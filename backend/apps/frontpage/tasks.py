@@ -0,0 +1,46 @@
+from celery import shared_task
+from django.conf import settings
+
+from config.cache import invalidate_cache_tags
+from config.images import refresh_derivatives
+from .models import Post
+from .services import CategoryService, FeedService, PinStateService, TrendingService, ViewCounterService
+
+
+@shared_task
+def rebuild_feed_index():
+    """Полная пересборка индекса ленты (страховка от расхождений)"""
+    return FeedService.rebuild()
+
+
+@shared_task
+def flush_post_views():
+    """Перенос буферизованных просмотров постов в БД"""
+    return ViewCounterService.flush()
+
+
+@shared_task
+def reconcile_category_counters():
+    """Сверка счетчиков опубликованных постов в категориях"""
+    return CategoryService.reconcile()
+
+
+@shared_task
+def sweep_expired_pins():
+    """Снятие закреплений, у которых истекла подписка закрепившего"""
+    return PinStateService.sweep()
+
+
+@shared_task
+def compute_trending_posts():
+    """Пересчет списков популярного сейчас"""
+    return TrendingService.compute()
+
+
+@shared_task
+def generate_post_image_derivatives(post_id):
+    """Производные изображения поста (размеры WebP/JPEG и blurhash)"""
+    changed = refresh_derivatives(Post, post_id, 'image', settings.POST_IMAGE_WIDTHS)
+    if changed:
+        invalidate_cache_tags('posts')
+    return changed
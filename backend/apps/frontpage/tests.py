@@ -1,3 +1,1695 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import re
+import shutil
+import tempfile
+import uuid
+from base64 import b64encode
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import redis
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.accounts.models import User
+from apps.comments.models import Comment
+from apps.comments.services import CommentCounterService
+from apps.subscribe.models import PinnedPost, Subscription, SubscriptionPlan
+from config.asgi import BoundedASGIHandler
+from config.db_router import PRIMARY_COOKIE, ReplicaPool, ReplicaRoutingMiddleware
+from config.images import BASE83, blurhash_encode, build_derivatives, store_derivatives
+from config.redis_client import get_redis
+from config.renderers import MessagePackParser, MessagePackRenderer, ORJSONParser, ORJSONRenderer
+from config.transactions import AtomicWritesHandlerMixin
+from .filters import build_search_query
+from .models import Category, Post
+from .serializers import PostListRowSerializer, PostListSerializer
+from .services import AutocompleteService, CategoryService, FeedService, PinStateService, TrendingService, ViewCounterService
+from .tasks import generate_post_image_derivatives
+from .views import popular_posts, recent_posts
+
+
+def clear_redis(pattern):
+    """Удаляет ключи Redis приложения, которые трогает тест"""
+    client = get_redis()
+    keys = client.keys(pattern)
+    if keys:
+        client.delete(*keys)
+
+
+class PostListRowSerializerParityTests(TestCase):
+    """Быстрый путь по строкам .values() должен давать тот же JSON, что и PostListSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='x')
+        category = Category.objects.create(name='News', slug='news')
+
+        cls.posts = [
+            Post.objects.create(
+                title=f'Post {i}', slug=f'post-{i}', content='word ' * (10 if i % 2 else 100),
+                author=cls.author if i % 2 else cls.reader,
+                category=category if i % 3 else None,
+            )
+            for i in range(6)
+        ]
+        Post.objects.create(title='Draft', slug='draft', content='draft', author=cls.author, status='draft')
+
+        with_image = cls.posts[1]
+        Post.objects.filter(pk=with_image.pk).update(
+            image='posts/photo.jpg',
+            views_count=7,
+            image_variants={
+                'source': 'posts/photo.jpg', 'width': 800, 'height': 600, 'blurhash': 'L00000fQfQfQ',
+                'files': {'webp': {'320': 'posts/photo.w320.webp'}, 'jpeg': {'320': 'posts/photo.w320.jpg'}},
+            },
+        )
+        # Закрепление материализовано в колонках поста; сигналы здесь не нужны
+        pinned = cls.posts[3]
+        Post.objects.filter(pk=pinned.pk).update(
+            is_effectively_pinned=True, pinned_at=timezone.now(), pin_expires_at=timezone.now(),
+        )
+        PinnedPost.objects.bulk_create([PinnedPost(user=cls.author, post=pinned)])
+
+    def queryset(self):
+        return Post.objects.with_subscription_info().defer('content').filter(
+            status='published'
+        ).order_by('-created_at')
+
+    def render_both(self, query=''):
+        request = Request(APIRequestFactory().get(f'/api/v1/posts/?{query}'))
+        context = {'request': request}
+        expected = PostListSerializer(self.queryset(), many=True, context=context).data
+        rows = PostListRowSerializer.rows(self.queryset(), request)
+        actual = PostListRowSerializer(rows, many=True, context=context).data
+        return JSONRenderer().render(expected), JSONRenderer().render(actual)
+
+    def test_full_representation_is_identical(self):
+        expected, actual = self.render_both()
+        self.assertEqual(actual, expected)
+        self.assertIn(b'"pinned_by":{"id"', actual)
+        self.assertIn(b'"image_variants":{', actual)
+
+    def test_sparse_fieldsets_are_identical(self):
+        for query in ('fields=id,title,pinned_info', 'omit=content,author,image_variants', 'fields=views_count,unknown'):
+            with self.subTest(query=query):
+                expected, actual = self.render_both(query)
+                self.assertEqual(actual, expected)
+
+    def test_rows_use_single_query(self):
+        request = Request(APIRequestFactory().get('/api/v1/posts/?omit=pinned_info'))
+        rows = PostListRowSerializer.rows(self.queryset(), request)
+        with self.assertNumQueries(1):
+            PostListRowSerializer(rows, many=True, context={'request': request}).data
+
+    def test_list_endpoints_are_identical(self):
+        factory = APIRequestFactory()
+        for view in (recent_posts, popular_posts):
+            with self.subTest(view=view.__name__):
+                # Минуем кеш ответов: сравниваем сами представления
+                responses = []
+                for enabled in (False, True):
+                    with override_settings(FAST_LIST_SERIALIZATION=enabled):
+                        response = async_to_sync(view.__wrapped__)(factory.get('/api/v1/posts/'))
+                        responses.append(response.render().content)
+                self.assertEqual(responses[1], responses[0])
+
+    def test_feed_is_identical(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        for query in ('', '?ordering=-views_count', '?fields=id,is_pinned'):
+            with self.subTest(query=query):
+                responses = []
+                for enabled in (False, True):
+                    with override_settings(FAST_LIST_SERIALIZATION=enabled):
+                        responses.append(client.get(f'/api/v1/posts/{query}').content)
+                self.assertEqual(responses[1], responses[0])
+
+
+class PostListSerializerQueryTests(TestCase):
+    """pinned_info загружается одним запросом на страницу при любом числе закрепленных"""
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        for i in range(4):
+            author = User.objects.create_user(email=f'author{i}@example.com', username=f'author{i}', password='x')
+            Subscription.objects.create(
+                user=author, plan=plan, status='active',
+                start_date=timezone.now(), end_date=timezone.now() + timedelta(days=10),
+            )
+            post = Post.objects.create(title=f'Post {i}', slug=f'post-{i}', content='text', author=author)
+            PinnedPost.objects.create(user=author, post=post)
+            Post.objects.create(title=f'Regular {i}', slug=f'regular-{i}', content='text', author=author)
+
+    def setUp(self):
+        clear_redis('post_views:*')
+
+    def test_pinned_info_in_constant_queries(self):
+        posts = list(Post.objects.select_related('author', 'category').order_by('-is_effectively_pinned', 'pk'))
+        for page in (posts[:1], posts):
+            # Загруженное запоминается на HTTP-запрос: каждая страница - в своем запросе
+            request = Request(APIRequestFactory().get('/'))
+            with self.subTest(posts=len(page)):
+                with self.assertNumQueries(1):
+                    data = PostListSerializer(page, many=True, context={'request': request}).data
+        self.assertEqual(
+            [row['pinned_info']['pinned_by']['username'] for row in data if row['is_pinned']],
+            [f'author{i}' for i in range(4)],
+        )
+        self.assertEqual(sum(not row['is_pinned'] for row in data), 4)
+
+
+class KeysetCursorPaginationTests(TestCase):
+    """Курсорные страницы ленты: обход вперед по next и назад по previous"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        Post.objects.bulk_create([
+            Post(title=f'Post {i}', slug=f'post-{i}', content='text', author=cls.author) for i in range(25)
+        ])
+        Post.objects.create(title='Draft', slug='draft', content='draft', author=cls.author, status='draft')
+        for minutes, post in enumerate(Post.objects.order_by('pk')[:2]):
+            Post.objects.filter(pk=post.pk).update(
+                is_effectively_pinned=True, pinned_at=timezone.now() - timedelta(minutes=minutes),
+            )
+
+    def setUp(self):
+        # Без индекса ленты в Redis: проверяется курсор по БД
+        clear_redis('feed:*')
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        return response.data
+
+    def walk(self, url, link):
+        """Страницы по ссылкам next или previous начиная с url и ответ последней из них"""
+        pages, data = [], None
+        while url:
+            data = self.get(url)
+            pages.append([post['id'] for post in data['results']])
+            url = data[link]
+        return pages, data
+
+    def expected_ids(self):
+        published = Post.objects.filter(status='published')
+        pinned = published.filter(is_effectively_pinned=True).order_by('-pinned_at')
+        regular = published.exclude(pk__in=pinned).order_by('-created_at', '-pk')
+        return [post.pk for post in pinned] + [post.pk for post in regular]
+
+    def test_next_walks_the_whole_feed_once(self):
+        pages, _ = self.walk('/api/v1/posts/?page_size=10', 'next')
+        self.assertEqual([len(page) for page in pages], [12, 10, 3])
+        self.assertEqual([pk for page in pages for pk in page], self.expected_ids())
+
+    def test_previous_returns_the_same_pages(self):
+        forward, last = self.walk('/api/v1/posts/?page_size=10', 'next')
+        backward, first = self.walk(last['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertIsNone(first['previous'])
+        self.assertEqual(first['pinned_posts_count'], 2)
+
+    def test_page_size_is_capped(self):
+        with mock.patch('config.pagination.KeysetCursorPagination.max_page_size', 5):
+            data = self.get('/api/v1/posts/?page_size=50')
+        self.assertEqual(len(data['results']), 2 + 5)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/v1/posts/?cursor=garbage').status_code, 404)
+        value = timezone.now().isoformat()
+        for position in ({'v': value, 'i': 'abc'}, {'v': value, 'i': None}, {'v': value, 'i': [1]}, {'v': 'abc', 'i': 1}):
+            with self.subTest(position=position):
+                cursor = b64encode(json.dumps(position).encode('utf-8'), altchars=b'-_').decode('ascii')
+                self.assertEqual(self.client.get(f'/api/v1/posts/?cursor={cursor}').status_code, 404)
+
+
+class CategoryFeedTests(TestCase):
+    """Лента категории: закрепленные в начале первой страницы при любом пути к ней"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.category = Category.objects.create(name='News', slug='news')
+        Post.objects.bulk_create([
+            Post(title=f'Post {i}', slug=f'post-{i}', content='text', author=author, category=cls.category)
+            for i in range(28)
+        ])
+        for minutes, post in enumerate(Post.objects.order_by('pk')[:3]):
+            Post.objects.filter(pk=post.pk).update(
+                is_effectively_pinned=True, pinned_at=timezone.now() - timedelta(minutes=minutes),
+            )
+
+    def setUp(self):
+        clear_redis('*category_feed:*')
+        self.addCleanup(clear_redis, '*category_feed:*')
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_previous_from_second_page_restores_pinned_posts(self):
+        first = self.get(f'/api/v1/posts/categories/{self.category.slug}/posts/')
+        self.assertEqual((first['pinned_posts_count'], len(first['posts'])), (3, 23))
+        self.assertIsNone(first['previous'])
+
+        second = self.get(first['next'])
+        self.assertEqual(second['pinned_posts_count'], 0)
+        self.assertEqual(len(second['posts']), 5)
+
+        back = self.get(second['previous'])
+        self.assertEqual(back['pinned_posts_count'], 3)
+        self.assertEqual([post['id'] for post in back['posts']], [post['id'] for post in first['posts']])
+        self.assertIsNone(back['previous'])
+        self.assertEqual(back['next'], first['next'])
+
+
+class FeedIndexTests(TestCase):
+    """Индекс ленты в Redis: порядок (закрепленные первыми) и синхронизация с БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.posts = []
+        for hours in range(6):
+            post = Post.objects.create(title=f'Post {hours}', slug=f'post-{hours}', content='text', author=cls.author)
+            Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - timedelta(hours=hours))
+            cls.posts.append(post)
+
+    def setUp(self):
+        clear_redis('feed:*')
+        self.addCleanup(clear_redis, 'feed:*')
+        FeedService.rebuild()
+
+    def pin(self, post, minutes_ago, expires_in=timedelta(days=1)):
+        """Закрепление так, как его материализует PinStateService"""
+        Post.objects.filter(pk=post.pk).update(
+            is_effectively_pinned=True,
+            pinned_at=timezone.now() - timedelta(minutes=minutes_ago),
+            pin_expires_at=timezone.now() + expires_in,
+        )
+        FeedService.sync_pin(post.pk)
+
+    def feed_ids(self, limit=100):
+        ids, _ = FeedService.get_page(None, limit)
+        return ids
+
+    def ids(self, *indexes):
+        return [self.posts[index].pk for index in indexes]
+
+    def test_newest_first(self):
+        self.assertEqual(self.feed_ids(), self.ids(0, 1, 2, 3, 4, 5))
+
+    def test_pinned_posts_come_first_in_pin_order(self):
+        self.pin(self.posts[4], minutes_ago=10)
+        self.pin(self.posts[2], minutes_ago=5)
+        self.assertEqual(self.feed_ids(), self.ids(2, 4, 0, 1, 3, 5))
+
+    def test_expired_pin_returns_to_its_place(self):
+        self.pin(self.posts[4], minutes_ago=10)
+        self.pin(self.posts[3], minutes_ago=5, expires_in=-timedelta(minutes=1))
+        self.assertEqual(self.feed_ids(), self.ids(4, 0, 1, 2, 3, 5))
+
+    def test_pages_do_not_repeat_pinned_posts(self):
+        self.pin(self.posts[5], minutes_ago=1)
+        first, position = FeedService.get_page(None, 4)
+        second, position = FeedService.get_page(position, 4)
+        self.assertEqual(first + second, self.ids(5, 0, 1, 2, 3, 4))
+        self.assertIsNone(position)
+
+    def test_publish_and_unpublish_sync_the_index(self):
+        post = Post.objects.get(pk=self.posts[1].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.status = 'draft'
+            post.save()
+        self.assertEqual(self.feed_ids(), self.ids(0, 2, 3, 4, 5))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.status = 'published'
+            post.save()
+        self.assertEqual(self.feed_ids(), self.ids(0, 1, 2, 3, 4, 5))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.feed_ids(), self.ids(0, 2, 3, 4, 5))
+
+    def test_list_endpoint_reads_the_index_with_client_params(self):
+        self.pin(self.posts[3], minutes_ago=1)
+        with mock.patch.object(FeedService, 'get_page', wraps=FeedService.get_page) as get_page:
+            response = APIClient().get('/api/v1/posts/?page_size=4&ordering=-created_at')
+        self.assertTrue(get_page.called)
+        self.assertEqual([post['id'] for post in response.data['results']], self.ids(3, 0, 1, 2))
+        self.assertEqual(response.data['pinned_posts_count'], 1)
+
+    def test_ascending_ordering_bypasses_the_index(self):
+        with mock.patch.object(FeedService, 'get_page') as get_page:
+            response = APIClient().get('/api/v1/posts/?ordering=created_at')
+        self.assertFalse(get_page.called)
+        self.assertEqual([post['id'] for post in response.data['results']], self.ids(5, 4, 3, 2, 1, 0))
+
+
+class PostBatchTests(TestCase):
+    """Пакетное чтение постов: видимость, missing, лимит id и сброс кеша"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='x')
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        Subscription.objects.create(
+            user=cls.author, plan=plan, status='active',
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30),
+        )
+        cls.post = Post.objects.create(title='Post', slug='post', content='text', author=cls.author)
+        cls.other = Post.objects.create(title='Other', slug='other', content='text', author=cls.reader)
+        cls.draft = Post.objects.create(title='Draft', slug='draft', content='text', author=cls.author, status='draft')
+
+    def setUp(self):
+        clear_redis('*posts:object*')
+        self.addCleanup(clear_redis, '*posts:object*')
+        self.client = APIClient()
+
+    def batch(self, *ids):
+        response = self.client.get(f"/api/v1/posts/batch/?ids={','.join(str(pk) for pk in ids)}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_drafts_are_hidden_from_other_users(self):
+        for user in (None, self.reader):
+            with self.subTest(user=user):
+                self.client.force_authenticate(user)
+                data = self.batch(self.post.pk, self.draft.pk)
+                self.assertEqual(list(data['results']), [self.post.pk])
+                self.assertEqual(data['missing'], [self.draft.pk])
+
+        self.client.force_authenticate(self.author)
+        data = self.batch(self.post.pk, self.draft.pk)
+        self.assertEqual(list(data['results']), [self.post.pk, self.draft.pk])
+        self.assertEqual(data['missing'], [])
+
+    def test_unknown_ids_are_reported_missing_in_request_order(self):
+        data = self.batch(999999, self.other.pk, self.post.pk, self.other.pk, 999998)
+        self.assertEqual(list(data['results']), [self.other.pk, self.post.pk])
+        self.assertEqual(data['missing'], [999999, 999998])
+
+    def test_can_pin_matches_the_model(self):
+        for user in (None, self.reader, self.author):
+            self.client.force_authenticate(user)
+            data = self.batch(self.post.pk, self.other.pk, self.draft.pk)
+            for post in Post.objects.filter(pk__in=data['results']):
+                with self.subTest(user=user, post=post.slug):
+                    self.assertEqual(data['results'][post.pk]['can_pin'], post.can_be_pinned_by(user))
+        self.assertTrue(data['results'][self.post.pk]['can_pin'])
+
+    def test_invalid_id_lists_are_rejected(self):
+        for query in ('', 'ids=', 'ids=1,a', 'ids=,,'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/v1/posts/batch/?{query}').status_code, 400)
+        with override_settings(BATCH_MAX_IDS=2):
+            self.assertEqual(self.client.get('/api/v1/posts/batch/?ids=1,2,3').status_code, 400)
+            self.assertEqual(self.client.get('/api/v1/posts/batch/?ids=1,2,2,1').status_code, 200)
+
+    def test_cached_posts_are_served_without_queries(self):
+        first = self.batch(self.post.pk, self.other.pk)
+        with self.assertNumQueries(0):
+            second = self.batch(self.post.pk, self.other.pk)
+        self.assertEqual(second, first)
+
+    def test_post_change_invalidates_cache(self):
+        self.batch(self.post.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.get(pk=self.post.pk)
+            post.title = 'Renamed'
+            post.save()
+        self.assertEqual(self.batch(self.post.pk)['results'][self.post.pk]['title'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.batch(self.post.pk)['missing'], [self.post.pk])
+
+    def test_pin_change_invalidates_cache(self):
+        self.assertFalse(self.batch(self.post.pk)['results'][self.post.pk]['is_pinned'])
+        with self.captureOnCommitCallbacks(execute=True):
+            pin = PinnedPost.objects.create(user=self.author, post=self.post)
+        self.assertTrue(self.batch(self.post.pk)['results'][self.post.pk]['is_pinned'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pin.delete()
+        self.assertFalse(self.batch(self.post.pk)['results'][self.post.pk]['is_pinned'])
+
+    def test_comment_change_invalidates_cache(self):
+        self.assertEqual(self.batch(self.post.pk)['results'][self.post.pk]['comments_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(post=self.post, author=self.reader, content='text')
+            CommentCounterService.comment_created(comment)
+        self.assertEqual(self.batch(self.post.pk)['results'][self.post.pk]['comments_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CommentCounterService.deactivate(comment)
+        self.assertEqual(self.batch(self.post.pk)['results'][self.post.pk]['comments_count'], 0)
+
+
+class HomeTests(TestCase):
+    """Главная одним запросом: те же секции, что у отдельных виджетов, и кеш ответа"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        category = Category.objects.create(name='News', slug='news')
+        now = timezone.now()
+        for i in range(16):
+            post = Post.objects.create(
+                title=f'Post {i}', slug=f'post-{i}', content='text', author=cls.author,
+                category=category if i % 2 else None,
+            )
+            # Часть постов старше недели (вне featured), просмотры не совпадают
+            Post.objects.filter(pk=post.pk).update(
+                created_at=now - timedelta(days=i),
+                views_count=(i * 7) % 16,
+                **({
+                    'is_effectively_pinned': True,
+                    'pinned_at': now - timedelta(minutes=i),
+                    'pin_expires_at': now + timedelta(days=1),
+                } if i % 3 == 0 else {}),
+            )
+        Post.objects.create(title='Draft', slug='draft', content='text', author=cls.author, status='draft')
+
+    def setUp(self):
+        for pattern in ('*response:*', '*cache_tag:*'):
+            clear_redis(pattern)
+            self.addCleanup(clear_redis, pattern)
+        self.client = APIClient()
+
+    def get_json(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_sections_match_widget_endpoints(self):
+        home = self.get_json('/api/v1/posts/home/')
+        self.assertEqual(len(home['featured']['pinned_posts']), 3)
+        self.assertEqual(home['pinned']['count'], 6)
+        for section, url in (
+            ('featured', '/api/v1/posts/featured/'),
+            ('recent', '/api/v1/posts/recent/'),
+            ('popular', '/api/v1/posts/popular/'),
+            ('pinned', '/api/v1/posts/pinned/'),
+        ):
+            with self.subTest(section=section):
+                self.assertEqual(home[section], self.get_json(url))
+
+    def test_cached_response_is_served_gzipped_without_queries(self):
+        first = self.client.get('/api/v1/posts/home/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertNotIn('Content-Encoding', first)
+        self.assertIn('Accept-Encoding', first['Vary'])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/v1/posts/home/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(cached['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(cached.content), first.content)
+
+        with self.assertNumQueries(0):
+            plain = self.client.get('/api/v1/posts/home/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain.content, first.content)
+
+    def test_cache_key_includes_scheme_and_host(self):
+        Post.objects.filter(slug='post-0').update(image='posts/photo.jpg')
+        first = self.client.get('/api/v1/posts/recent/', HTTP_HOST='localhost')
+        self.assertIn(b'http://localhost/media/posts/photo.jpg', first.content)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/posts/recent/', HTTP_HOST='localhost').content, first.content)
+
+        # Другой хост или схема - своя запись с собственными абсолютными ссылками
+        for host, secure, url in (
+            ('domen.com', False, b'http://domen.com/media/posts/photo.jpg'),
+            ('localhost', True, b'https://localhost/media/posts/photo.jpg'),
+        ):
+            with self.subTest(host=host, secure=secure):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get('/api/v1/posts/recent/', HTTP_HOST=host, secure=secure)
+                self.assertTrue(queries)
+                self.assertIn(url, response.content)
+                self.assertNotIn(b'http://localhost/', response.content)
+
+    def test_requests_with_credentials_bypass_the_cache(self):
+        token = str(AccessToken.for_user(self.author))
+        # Ответ пользователю не сохраняется...
+        self.client.get('/api/v1/posts/home/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/posts/home/')
+        self.assertTrue(queries)
+
+        # ...и не читается из кеша, хотя ответ анонимному посетителю уже сохранен
+        for name, credentials in (
+            ('jwt', {'HTTP_AUTHORIZATION': f'Bearer {token}'}),
+            ('session', {'HTTP_COOKIE': f'{settings.SESSION_COOKIE_NAME}=session'}),
+        ):
+            with self.subTest(credentials=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get('/api/v1/posts/home/', HTTP_ACCEPT_ENCODING='gzip', **credentials)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(queries)
+                self.assertNotIn('Content-Encoding', response)
+
+
+class PinStateTests(TestCase):
+    """Материализованное закрепление: PinnedPost, подписка, статус поста и периодическая сверка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        cls.subscription = Subscription.objects.create(
+            user=cls.author, plan=plan, status='active',
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=10),
+        )
+        cls.post = Post.objects.create(title='Post', slug='post', content='text', author=cls.author)
+
+    def setUp(self):
+        for pattern in ('feed:*', '*cache_tag:*', '*category_feed:*', '*posts:object*'):
+            clear_redis(pattern)
+            self.addCleanup(clear_redis, pattern)
+
+    def pin(self):
+        return PinnedPost.objects.create(user=self.author, post=self.post)
+
+    def state(self):
+        return Post.objects.values_list('is_effectively_pinned', 'pinned_at', 'pin_expires_at').get(pk=self.post.pk)
+
+    def assertPinned(self, pin):
+        self.assertEqual(self.state(), (True, pin.pinned_at, Subscription.objects.get(pk=self.subscription.pk).end_date))
+
+    def assertNotPinned(self):
+        self.assertEqual(self.state(), (False, None, None))
+
+    def test_pin_and_unpin(self):
+        self.assertNotPinned()
+        pin = self.pin()
+        self.assertPinned(pin)
+        pin.delete()
+        self.assertNotPinned()
+
+    def test_unpublished_post_is_not_pinned(self):
+        pin = self.pin()
+        post = Post.objects.get(pk=self.post.pk)
+        post.status = 'draft'
+        post.save()
+        self.assertNotPinned()
+        post.status = 'published'
+        post.save()
+        self.assertPinned(pin)
+
+    def test_subscription_changes(self):
+        pin = self.pin()
+        self.subscription.end_date = timezone.now() + timedelta(days=30)
+        self.subscription.save()
+        self.assertPinned(pin)
+
+        self.subscription.status = 'canceled'
+        self.subscription.save()
+        self.assertNotPinned()
+
+        self.subscription.status = 'active'
+        self.subscription.save()
+        self.assertPinned(pin)
+
+        self.subscription.delete()
+        self.assertNotPinned()
+
+    def test_sweep_unpins_expired_subscriptions(self):
+        self.assertPinned(self.pin())
+        pinned = self.state()
+        # QuerySet.update() не вызывает сигналов: истечение подхватывает только сверка
+        Subscription.objects.filter(pk=self.subscription.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.state(), pinned)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(PinStateService.sweep(), {'updated_posts': 1})
+        self.assertNotPinned()
+        self.assertEqual(PinStateService.sweep(), {'updated_posts': 0})
+
+    def test_refresh_without_changes_skips_the_update(self):
+        self.pin()
+        with self.assertNumQueries(1):
+            self.assertEqual(PinStateService.refresh([self.post.pk]), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(PinStateService.refresh([]), 0)
+
+
+class ViewCounterServiceTests(TestCase):
+    """Буфер просмотров в Redis и перенос в БД ровно один раз"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.post = Post.objects.create(title='Post', slug='post', content='text', author=author)
+        cls.other = Post.objects.create(title='Other', slug='other', content='text', author=author)
+
+    def setUp(self):
+        self.redis = get_redis()
+        clear_redis('post_views:*')
+        self.addCleanup(clear_redis, 'post_views:*')
+
+    def views(self, post):
+        return Post.objects.values_list('views_count', flat=True).get(pk=post.pk)
+
+    def record(self, post, times):
+        for _ in range(times):
+            ViewCounterService.record_view(post.pk)
+
+    def test_views_are_buffered_until_flush(self):
+        self.record(self.post, 3)
+        self.record(self.other, 1)
+        self.assertEqual(self.views(self.post), 0)
+        self.assertEqual(ViewCounterService.pending_for([self.post.pk, self.other.pk]), {self.post.pk: 3, self.other.pk: 1})
+
+        self.assertEqual(ViewCounterService.flush(), {'flushed_posts': 2})
+        self.assertEqual((self.views(self.post), self.views(self.other)), (3, 1))
+        self.assertEqual(ViewCounterService.pending_for([self.post.pk]), {self.post.pk: 0})
+        self.assertFalse(self.redis.smembers(ViewCounterService.BATCHES_KEY))
+
+    def test_leftover_batch_is_applied_on_next_run(self):
+        # Запуск упал после переименования буфера, до записи в БД
+        self.record(self.post, 2)
+        batch_key = f'{ViewCounterService.BATCH_PREFIX}leftover'
+        self.redis.sadd(ViewCounterService.BATCHES_KEY, batch_key)
+        self.redis.rename(ViewCounterService.PENDING_KEY, batch_key)
+        self.record(self.post, 1)
+
+        ViewCounterService.flush()
+        self.assertEqual(self.views(self.post), 3)
+        self.assertFalse(self.redis.exists(batch_key))
+
+    def test_batch_is_not_reapplied_after_crash_past_commit(self):
+        self.record(self.post, 2)
+        # Запуск упал после коммита, до удаления пакета из Redis
+        with mock.patch.object(ViewCounterService, '_drop_batch', side_effect=redis.ConnectionError):
+            with self.assertRaises(redis.ConnectionError):
+                ViewCounterService.flush()
+        self.assertEqual(self.views(self.post), 2)
+        self.assertTrue(self.redis.smembers(ViewCounterService.BATCHES_KEY))
+
+        with self.assertLogs('apps.frontpage.services', 'WARNING'):
+            self.assertEqual(ViewCounterService.flush(), {'flushed_posts': 0})
+        self.assertEqual(self.views(self.post), 2)
+        self.assertFalse(self.redis.smembers(ViewCounterService.BATCHES_KEY))
+
+    def test_overlapping_run_is_skipped(self):
+        self.record(self.post, 2)
+        lock = self.redis.lock(ViewCounterService.FLUSH_LOCK_KEY, timeout=10)
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            self.assertEqual(ViewCounterService.flush(), {'flushed_posts': 0, 'skipped': True})
+        finally:
+            lock.release()
+        self.assertEqual(self.views(self.post), 0)
+
+        ViewCounterService.flush()
+        self.assertEqual(self.views(self.post), 2)
+
+
+class PostDetailConditionalTests(TestCase):
+    """Условный GET поста: 304 без сериализации, но с учетом просмотра"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.post = Post.objects.create(title='Post', slug='post', content='text', author=author)
+
+    def setUp(self):
+        clear_redis('post_views:*')
+        self.addCleanup(clear_redis, 'post_views:*')
+        self.client = APIClient()
+        self.url = f'/api/v1/posts/{self.post.slug}/'
+
+    def pending_views(self):
+        return ViewCounterService.pending_for([self.post.pk])[self.post.pk]
+
+    def test_not_modified_still_counts_the_view(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.pending_views(), 2)
+
+    def test_views_do_not_change_the_validator(self):
+        first = self.client.get(self.url)
+        ViewCounterService.flush()
+        second = self.client.get(self.url)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['views_count'], first.data['views_count'] + 1)
+
+    def test_head_does_not_count(self):
+        self.assertEqual(self.client.head(self.url).status_code, 200)
+        self.assertEqual(self.pending_views(), 0)
+
+
+class FieldsetETagTests(TestCase):
+    """ETag списка и поста зависит от набора полей ?fields= / ?omit="""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.post = Post.objects.create(title='Post', slug='post', content='text', author=author)
+
+    def setUp(self):
+        for pattern in ('post_views:*', '*posts:object*'):
+            clear_redis(pattern)
+            self.addCleanup(clear_redis, pattern)
+        self.client = APIClient()
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertFieldsetETags(self, url):
+        full = self.etag(url)
+        self.assertEqual(self.etag(f'{url}?fields=id,title'), self.etag(f'{url}?fields=title, id,'))
+        self.assertNotEqual(self.etag(f'{url}?fields=id,title'), full)
+        self.assertNotEqual(self.etag(f'{url}?omit=title'), full)
+        self.assertNotEqual(self.etag(f'{url}?fields=title'), self.etag(f'{url}?omit=title'))
+        self.assertEqual(self.etag(f'{url}?fields='), full)
+
+        # Валидатор полного ответа не подходит для ответа с другим набором полей
+        response = self.client.get(f'{url}?fields=id,title', HTTP_IF_NONE_MATCH=full)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=full).status_code, 304)
+        return response
+
+    def test_list(self):
+        response = self.assertFieldsetETags('/api/v1/posts/')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+    def test_detail(self):
+        response = self.assertFieldsetETags(f'/api/v1/posts/{self.post.slug}/')
+        self.assertEqual(set(response.data), {'id', 'title'})
+
+
+class CategoryCounterTests(TestCase):
+    """Category.published_posts_count и версионный кеш списка категорий"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.science = Category.objects.create(name='Наука', slug='science')
+        cls.sport = Category.objects.create(name='Спорт', slug='sport')
+
+    def setUp(self):
+        clear_redis('*categories:*')
+        self.addCleanup(clear_redis, '*categories:*')
+
+    def assertCounts(self, science, sport):
+        self.assertEqual(
+            dict(Category.objects.values_list('slug', 'published_posts_count')),
+            {'science': science, 'sport': sport},
+        )
+
+    def create_post(self, slug, **kwargs):
+        kwargs.setdefault('category', self.science)
+        return Post.objects.create(title=slug, slug=slug, content='текст', author=self.author, **kwargs)
+
+    def test_publish_and_unpublish(self):
+        post = self.create_post('draft', status='draft')
+        self.create_post('published')
+        self.assertCounts(1, 0)
+
+        post.status = 'published'
+        post.save()
+        self.assertCounts(2, 0)
+
+        post.status = 'draft'
+        post.save(update_fields=['status'])
+        self.assertCounts(1, 0)
+
+    def test_delete(self):
+        post = self.create_post('published')
+        self.create_post('draft', status='draft')
+        self.assertCounts(1, 0)
+        Post.objects.get(pk=post.pk).delete()
+        self.assertCounts(0, 0)
+        Post.objects.filter(status='draft').delete()
+        self.assertCounts(0, 0)
+
+    def test_category_change(self):
+        post = self.create_post('published')
+        post.category = self.sport
+        post.save()
+        self.assertCounts(0, 1)
+
+        post.category = None
+        post.save(update_fields=['category'])
+        self.assertCounts(0, 0)
+
+    def test_unrelated_save_keeps_counts(self):
+        post = self.create_post('published')
+        with self.captureOnCommitCallbacks() as callbacks:
+            post.title = 'Новый заголовок'
+            post.save(update_fields=['title'])
+        self.assertCounts(1, 0)
+        self.assertNotIn(CategoryService._bump_version, callbacks)
+
+    def test_reconcile_repairs_drift(self):
+        self.create_post('published')
+        Category.objects.filter(pk=self.science.pk).update(published_posts_count=5)
+        Category.objects.filter(pk=self.sport.pk).update(published_posts_count=2)
+        self.assertEqual(CategoryService.reconcile(), {'fixed_categories': 2})
+        self.assertCounts(1, 0)
+        self.assertEqual(CategoryService.reconcile(), {'fixed_categories': 0})
+
+    def test_list_cache_busted_by_counter_change(self):
+        client = APIClient()
+
+        def counts():
+            response = client.get('/api/v1/posts/categories/')
+            self.assertEqual(response.status_code, 200)
+            return {row['slug']: row['posts_count'] for row in response.data['results']}
+
+        self.assertEqual(counts(), {'science': 0, 'sport': 0})
+        version = cache.get(CategoryService.VERSION_KEY)
+
+        # Кешированный список отдается без запроса категорий
+        with self.assertNumQueries(0):
+            self.assertEqual(counts(), {'science': 0, 'sport': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_post('published')
+        self.assertEqual(cache.get(CategoryService.VERSION_KEY), version + 1)
+        self.assertEqual(counts(), {'science': 1, 'sport': 0})
+
+        # Черновик счетчики не меняет - версия остается прежней
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_post('draft', status='draft')
+        self.assertEqual(cache.get(CategoryService.VERSION_KEY), version + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.filter(pk=self.sport.pk).get().delete()
+        self.assertEqual(counts(), {'science': 1})
+
+
+def make_image(fmt, size, mode='RGB', **save_options):
+    """Небольшое изображение с градиентом в памяти"""
+    width, height = size
+    image = Image.new(mode, size)
+    image.putdata([
+        (x * 255 // width, y * 255 // height, 128, 255 if x < width // 2 else 0)[:len(mode)]
+        for y in range(height) for x in range(width)
+    ])
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **save_options)
+    return buffer.getvalue()
+
+
+class ImagePipelineTests(SimpleTestCase):
+    """Производные изображений: размеры, форматы и blurhash"""
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+
+    def build(self, name, content, widths):
+        self.storage.save(name, ContentFile(content))
+        return build_derivatives(name, widths, storage=self.storage)
+
+    def open(self, name):
+        with self.storage.open(name) as file:
+            image = Image.open(file)
+            image.load()
+        return image
+
+    def test_jpeg_variants(self):
+        variants = self.build('posts/photo.jpg', make_image('JPEG', (800, 600)), (320, 640, 1280))
+        self.assertEqual((variants['source'], variants['width'], variants['height']), ('posts/photo.jpg', 800, 600))
+        # Ширины больше оригинала заменяются размером оригинала, без увеличения
+        self.assertEqual(variants['files'], {
+            'webp': {'320': 'posts/photo.w320.webp', '640': 'posts/photo.w640.webp', '800': 'posts/photo.w800.webp'},
+            'jpeg': {'320': 'posts/photo.w320.jpg', '640': 'posts/photo.w640.jpg', '800': 'posts/photo.w800.jpg'},
+        })
+        for fmt, pillow_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            for width, height in ((320, 240), (640, 480), (800, 600)):
+                image = self.open(variants['files'][fmt][str(width)])
+                self.assertEqual(image.format, pillow_format)
+                self.assertEqual(image.size, (width, height))
+
+    def test_png_with_alpha(self):
+        variants = self.build('avatars/me.png', make_image('PNG', (100, 50), mode='RGBA'), (48, 96, 192))
+        self.assertEqual(sorted(variants['files']['webp']), ['100', '48', '96'])
+        self.assertEqual(self.open(variants['files']['webp']['100']).mode, 'RGBA')
+        # В JPEG прозрачность заменяется белым фоном
+        jpeg = self.open(variants['files']['jpeg']['100'])
+        self.assertEqual((jpeg.mode, jpeg.size), ('RGB', (100, 50)))
+        self.assertTrue(all(channel > 240 for channel in jpeg.getpixel((90, 25))))
+        self.assertEqual(self.open(variants['files']['jpeg']['48']).size, (48, 24))
+
+    def test_exif_orientation_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        variants = self.build('posts/rotated.jpg', make_image('JPEG', (200, 100), exif=exif), (320,))
+        self.assertEqual((variants['width'], variants['height']), (100, 200))
+        self.assertEqual(self.open(variants['files']['webp']['100']).size, (100, 200))
+
+    def test_rebuild_overwrites_files(self):
+        content = make_image('PNG', (64, 48))
+        first = self.build('posts/photo.png', content, (32,))
+        second = build_derivatives('posts/photo.png', (32,), storage=self.storage)
+        self.assertEqual(first, second)
+        self.assertEqual(sorted(self.storage.listdir('posts')[1]), [
+            'photo.png', 'photo.w32.jpg', 'photo.w32.webp',
+        ])
+
+    def test_blurhash_is_stable(self):
+        image = Image.new('RGB', (64, 48))
+        image.putdata([(x * 4, y * 5, 128) for y in range(48) for x in range(64)])
+        self.assertEqual(blurhash_encode(image), 'LzHLF[2swxX8mHWWjtf7gJfjfQfj')
+        red = blurhash_encode(Image.new('RGB', (10, 10), (255, 0, 0)))
+        self.assertEqual(red, 'LWTI:j|cfQ|c|csUfQsUfQfQfQfQ')
+        # Символы 2-6 - средний цвет в sRGB
+        self.assertEqual(sum(BASE83.index(char) * 83 ** (3 - i) for i, char in enumerate(red[2:6])), 0xFF0000)
+        self.assertEqual(
+            self.build('posts/a.png', make_image('PNG', (64, 48)), (32,))['blurhash'],
+            self.build('posts/b.png', make_image('PNG', (64, 48)), (32,))['blurhash'],
+        )
+
+
+@override_settings(POST_IMAGE_WIDTHS=(32, 64), AVATAR_WIDTHS=(16,))
+class ImageDerivativesStorageTests(TransactionTestCase):
+    """Задача и команда backfill_image_derivatives записывают описание производных в модели"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        self.post = Post.objects.create(title='Фото', slug='photo', content='текст', author=self.author)
+        # Файлы назначаются через update(): сигналы не ставят задачу в очередь
+        self.image = default_storage.save('posts/photo.jpg', ContentFile(make_image('JPEG', (80, 60))))
+        Post.objects.filter(pk=self.post.pk).update(image=self.image)
+        self.avatar = default_storage.save('avatars/me.png', ContentFile(make_image('PNG', (20, 20), mode='RGBA')))
+        User.objects.filter(pk=self.author.pk).update(avatar=self.avatar)
+
+    def test_task_stores_variants_once(self):
+        self.assertTrue(generate_post_image_derivatives(self.post.pk))
+        variants = Post.objects.get(pk=self.post.pk).image_variants
+        self.assertEqual((variants['source'], variants['width'], variants['height']), (self.image, 80, 60))
+        self.assertEqual(sorted(variants['files']['webp']), ['32', '64'])
+        self.assertTrue(all(default_storage.exists(name) for name in variants['files']['jpeg'].values()))
+        self.assertFalse(generate_post_image_derivatives(self.post.pk))
+
+    def test_stale_source_not_stored(self):
+        variants = build_derivatives(self.image, (32,))
+        Post.objects.filter(pk=self.post.pk).update(image='posts/other.jpg')
+        self.assertFalse(store_derivatives(Post, self.post.pk, 'image', variants, {}))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).image_variants, {})
+        self.assertFalse(default_storage.exists(variants['files']['webp']['32']))
+
+    def test_backfill_command(self):
+        out = io.StringIO()
+        call_command('backfill_image_derivatives', workers=2, stdout=out)
+        self.assertIn('Производные сохранены: 2 из 2 изображений, ошибок: 0', out.getvalue())
+        self.assertEqual(sorted(Post.objects.get(pk=self.post.pk).image_variants['files']['jpeg']), ['32', '64'])
+        avatar_variants = User.objects.get(pk=self.author.pk).avatar_variants
+        self.assertEqual((avatar_variants['source'], avatar_variants['files']['webp']), (
+            self.avatar, {'16': 'avatars/me.w16.webp'},
+        ))
+
+        out = io.StringIO()
+        call_command('backfill_image_derivatives', stdout=out)
+        self.assertIn('Нет изображений без производных', out.getvalue())
+
+
+@override_settings(TRENDING_WINDOW_HOURS=48, TRENDING_HALF_LIFE_HOURS=6, TRENDING_TOP_K=3)
+class TrendingServiceTests(TestCase):
+    """Популярное сейчас по фиксированным почасовым бакетам"""
+
+    # Середина часа: возраст бакета h - h + 0.5 часа
+    NOW = datetime.datetime(2026, 3, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        cls.science = Category.objects.create(name='Наука', slug='science')
+        cls.sport = Category.objects.create(name='Спорт', slug='sport')
+
+        def create(slug, category, **kwargs):
+            return Post.objects.create(
+                title=slug, slug=slug, content='текст', author=author, category=category, **kwargs
+            )
+
+        cls.fresh = create('fresh', cls.science)
+        cls.half_life_above = create('half-life-above', cls.science)
+        cls.half_life_below = create('half-life-below', cls.sport)
+        cls.old = create('old', cls.science)
+        cls.expired = create('expired', cls.sport)
+        cls.draft = create('draft', cls.sport, status='draft')
+        cls.uncategorized = create('uncategorized', None)
+
+    def setUp(self):
+        for pattern in (f'{TrendingService.BUCKET_PREFIX}*', 'trending:*'):
+            clear_redis(pattern)
+            self.addCleanup(clear_redis, pattern)
+
+    def add_views(self, post, hours_ago, views):
+        get_redis().hincrby(TrendingService.bucket_key(self.NOW - timedelta(hours=hours_ago)), post.pk, views)
+
+    def compute(self):
+        with mock.patch.object(timezone, 'now', return_value=self.NOW):
+            return TrendingService.compute()
+
+    def fill_buckets(self):
+        # Через период полураспада просмотр весит вдвое меньше:
+        # 21 просмотр 6 часов назад чуть больше 10 текущих, 19 - чуть меньше
+        self.add_views(self.fresh, 0, 10)
+        self.add_views(self.half_life_above, 6, 21)
+        self.add_views(self.half_life_below, 6, 19)
+        self.add_views(self.old, 47, 100)
+        self.add_views(self.uncategorized, 30, 1)
+        self.add_views(self.expired, 48, 1000)
+        self.add_views(self.draft, 0, 1000)
+
+    def test_ranking_with_decay(self):
+        self.fill_buckets()
+        self.assertEqual(self.compute(), {'posts': 5, 'categories': 2})
+        self.assertEqual(
+            TrendingService.get_ids(),
+            [self.half_life_above.pk, self.fresh.pk, self.half_life_below.pk],
+        )
+        self.assertEqual(
+            TrendingService.get_ids(self.science.pk),
+            [self.half_life_above.pk, self.fresh.pk, self.old.pk],
+        )
+        self.assertEqual(TrendingService.get_ids(self.sport.pk), [self.half_life_below.pk])
+
+    def test_scores_follow_half_life(self):
+        # 100 * 2^(-47.5 / 6) ≈ 0.4139 лежит между оценками 14 и 15 просмотров
+        # 30 часов назад: 14 * 2^(-30.5 / 6) ≈ 0.4129 и 15 * 2^(-30.5 / 6) ≈ 0.4424
+        self.add_views(self.old, 47, 100)
+        self.add_views(self.fresh, 30, 14)
+        self.add_views(self.uncategorized, 30, 1)
+        self.compute()
+        self.assertEqual(TrendingService.get_ids(), [self.old.pk, self.fresh.pk, self.uncategorized.pk])
+
+        self.add_views(self.fresh, 30, 1)
+        self.compute()
+        self.assertEqual(TrendingService.get_ids(), [self.fresh.pk, self.old.pk, self.uncategorized.pk])
+
+    def test_stale_category_lists_removed(self):
+        self.fill_buckets()
+        self.compute()
+        clear_redis(f'{TrendingService.BUCKET_PREFIX}*')
+        self.add_views(self.fresh, 1, 1)
+        self.assertEqual(self.compute(), {'posts': 1, 'categories': 1})
+        self.assertEqual(TrendingService.get_ids(self.sport.pk), [])
+        self.assertEqual(get_redis().smembers(TrendingService.CATEGORIES_KEY), {str(self.science.pk)})
+
+    def test_queue_view_writes_current_bucket(self):
+        client = get_redis()
+        with mock.patch.object(timezone, 'now', return_value=self.NOW):
+            pipe = client.pipeline()
+            TrendingService.queue_view(pipe, self.fresh.pk)
+            TrendingService.queue_view(pipe, self.fresh.pk)
+            pipe.execute()
+        key = TrendingService.bucket_key(self.NOW)
+        self.assertEqual(key, 'post_views:hour:2026030112')
+        self.assertEqual(client.hget(key, self.fresh.pk), '2')
+        self.assertEqual(client.ttl(key), 49 * 3600)
+
+    def test_trending_view(self):
+        self.fill_buckets()
+        self.compute()
+        Post.objects.filter(pk=self.fresh.pk).update(status='draft')
+
+        def slugs(**params):
+            response = APIClient().get('/api/v1/posts/trending/', params)
+            self.assertEqual(response.status_code, 200)
+            return [row['slug'] for row in response.data]
+
+        # Снятый с публикации после пересчета пост не отдается
+        self.assertEqual(slugs(), ['half-life-above', 'half-life-below'])
+        self.assertEqual(slugs(category='science'), ['half-life-above', 'old'])
+        self.assertEqual(slugs(category=str(self.sport.pk)), ['half-life-below'])
+        self.assertEqual(APIClient().get('/api/v1/posts/trending/', {'category': 'missing'}).status_code, 404)
+
+
+class ExcerptTests(TestCase):
+    """Анонс поста: обрезка по границе слова, обновление при правке и заполнение командой"""
+
+    LENGTH = Post.EXCERPT_LENGTH
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+
+    def create_post(self, slug, content):
+        return Post.objects.create(title=slug, slug=slug, content=content, author=self.author)
+
+    def test_make_excerpt(self):
+        words = 'слово ' * 40
+        cases = {
+            'Короткий текст': 'Короткий текст',
+            'а' * self.LENGTH: 'а' * self.LENGTH,
+            # Недописанное слово отбрасывается вместе с пробелами перед ним
+            words: 'слово ' * 32 + 'слово...',
+            'а' * 195 + '  бвгдежз': 'а' * 195 + '...',
+            # Пробел сразу после границы - слово дописано целиком
+            'а' * self.LENGTH + ' хвост': 'а' * self.LENGTH + '...',
+            'а' * 199 + ' \nхвост': 'а' * 199 + '...',
+            # Одно длинное слово режется по длине
+            'а' * 300: 'а' * self.LENGTH + '...',
+        }
+        for content, expected in cases.items():
+            with self.subTest(content=content[-20:]):
+                self.assertEqual(Post.make_excerpt(content), expected)
+                self.assertLessEqual(len(Post.make_excerpt(content)), self.LENGTH + 3)
+
+    def test_expression_matches_python(self):
+        contents = [
+            'Короткий текст', 'а' * self.LENGTH, 'слово ' * 40, 'а' * 195 + '  бвгдежз',
+            'а' * self.LENGTH + ' хвост', 'а' * 199 + '\tхвост', 'а' * 300, '',
+            ' ' + 'б' * 250, 'Многострочный\nтекст. ' * 20,
+        ]
+        posts = [self.create_post(f'post-{i}', content) for i, content in enumerate(contents)]
+        expected = {post.pk: Post.make_excerpt(post.content) for post in posts}
+        self.assertEqual(
+            dict(Post.objects.annotate(value=Post.excerpt_expression()).values_list('pk', 'value')),
+            expected,
+        )
+        self.assertEqual(dict(Post.objects.values_list('pk', 'excerpt')), expected)
+
+    def test_excerpt_follows_content_edits(self):
+        post = self.create_post('post', 'Первая версия')
+        post.content = 'Вторая версия ' * 20
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, Post.make_excerpt('Вторая версия ' * 20))
+
+        post.content = 'Третья версия'
+        post.save(update_fields=['content'])
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, 'Третья версия')
+
+        # Без загруженного контента анонс не пересчитывается и не затирается
+        post = Post.objects.defer('content').get(pk=post.pk)
+        post.title = 'Новый заголовок'
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, 'Третья версия')
+
+    def test_list_serves_excerpt_without_content(self):
+        self.create_post('post', 'слово ' * 100)
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get('/api/v1/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['content'], 'слово ' * 32 + 'слово...')
+        self.assertFalse([query for query in queries if '"posts"."content"' in query['sql']])
+
+    def test_backfill_command(self):
+        posts = [self.create_post(f'post-{i}', 'слово ' * (i * 20)) for i in range(5)]
+        Post.objects.filter(pk__in=[post.pk for post in posts[:3]]).update(excerpt='')
+        Post.objects.filter(pk=posts[3].pk).update(excerpt='устаревший анонс')
+
+        out = io.StringIO()
+        call_command('backfill_excerpts', chunk_size=2, stdout=out)
+        # Пустой контент (post-0) не заполняется, заполненные анонсы не трогаются
+        self.assertIn('Анонсы обновлены: 2 постов', out.getvalue())
+        self.assertEqual(Post.objects.get(pk=posts[3].pk).excerpt, 'устаревший анонс')
+
+        out = io.StringIO()
+        call_command('backfill_excerpts', chunk_size=2, all=True, stdout=out)
+        self.assertIn('Анонсы обновлены: 5 постов', out.getvalue())
+        self.assertEqual(
+            dict(Post.objects.values_list('pk', 'excerpt')),
+            {post.pk: Post.make_excerpt(post.content) for post in posts},
+        )
+
+
+class PostSearchTests(TestCase):
+    """Полнотекстовый поиск: ранжирование, подсветка, доступ к черновикам и обновление вектора"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        other = User.objects.create_user(email='other@example.com', username='other', password='x')
+        cls.in_content = Post.objects.create(
+            title='Новости недели', slug='week', author=cls.author,
+            content='Среди прочего - новые ракеты и спутники.',
+        )
+        cls.in_title = Post.objects.create(
+            title='Ракеты нового поколения', slug='rockets', author=cls.author,
+            content='Двигатели, топливо и запуски ракет.',
+        )
+        cls.own_draft = Post.objects.create(
+            title='Черновик про ракету', slug='own-draft', content='текст', author=cls.author, status='draft',
+        )
+        Post.objects.create(
+            title='Чужой черновик про ракеты', slug='other-draft', content='текст', author=other, status='draft',
+        )
+        Post.objects.create(title='Погода', slug='weather', content='Дожди и ветер.', author=other)
+
+    def search(self, q, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        response = client.get('/api/v1/posts/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_results_ranked_with_title_first(self):
+        results = self.search('ракета')
+        self.assertEqual([row['id'] for row in results], [self.in_title.pk, self.in_content.pk])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+
+    def test_headline_marks_matches_in_content(self):
+        results = {row['id']: row for row in self.search('ракеты')}
+        self.assertIn('<mark>ракеты</mark>', results[self.in_content.pk]['headline'])
+        self.assertEqual(
+            re.findall(r'<mark>(.*?)</mark>', results[self.in_title.pk]['headline']), ['ракет'],
+        )
+
+    def test_drafts_only_for_their_author(self):
+        self.assertNotIn(self.own_draft.pk, [row['id'] for row in self.search('ракета')])
+        self.assertEqual(
+            sorted(row['id'] for row in self.search('ракета', user=self.author)),
+            sorted([self.in_title.pk, self.in_content.pk, self.own_draft.pk]),
+        )
+
+    def test_empty_query(self):
+        self.assertEqual(self.search(' '), [])
+
+    def test_vector_follows_title_and_content_edits(self):
+        post = Post.objects.get(pk=self.in_content.pk)
+        post.title = 'Обзор телескопов'
+        post.content = 'Зеркала и линзы.'
+        post.save()
+        self.assertEqual([row['id'] for row in self.search('телескоп')], [post.pk])
+        self.assertEqual([row['id'] for row in self.search('ракета')], [self.in_title.pk])
+
+        post.content = 'Новые орбитальные станции.'
+        post.save(update_fields=['content'])
+        self.assertEqual([row['id'] for row in self.search('станция')], [post.pk])
+
+        # Сохранение без title и content вектор не пересчитывает
+        with CaptureQueriesContext(connection) as queries:
+            post.save(update_fields=['status'])
+        self.assertFalse([query for query in queries if 'search_vector' in query['sql']])
+
+
+class BackfillSearchVectorsTests(TransactionTestCase):
+    """Команда заполняет пустые векторы порциями в отдельных соединениях"""
+
+    def test_fills_empty_vectors(self):
+        author = User.objects.create_user(email='author@example.com', username='author', password='x')
+        posts = [
+            Post.objects.create(title=f'Ракета {i}', slug=f'post-{i}', content='текст', author=author)
+            for i in range(5)
+        ]
+        Post.objects.filter(pk__in=[post.pk for post in posts[1:]]).update(search_vector=None)
+
+        out = io.StringIO()
+        call_command('backfill_search_vectors', chunk_size=2, workers=2, stdout=out)
+        self.assertIn('4 постов', out.getvalue())
+        self.assertFalse(Post.objects.filter(search_vector__isnull=True).exists())
+        self.assertEqual(Post.objects.filter(search_vector=build_search_query('ракета')).count(), 5)
+
+
+class AutocompleteTests(TestCase):
+    """Подсказки авторов не раскрывают пользователей без опубликованных постов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.writer = User.objects.create_user(email='bobby@example.com', username='bobby', password='x')
+        cls.drafter = User.objects.create_user(email='bobcat@example.com', username='bobcat', password='x')
+        User.objects.create_user(email='bob@example.com', username='bob', password='x')
+        Post.objects.create(title='Published', slug='published', content='text', author=cls.writer)
+        Post.objects.create(title='Draft', slug='draft', content='text', author=cls.drafter, status='draft')
+
+    def setUp(self):
+        clear_redis('*autocomplete:*')
+        self.addCleanup(clear_redis, '*autocomplete:*')
+
+    def test_only_authors_of_published_posts_are_suggested(self):
+        response = APIClient().get('/api/v1/posts/autocomplete/?q=bob')
+        self.assertEqual(response.status_code, 200)
+        authors = [item['username'] for item in response.data['results'] if item['type'] == 'author']
+        self.assertEqual(authors, ['bobby'])
+
+
+@override_settings(AUTOCOMPLETE_STATEMENT_TIMEOUT=200)
+class AutocompleteLookupTests(TestCase):
+    """Префикс, триграммное сходство и ограничение времени запроса подсказок"""
+
+    FIELDS = ('id', 'name', 'slug')
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Science', 'Sciences', 'Space', 'Sports'):
+            Category.objects.create(name=name, slug=name.lower())
+
+    def lookup(self, query, limit, queryset=None):
+        queryset = Category.objects.all() if queryset is None else queryset
+        return AutocompleteService._lookup(queryset, 'name', self.FIELDS, query, limit)
+
+    def statement_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            return cursor.fetchone()[0]
+
+    def has_trigram_extension(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            return cursor.fetchone() is not None
+
+    def test_prefix_matches_skip_trigram_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            found = self.lookup('sci', 2)
+        self.assertEqual([(row['name'], row['score']) for row in found], [('Science', 2.0), ('Sciences', 2.0)])
+        self.assertFalse([query for query in queries if 'SIMILARITY' in query['sql']])
+
+    def test_short_prefix_falls_back_to_trigrams(self):
+        with CaptureQueriesContext(connection) as queries:
+            found = self.lookup('sci', 3)
+        # Без pg_trgm запрос сходства падает, но найденное по префиксу остается
+        self.assertEqual([row['name'] for row in found[:2]], ['Science', 'Sciences'])
+        similarity = [query['sql'] for query in queries if 'SIMILARITY' in query['sql']]
+        self.assertEqual(len(similarity), 1)
+        self.assertIn('NOT ("categories"."id" IN', similarity[0])
+
+    def test_trigram_similarity_finds_typos(self):
+        if not self.has_trigram_extension():
+            self.skipTest('pg_trgm не установлено')
+        found = self.lookup('scienses', 3)
+        self.assertEqual({row['name'] for row in found[:2]}, {'Science', 'Sciences'})
+        self.assertTrue(all(row['score'] < 2.0 for row in found))
+        self.assertNotIn('Sports', [row['name'] for row in found])
+
+    def test_statement_timeout_is_local_to_lookup(self):
+        before = self.statement_timeout()
+        with CaptureQueriesContext(connection) as queries:
+            self.lookup('sci', 2)
+        self.assertTrue([query for query in queries if "set_config('statement_timeout', '200', true)" in query['sql']])
+        self.assertEqual(self.statement_timeout(), before)
+
+    def test_slow_lookup_is_cancelled(self):
+        before = self.statement_timeout()
+        slow = Category.objects.extra(where=['(SELECT true FROM pg_sleep(2))'])
+        with self.assertLogs('apps.frontpage.services', 'WARNING') as logs:
+            self.assertEqual(self.lookup('sci', 2, slow), [])
+        self.assertIn('Autocomplete lookup on categories aborted', logs.output[0])
+        # Отмена откатывает только точку сохранения: соединение и прежний лимит на месте
+        self.assertEqual(self.statement_timeout(), before)
+        self.assertEqual(Category.objects.count(), 4)
+
+    def test_suggest_keeps_sources_that_finished(self):
+        clear_redis('*autocomplete:*')
+        self.addCleanup(clear_redis, '*autocomplete:*')
+        sources = [
+            ('post', Post.objects.extra(where=['(SELECT true FROM pg_sleep(2))']), 'title', ('id', 'title', 'slug')),
+            ('category', Category.objects.all(), 'name', self.FIELDS),
+        ]
+        with mock.patch.object(AutocompleteService, '_sources', return_value=sources):
+            with self.assertLogs('apps.frontpage.services', 'WARNING'):
+                results = AutocompleteService.suggest('Sp')
+        self.assertEqual([(row['type'], row['name']) for row in results], [('category', 'Space'), ('category', 'Sports')])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], READ_YOUR_WRITES_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Выбор базы для чтения: реплика для безопасных запросов, мастер после записи"""
+
+    def setUp(self):
+        ReplicaPool.reset()
+        self.addCleanup(ReplicaPool.reset)
+
+    def route(self, request, write=False):
+        """База, с которой прочитал бы пост в этом запросе, и ответ middleware"""
+        routed = {}
+
+        def view(request):
+            if write:
+                router.db_for_write(Post)
+            routed['read'] = router.db_for_read(Post)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(lambda request: (
+            middleware.process_view(request, view, (), {}) or view(request)
+        ))
+        request.resolver_match = resolve(request.path)
+        response = middleware(request)
+        return routed['read'], response
+
+    @mock.patch.object(ReplicaPool, 'lag', return_value=0.5)
+    def test_safe_request_reads_from_replica(self, lag):
+        read, _ = self.route(RequestFactory().get('/api/v1/posts/'))
+        self.assertEqual(read, 'replica_1')
+
+    @mock.patch.object(ReplicaPool, 'lag', return_value=0.5)
+    def test_write_pins_to_primary(self, lag):
+        read, response = self.route(RequestFactory().post('/api/v1/posts/'), write=True)
+        self.assertEqual(read, 'default')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        request = RequestFactory().get('/api/v1/posts/')
+        request.COOKIES[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        read, _ = self.route(request)
+        self.assertEqual(read, 'default')
+
+    @mock.patch.object(ReplicaPool, 'lag', return_value=60.0)
+    def test_lagging_replica_is_ejected(self, lag):
+        with self.assertLogs('config.db_router', 'WARNING'):
+            read, _ = self.route(RequestFactory().get('/api/v1/posts/'))
+        self.assertEqual(read, 'default')
+
+
+class AtomicWritesHandler(AtomicWritesHandlerMixin, BaseHandler):
+    pass
+
+
+class AtomicWritesTests(TestCase):
+    """Транзакция вокруг представления: только для записи, с откатом при ошибке"""
+
+    def wrap(self, view):
+        return AtomicWritesHandler().make_view_atomic(view)
+
+    def test_only_unsafe_methods_run_in_a_transaction(self):
+        depth = {}
+
+        def view(request):
+            depth[request.method] = len(connection.atomic_blocks)
+            return HttpResponse()
+
+        outside = len(connection.atomic_blocks)
+        atomic_view = self.wrap(view)
+        for method in ('get', 'head', 'options', 'post', 'put', 'patch', 'delete'):
+            atomic_view(getattr(RequestFactory(), method)('/'))
+        self.assertEqual(depth, {
+            'GET': outside, 'HEAD': outside, 'OPTIONS': outside,
+            'POST': outside + 1, 'PUT': outside + 1, 'PATCH': outside + 1, 'DELETE': outside + 1,
+        })
+
+    def test_exception_rolls_back_before_it_leaves_the_view(self):
+        def view(request):
+            Category.objects.create(name='Rolled back', slug='rolled-back')
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            self.wrap(view)(RequestFactory().post('/'))
+        self.assertFalse(Category.objects.filter(slug='rolled-back').exists())
+
+    def test_handled_drf_error_rolls_back(self):
+        @api_view(['POST'])
+        @permission_classes([AllowAny])
+        def view(request):
+            Category.objects.create(name='Rolled back', slug='rolled-back')
+            raise ValidationError('invalid')
+
+        response = self.wrap(view)(APIRequestFactory().post('/'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Category.objects.filter(slug='rolled-back').exists())
+
+    def test_successful_write_is_kept(self):
+        @api_view(['POST'])
+        @permission_classes([AllowAny])
+        def view(request):
+            Category.objects.create(name='Kept', slug='kept')
+            return Response(status=201)
+
+        self.assertEqual(self.wrap(view)(APIRequestFactory().post('/')).status_code, 201)
+        self.assertTrue(Category.objects.filter(slug='kept').exists())
+
+    def test_non_atomic_and_async_views_are_not_wrapped(self):
+        @transaction.non_atomic_requests
+        def view(request):
+            return HttpResponse()
+
+        self.assertIs(self.wrap(view), view)
+        # Асинхронные представления открывают транзакцию для записи сами
+        detail = resolve('/api/v1/posts/some-post/').func
+        self.assertIs(self.wrap(detail), detail)
+
+
+@override_settings(ASGI_MAX_CONCURRENT_REQUESTS=2)
+class BoundedASGIHandlerTests(SimpleTestCase):
+    """Не больше ASGI_MAX_CONCURRENT_REQUESTS запросов одновременно, остальные ждут"""
+
+    def test_overflow_waits_for_a_free_slot(self):
+        state = {'active': 0, 'peak': 0, 'started': 0}
+
+        async def run_get_response(handler, request):
+            state['active'] += 1
+            state['started'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            await release.wait()
+            state['active'] -= 1
+            return HttpResponse('ok')
+
+        async def request(handler, sent):
+            received = []
+
+            async def receive():
+                if not received:
+                    received.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Клиент не отключается
+                await asyncio.Event().wait()
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': []}
+            await handler(scope, receive, send)
+
+        async def scenario():
+            handler = BoundedASGIHandler()
+            sent = []
+            tasks = [asyncio.create_task(request(handler, sent)) for _ in range(5)]
+            async def slots_taken():
+                while state['started'] < 2:
+                    await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(slots_taken(), timeout=5)
+            await asyncio.sleep(0.1)
+            # Два запроса в работе, три ждут места
+            waiting = state['started']
+            release.set()
+            await asyncio.gather(*tasks)
+            return waiting, sent
+
+        with mock.patch.object(ASGIHandler, 'run_get_response', run_get_response):
+            release = asyncio.Event()
+            waiting, sent = async_to_sync(scenario)()
+
+        self.assertEqual(waiting, 2)
+        self.assertEqual(state['peak'], 2)
+        self.assertEqual(state['started'], 5)
+        statuses = [message['status'] for message in sent if message['type'] == 'http.response.start']
+        self.assertEqual(statuses, [200] * 5)
+
+
+class RendererTests(TestCase):
+    """orjson совпадает с JSONRenderer байт в байт; MessagePack - те же данные по Accept"""
+
+    data = {
+        'decimal': Decimal('12.50'),
+        'aware': datetime.datetime(2024, 5, 1, 10, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'offset': datetime.datetime(2024, 5, 1, 10, 30, tzinfo=datetime.timezone(timedelta(hours=3))),
+        'naive': datetime.datetime(2024, 5, 1, 10, 30),
+        'date': datetime.date(2024, 5, 1),
+        'time': datetime.time(10, 30, 15),
+        'duration': timedelta(minutes=90),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'text': 'Привет \u2028 мир',
+        'nested': [{'id': 1, 'tags': ('a', 'b')}, None, True, 1.5],
+        'big': 2 ** 70,
+    }
+
+    def test_orjson_matches_json_renderer(self):
+        data = {key: value for key, value in self.data.items() if key != 'big'}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # Целые больше 64 бит orjson не кодирует: ответ собирает стандартный кодировщик
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_orjson_round_trip(self):
+        parsed = ORJSONParser().parse(io.BytesIO(ORJSONRenderer().render(self.data)))
+        self.assertEqual(parsed['decimal'], 12.5)
+        self.assertEqual(parsed['aware'], '2024-05-01T10:30:15.123456Z')
+        self.assertEqual(parsed['offset'], '2024-05-01T10:30:00+03:00')
+        self.assertEqual(parsed['uuid'], '12345678-1234-5678-1234-567812345678')
+        self.assertEqual(parsed['big'], 2 ** 70)
+
+    def test_msgpack_matches_json_values(self):
+        # MessagePack кодирует целые не длиннее 64 бит
+        data = {key: value for key, value in self.data.items() if key != 'big'}
+        unpacked = msgpack.unpackb(MessagePackRenderer().render(data), raw=False)
+        self.assertEqual(unpacked, json.loads(JSONRenderer().render(data)))
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(MessagePackRenderer().render(data))), unpacked)
+
+    def test_parsers(self):
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO('{"title": "Пост"}'.encode('cp1251')), parser_context={'encoding': 'cp1251'}),
+            {'title': 'Пост'},
+        )
+        for parser, body in ((ORJSONParser(), b'{"title": '), (MessagePackParser(), b'\xc1')):
+            with self.subTest(parser=type(parser).__name__):
+                with self.assertRaises(ParseError):
+                    parser.parse(io.BytesIO(body))
+
+    def test_content_negotiation(self):
+        clear_redis('*response:*')
+        self.addCleanup(clear_redis, '*response:*')
+        client = APIClient()
+        json_response = client.get('/api/v1/posts/categories/')
+        packed = client.get('/api/v1/posts/categories/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(json_response['Content-Type'], 'application/json')
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content, raw=False), json.loads(json_response.content))
+
+    def test_request_bodies(self):
+        user = User.objects.create_user(email='author@example.com', username='author', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        body = {'name': 'Наука', 'description': 'Статьи'}
+        for content_type, content in (
+            ('application/json', json.dumps(body).encode('utf-8')),
+            ('application/msgpack', msgpack.packb(body)),
+        ):
+            with self.subTest(content_type=content_type):
+                response = client.post('/api/v1/posts/categories/', content, content_type=content_type)
+                self.assertEqual(response.status_code, 201, response.content)
+                self.assertEqual(response.data['name'], body['name'])
+                Category.objects.all().delete()
@@ -14,6 +14,11 @@ urlpatterns = [
     path("pinned/", views.pinned_posts_only, name="pinned-posts-only"),
     path("featured/", views.featured_posts, name="featured-posts"),
     path("recent/", views.recent_posts, name="recent-posts"),
+    path("home/", views.home, name="posts-home"),
+    path("batch/", views.posts_batch, name="posts-batch"),
+    path("trending/", views.trending_posts, name="trending-posts"),
+    path("search/", views.PostSearchView.as_view(), name="post-search"),
+    path("autocomplete/", views.autocomplete, name="post-autocomplete"),
     path("<slug:slug>/", views.PostDetailView.as_view(), name="post-detail"),
     
 ]
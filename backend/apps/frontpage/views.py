@@ -1,26 +1,45 @@
+from adrf import generics as async_generics
+from adrf.decorators import api_view as async_api_view
+from adrf.shortcuts import aget_object_or_404
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.contrib.postgres.search import SearchHeadline, SearchRank
+from django.db import transaction
+from django.db.models import Q, F
 from django.shortcuts import get_object_or_404
 
 from django.utils import timezone
+from django.utils.http import http_date
 from datetime import timedelta
-    
+
+from config.batch import batch_ids, batch_response
+from config.cache import cache_response
+from config.conditional import ConditionalListMixin, make_etag, not_modified_response
+from config.fieldsets import QuerysetOptimizationMixin, optimize_queryset, requested_fieldset, selected_field_names
+from config.pagination import KeysetCursorPagination
 from .models import Category, Post
+from .services import (
+    AutocompleteService, CategoryFeedService, CategoryService, FeedIndex, HomeService, PostBatchService,
+    PostVersionService, TrendingService, ViewCounterService,
+)
+from .filters import FullTextSearchFilter, build_search_query
 from apps.subscribe.models import PinnedPost
 
 from .serializers import (
     CategorySerializer,
     PostListSerializer,
+    PostListRowSerializer,
     PostDetailSerializer,
-    PostCreateUpdateSerializer
+    PostCreateUpdateSerializer,
+    PostSearchSerializer,
 )
 from .permissions import IsAuthorOrReadOnly
 
 
-class CategoryListCreateView(generics.ListCreateAPIView):
+class CategoryListCreateView(QuerysetOptimizationMixin, generics.ListCreateAPIView):
     """API endpoint для категорий"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -30,8 +49,21 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
+    def list(self, request, *args, **kwargs):
+        """Список без поиска и сортировки отдается из версионного кеша"""
+        if {'search', 'ordering'} & set(request.query_params):
+            return super().list(request, *args, **kwargs)
+
+        data = CategoryService.get_list(
+            lambda: self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
+        )
+        page = self.paginate_queryset(data)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(data)
+
 
-class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CategoryDetailView(QuerysetOptimizationMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint для конкретной категории"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -39,62 +71,107 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = 'slug'
 
 
-class PostListCreateView(generics.ListCreateAPIView):
+class PostListCreateView(QuerysetOptimizationMixin, ConditionalListMixin, generics.ListCreateAPIView):
     """
     API endpoint для постов c поддержкой закрепленных постов.
     Закрепленные посты отображаются первыми в порядке закрепления.
     """
     serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'author', 'status']
     search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at', 'views_count', 'title']
     ordering = ['-created_at']
+    pagination_class = KeysetCursorPagination
+    etag_fields = ('pk', 'updated_at', 'comments_count', 'is_effectively_pinned', 'image_variants')
+    FEED_INDEX_PARAMS = {'cursor', 'page', 'page_size', 'ordering', 'fields', 'omit'}
 
     def get_queryset(self):
         """Возвращает посты с учетом прав доступа"""
 
-        queryset = Post.objects.select_related('author', 'category')
-
         # фильтрация по правам доступа
         if not self.request.user.is_authenticated:
-            queryset = queryset.filter(status='published')
+            access = Q(status='published')
         else:
-            queryset = queryset.filter(
-                Q(status='published') | Q(author=self.request.user)
-            )
+            access = Q(status='published') | Q(author=self.request.user)
+
+        if self.show_pinned_first():
+            if self.can_use_feed_index():
+                return Post.get_posts_for_feed()
+            return Post.objects.feed_queryset().filter(access).select_related('author', 'category').defer('content')
+
+        return Post.objects.select_related('author', 'category').defer('content').filter(access)
 
-        # Проверяем, нужна ли сортировка с учетом закрепленных постов
+    def show_pinned_first(self):
+        """Проверяем, нужна ли сортировка с учетом закрепленных постов"""
         ordering = self.request.query_params.get('ordering', '')
-        show_pinned_first = not ordering or ordering in ['-created_at', 'created_at']
-        
-        if show_pinned_first:
-            return Post.get_posts_for_feed().filter(
-                Q(status='published') | (
-                    Q(author=self.request.user) if self.request.user.is_authenticated else Q()
-                )
-            )
+        return not ordering or ordering in ['-created_at', 'created_at']
+
+    def can_use_feed_index(self):
+        """
+        Индекс ленты содержит только опубликованные посты в порядке от новых,
+        поэтому используется без фильтров и поиска, с сортировкой по умолчанию
+        и для пользователей без собственных черновиков. Пагинация и выбор
+        полей (FEED_INDEX_PARAMS) на состав ленты не влияют.
+        """
+        if set(self.request.query_params) - self.FEED_INDEX_PARAMS:
+            return False
+        if self.request.query_params.get('ordering', '') not in ('', '-created_at'):
+            return False
+        user = self.request.user
+        if user.is_authenticated:
+            return not Post.objects.filter(author=user).exclude(status='published').exists()
+        return True
 
+    def filter_queryset(self, queryset):
+        if not isinstance(queryset, FeedIndex):
+            queryset = super().filter_queryset(queryset)
+        if self.use_row_serializer():
+            rows = PostListRowSerializer.rows
+            if isinstance(queryset, FeedIndex):
+                queryset.queryset = rows(queryset.queryset, self.request, keep=self.etag_fields)
+            else:
+                queryset = rows(queryset, self.request, keep=self.etag_fields)
         return queryset
-    
+
+    def use_row_serializer(self):
+        """Чтение ленты идет быстрым путем по строкам .values()"""
+        return self.request.method in ('GET', 'HEAD') and PostListRowSerializer.enabled()
+
+    def get_pinned_section(self, queryset):
+        """Закрепленные посты для начала первой страницы (путь без индекса ленты)"""
+        if not self.show_pinned_first():
+            return []
+        return queryset.filter(is_effectively_pinned=True).order_by('-pinned_at')
+
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return PostCreateUpdateSerializer
+        if self.use_row_serializer():
+            return PostListRowSerializer
         return PostListSerializer
     
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        # Считаем по объектам: поле is_pinned может быть исключено из ответа (?fields=)
+        self.pinned_count = sum(1 for post in page or [] if post.is_effectively_pinned)
+        return page
+
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
 
         # Статистика закрепленных постов
         if hasattr(response, 'data') and 'results' in response.data:
-            pinned_count = sum(1 for post in response.data['results'] if post.get('is_pinned', False))
-            response.data['pinned_posts_count'] = pinned_count
+            response.data['pinned_posts_count'] = self.pinned_count
         
         return response
 
-class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
-    """API endpoint для конкретного поста"""
+class PostDetailView(QuerysetOptimizationMixin, async_generics.RetrieveUpdateDestroyAPIView):
+    """
+    API endpoint для конкретного поста.
+    Чтение асинхронное; изменение и удаление идут синхронным путем DRF в транзакции.
+    """
     queryset = Post.objects.select_related('author', 'category')
     serializer_class = PostDetailSerializer
     permission_classes = [IsAuthorOrReadOnly]
@@ -104,118 +181,242 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
         if self.request.method in ['PUT', 'PATCH']:
             return PostCreateUpdateSerializer
         return PostDetailSerializer
-    
-    def retrieve(self, request, *args, **kwargs):
-        """Увеличивает счетчик просмотров при GET запросе"""
-        instance = self.get_object()
 
-        if request.method == 'GET':
-            instance.increment_views()
+    async def put(self, request, *args, **kwargs):
+        return await sync_to_async(transaction.atomic(self.update))(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await sync_to_async(transaction.atomic(self.partial_update))(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await sync_to_async(transaction.atomic(self.destroy))(request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """
+        Увеличивает счетчик просмотров при GET запросе, в том числе при ответе 304.
+        Если клиент уже держит текущую версию поста, отвечает 304 без сериализации.
+        """
+        state = await PostVersionService.aget_state(**{self.lookup_field: kwargs[self.lookup_field]})
+        if state is not None:
+            if request.method == 'GET':
+                # Повторное открытие из кеша клиента - тоже просмотр
+                await sync_to_async(ViewCounterService.record_view)(state['pk'])
+            etag, last_modified = self.get_validators(state)
+            not_modified = not_modified_response(
+                request, etag=etag, last_modified=int(last_modified.timestamp())
+            )
+            if not_modified is not None:
+                return not_modified
+
+        instance = await self.aget_object()
+        response = Response(await serializer_data(self.get_serializer(instance)))
+        if state is not None:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
 
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+    def get_validators(self, state):
+        """
+        Слабый ETag и Last-Modified по состоянию поста. views_count в валидатор
+        не входит: он меняется с каждым просмотром, и 304 может оставить
+        клиенту устаревшее число просмотров.
+        """
+        can_pin_state = self.request.user.pk == state['author_id'] and state['author_subscribed']
+        etag = make_etag(
+            state['pk'], state['updated_at'], state['comments_count'], state['last_comment_at'],
+            state['pinned_at'], state['image_variants'].get('source'), can_pin_state,
+            self.request.accepted_media_type, requested_fieldset(self.request), weak=True,
+        )
+        return etag, PostVersionService.last_modified(state)
     
-class MyPostsView(generics.ListAPIView):
+class MyPostsView(QuerysetOptimizationMixin, ConditionalListMixin, generics.ListAPIView):
     """API endpoint для постов текущего пользователя"""
     serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'status']
     search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at', 'views_count', 'title']
     ordering = ['-created_at']
+    pagination_class = KeysetCursorPagination
+    etag_fields = ('pk', 'updated_at', 'comments_count', 'image_variants')
 
     def get_queryset(self):
         return Post.objects.filter(
             author=self.request.user
-        ).select_related('author', 'category')
+        ).select_related('author', 'category').defer('content')
     
 
+class PostSearchView(QuerysetOptimizationMixin, generics.ListAPIView):
+    """
+    Полнотекстовый поиск по постам (?q=): результаты по убыванию ts_rank
+    с подсвеченными фрагментами контента.
+    """
+    serializer_class = PostSearchSerializer
+    permission_classes = [permissions.AllowAny]
+    search_param = 'q'
+
+    def get_queryset(self):
+        text = self.request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not text:
+            return Post.objects.none()
+
+        if self.request.user.is_authenticated:
+            access = Q(status='published') | Q(author=self.request.user)
+        else:
+            access = Q(status='published')
+
+        query = build_search_query(text)
+        return Post.objects.filter(access, search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                'content',
+                query,
+                config=Post.SEARCH_CONFIG,
+                start_sel='<mark>',
+                stop_sel='</mark>',
+                max_fragments=2,
+            ),
+        ).select_related('author', 'category').defer('content').order_by('-rank', '-id')
+
+
+async def post_list_data(queryset, request, limit=None):
+    """Данные PostListSerializer для списка: быстрым путем по строкам, если он включен"""
+    if PostListRowSerializer.enabled():
+        serializer_class = PostListRowSerializer
+        queryset = PostListRowSerializer.rows(queryset, request)
+    else:
+        serializer_class = PostListSerializer
+        queryset = optimize_queryset(queryset, PostListSerializer, request)
+    if limit is not None:
+        queryset = queryset[:limit]
+    items = [item async for item in queryset]
+    return await serializer_data(serializer_class(items, many=True, context={'request': request}))
+
+
+async def serializer_data(serializer):
+    """serializer.data вне цикла событий: поля сериализаторов читают БД и Redis"""
+    return await sync_to_async(lambda: serializer.data)()
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
-def post_by_category(request, category_slug):
-    """Посты определенной категории"""
-    category = get_object_or_404(Category, slug=category_slug)
-    
-    # Получаем посты с учетом закрепления
-    # Используем менеджер модели для получения with_subscription_info
-    posts = Post.objects.with_subscription_info().filter(
-        category=category,
-        status='published'
-    )
-    
-    # Сортируем с учетом закрепленных постов
-    # Используем сложную аннотацию для правильной сортировки
-    from django.db.models import Case, When, Value, DateTimeField, BooleanField
-    from django.utils import timezone
-    
-    posts = posts.annotate(
-        effective_date=Case(
-            When(
-                pin_info__isnull=False,
-                pin_info__user__subscription__status='active',
-                pin_info__user__subscription__end_date__gt=timezone.now(),
-                then='pin_info__pinned_at'
-            ),
-            default='created_at',
-            output_field=DateTimeField()
-        ),
-        is_pinned_flag=Case(
-            When(
-                pin_info__isnull=False,
-                pin_info__user__subscription__status='active',
-                pin_info__user__subscription__end_date__gt=timezone.now(),
-                then=Value(True)
-            ),
-            default=Value(False),
-            output_field=BooleanField()
-        )
-    ).order_by('-is_pinned_flag', 'effective_date', '-created_at')
-    
-    serializer = PostListSerializer(posts, many=True, context={'request': request})
-    
+def autocomplete(request):
+    """Подсказки при вводе: посты, категории и авторы (?q=)"""
+    query = request.query_params.get('q', '')
     return Response({
-        'category': CategorySerializer(category).data,
-        'posts': serializer.data,
-        'pinned_posts_count': sum(1 for post in serializer.data if post.get('is_pinned', False))
+        'query': query,
+        'results': AutocompleteService.suggest(query),
     })
 
-@api_view(['GET'])
+
+@async_api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+async def post_by_category(request, category_slug):
+    """Посты категории: закрепленные в начале первой страницы, остальные - курсорными страницами"""
+    category = await aget_object_or_404(Category, slug=category_slug)
+    return Response(await sync_to_async(category_feed)(request, category))
+
+
+def category_feed(request, category):
+    """
+    Первая страница без ?fields= / ?omit= и со стандартным ?page_size=
+    берется из кеша категории (CategoryFeedService), следующие страницы
+    читаются по курсору.
+    """
+    paginator = KeysetCursorPagination()
+    context = {'request': request}
+
+    def build_pinned():
+        posts = optimize_queryset(
+            CategoryFeedService.pinned_queryset(category.pk), PostListSerializer, request, keep=('pinned_at',)
+        )
+        return PostListSerializer(posts, many=True, context=context).data
+
+    def build_page():
+        posts = optimize_queryset(CategoryFeedService.regular_queryset(category.pk), PostListSerializer, request)
+        page = paginator.paginate_queryset(posts, request)
+        return {
+            'results': PostListSerializer(page, many=True, context=context).data,
+            'next': paginator.next_position,
+        }
+
+    if paginator.decode_cursor(request) is not None:
+        page = build_page()
+        # previous со второй страницы ведет к началу ленты: закрепленные снова в начале
+        pinned = build_pinned() if paginator.is_first_page else []
+    else:
+        full = selected_field_names(request, PostListSerializer.Meta.fields) is None
+        if full and paginator.get_page_size(request) == KeysetCursorPagination.page_size:
+            pinned, page = CategoryFeedService.get_first_page(category.pk, build_pinned, build_page)
+        else:
+            pinned, page = build_pinned(), build_page()
+        # Ссылки строятся для текущего запроса и при ответе из кеша
+        paginator.base_url = request.build_absolute_uri()
+        paginator.next_position = page['next']
+        paginator.has_next = page['next'] is not None
+        paginator.has_previous = False
+
+    return {
+        'category': CategorySerializer(category).data,
+        'posts': [*pinned, *page['results']],
+        'pinned_posts_count': len(pinned),
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+    }
+
+
+@cache_response('posts', 'pins')
+@async_api_view(['GET'])
 @permission_classes([permissions.AllowAny])
-def popular_posts(request):
+async def popular_posts(request):
     """10 самых популярных постов"""
-    posts = Post.objects.with_subscription_info().filter(
+    posts = Post.objects.with_subscription_info().defer('content').filter(
         status='published'
-    ).order_by('-views_count')[:10]
-    
-    serializer = PostListSerializer(
-        posts, 
-        many=True, 
-        context={'request': request}
-    )
-    return Response(serializer.data)
+    ).order_by('-views_count')
+    return Response(await post_list_data(posts, request, limit=10))
 
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
-def recent_posts(request):
-    """10 последних опубликованных постов"""
-    posts = Post.objects.with_subscription_info().filter(
+def trending_posts(request):
+    """Популярное сейчас (с затуханием по времени), ?category=<id или slug>"""
+    category_id = None
+    category = request.query_params.get('category')
+    if category:
+        lookup = {'pk': category} if category.isdigit() else {'slug': category}
+        category_id = get_object_or_404(Category.objects.only('pk'), **lookup).pk
+
+    ids = TrendingService.get_ids(category_id)
+    posts = optimize_queryset(Post.objects.with_subscription_info().defer('content').filter(
         status='published'
-    ).order_by('-created_at')[:10]
-    
+    ), PostListSerializer, request).in_bulk(ids)
+    posts = [posts[post_id] for post_id in ids if post_id in posts]
+
     serializer = PostListSerializer(
-        posts, 
-        many=True, 
+        posts,
+        many=True,
         context={'request': request}
     )
     return Response(serializer.data)
 
+
+@cache_response('posts', 'pins')
+@async_api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+async def recent_posts(request):
+    """10 последних опубликованных постов"""
+    posts = Post.objects.with_subscription_info().defer('content').filter(
+        status='published'
+    ).order_by('-created_at')
+    return Response(await post_list_data(posts, request, limit=10))
+
+@cache_response('posts', 'pins')
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def pinned_posts_only(request):
     """Только закрепленные посты"""
-    posts = Post.objects.pinned_posts()
+    posts = optimize_queryset(Post.objects.pinned_posts().defer('content'), PostListSerializer, request)
     serializer = PostListSerializer(
         posts,
         many=True,
@@ -227,25 +428,28 @@ def pinned_posts_only(request):
     })
 
 
-@api_view(['GET'])
+@cache_response('posts', 'pins')
+@async_api_view(['GET'])
 @permission_classes([permissions.AllowAny])
-def featured_posts(request):
+async def featured_posts(request):
     """
     Рекомендуемые посты для главной страницы:
     - Закрепленные посты (максимум 3)
     - Популярные посты за последнюю неделю
     """
     # Получаем последние 3 закрепленных поста
-    pinned_posts = Post.objects.pinned_posts()[:3]
+    pinned_posts = [post async for post in optimize_queryset(
+        Post.objects.pinned_posts().defer('content'), PostListSerializer, request
+    )[:3]]
     
     # Получаем популярные посты за неделю (исключая уже закрепленные)
     week_ago = timezone.now() - timedelta(days=7)
-    popular_posts = Post.objects.with_subscription_info().filter(
+    popular_posts = [post async for post in optimize_queryset(Post.objects.with_subscription_info().defer('content').filter(
         status='published',
         created_at__gte=week_ago
     ).exclude(
         id__in=[post.id for post in pinned_posts]
-    ).order_by('-views_count')[:6]
+    ).order_by('-views_count'), PostListSerializer, request)[:6]]
     
     # Сериализуем данные
     pinned_serializer = PostListSerializer(
@@ -260,11 +464,94 @@ def featured_posts(request):
     )
     
     return Response({
-        'pinned_posts': pinned_serializer.data,
-        'popular_posts': popular_serializer.data,
-        'total_pinned': Post.objects.pinned_posts().count()
+        'pinned_posts': await serializer_data(pinned_serializer),
+        'popular_posts': await serializer_data(popular_serializer),
+        'total_pinned': await Post.objects.pinned_posts().acount()
     })
 
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def posts_batch(request):
+    """
+    Посты по ?ids=1,2,3 в виде PostDetailSerializer: {id: пост} и missing.
+    Полные представления берутся из кеша по id, промахи загружаются одним
+    запросом. Черновики видны только автору; просмотры не засчитываются.
+    """
+    ids = batch_ids(request, 'ids')
+    user = request.user
+    context = {'request': request}
+
+    if selected_field_names(request, PostDetailSerializer.Meta.fields) is not None:
+        # ?fields= / ?omit= - неполные представления, мимо кеша
+        posts = optimize_queryset(
+            Post.objects.filter(pk__in=ids).filter(Q(status='published') | Q(author_id=user.pk)),
+            PostDetailSerializer, request,
+        )
+        found = {item['id']: item for item in PostDetailSerializer(posts, many=True, context=context).data}
+        return batch_response(ids, found)
+
+    def build(missing_ids):
+        posts = Post.objects.select_related('author', 'category').filter(pk__in=missing_ids)
+        items = {}
+        for item in PostDetailSerializer(posts, many=True, context=context).data:
+            # can_pin зависит от пользователя и в общий кеш не попадает
+            item.pop('can_pin')
+            items[item['id']] = item
+        return items
+
+    found = {}
+    for post_id, item in PostBatchService.get_many(ids, build).items():
+        if item['status'] != 'published' and not (user.is_authenticated and item['author'] == user.pk):
+            continue
+        found[post_id] = {**item, 'can_pin': Post.pinnable_by(item['author'], item['status'], user)}
+    return batch_response(ids, found)
+
+
+@cache_response('posts', 'pins', compress=True, anonymous_only=True)
+@async_api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+async def home(request):
+    """
+    Все виджеты главной одним запросом: featured/, recent/, popular/,
+    pinned/ и categories/. Ответ анонимным посетителям кешируется сжатым.
+    """
+    return Response(await sync_to_async(home_sections)(request))
+
+
+def home_sections(request):
+    """Посты всех секций загружаются и сериализуются один раз"""
+    ids = HomeService.section_ids()
+    unique_ids = list(dict.fromkeys(post_id for section in ids.values() for post_id in section))
+    posts = optimize_queryset(
+        Post.objects.select_related('author', 'category').defer('content'), PostListSerializer, request
+    ).in_bulk(unique_ids)
+    posts = [posts[post_id] for post_id in unique_ids if post_id in posts]
+    data = dict(zip(
+        (post.pk for post in posts),
+        PostListSerializer(posts, many=True, context={'request': request}).data,
+    ))
+
+    def section(name):
+        return [data[post_id] for post_id in ids[name] if post_id in data]
+
+    return {
+        'featured': {
+            'pinned_posts': section('featured_pinned'),
+            'popular_posts': section('featured_popular'),
+            'total_pinned': len(ids['pinned']),
+        },
+        'recent': section('recent'),
+        'popular': section('popular'),
+        'pinned': {
+            'count': len(ids['pinned']),
+            'results': section('pinned'),
+        },
+        # Тот же кешированный список, что отдает categories/
+        'categories': CategoryService.get_list(
+            lambda: CategorySerializer(Category.objects.order_by('name'), many=True).data
+        ),
+    }
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def toggle_post_pin_status(request, slug):
@@ -284,7 +571,7 @@ def toggle_post_pin_status(request, slug):
         # Проверяем, закреплен ли пост
         if post.is_pinned:
             # Открепляем
-            post.pin_info.delete()
+            post.pin_info.all().delete()
             message = 'Пост успешно откреплен'
             is_pinned = False
         else:
@@ -296,7 +583,8 @@ def toggle_post_pin_status(request, slug):
             PinnedPost.objects.create(user=request.user, post=post)
             message = 'Пост успешно закреплен'
             is_pinned = True
-        
+
+        post.refresh_from_db(fields=['is_effectively_pinned', 'pinned_at', 'pin_expires_at'])
         return Response({
             'message': message,
             'is_pinned': is_pinned,
@@ -1,13 +1,19 @@
+from django.conf import settings
 from rest_framework import serializers
 from decimal import Decimal
 from .models import Payment, PaymentAttempt, Refund, WebhookEvent
-from apps.subscribe.models import SubscriptionPlan
+from apps.subscribe.models import Subscription, SubscriptionPlan
+from config.loaders import BatchListSerializer, BatchLoadedField, ModelLoader
+
+# Пользователи и подписки платежей: один запрос на страницу, повторы берутся из памяти запроса
+USERS = ModelLoader(settings.AUTH_USER_MODEL)
+SUBSCRIPTIONS = ModelLoader(Subscription, select_related=('plan',))
 
 
 class PaymentSerializer(serializers.ModelSerializer):
     """Сериализатор для платежей"""
-    user_info = serializers.SerializerMethodField()
-    subscription_info = serializers.SerializerMethodField()
+    user_info = BatchLoadedField(USERS, key='user_id')
+    subscription_info = BatchLoadedField(SUBSCRIPTIONS, key='subscription_id')
     is_successful = serializers.ReadOnlyField()
     is_pending = serializers.ReadOnlyField()
     can_be_refunded = serializers.ReadOnlyField()
@@ -23,24 +29,30 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'user', 'status', 'created_at', 'updated_at', 'processed_at'
         ]
+        list_serializer_class = BatchListSerializer
+        field_dependencies = {
+            'is_successful': {'only': ['status']},
+            'is_pending': {'only': ['status']},
+            'can_be_refunded': {'only': ['status', 'payment_method']},
+        }
 
-    def get_user_info(self, obj):
+    def get_user_info(self, obj, user):
         """Возвращает информацию о пользователе"""
         return {
-            'id': obj.user.id,
-            'username': obj.user.username,
-            'email': obj.user.email
+            'id': user.id,
+            'username': user.username,
+            'email': user.email
         }
 
-    def get_subscription_info(self, obj):
+    def get_subscription_info(self, obj, subscription):
         """Возвращает информацию о подписке"""
-        if obj.subscription:
+        if subscription:
             return {
-                'id': obj.subscription.id,
-                'plan_name': obj.subscription.plan.name,
-                'start_date': obj.subscription.start_date,
-                'end_date': obj.subscription.end_date,
-                'status': obj.subscription.status
+                'id': subscription.id,
+                'plan_name': subscription.plan.name,
+                'start_date': subscription.start_date,
+                'end_date': subscription.end_date,
+                'status': subscription.status
             }
         return None
     
@@ -114,6 +126,11 @@ class RefundSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'status', 'created_by', 'created_at', 'processed_at'
         ]
+        field_dependencies = {
+            'payment_info': {'select_related': ['payment__user']},
+            'created_by_info': {'select_related': ['created_by']},
+            'is_partial': {'only': ['amount'], 'select_related': ['payment']},
+        }
 
     def get_payment_info(self, obj):
         """Возвращает информацию о платеже"""
@@ -141,16 +141,30 @@ class StripeService:
         """Получает информацию о сессии"""
         try:
             session = stripe.checkout.Session.retrieve(session_id)
-            return {
-                'status': session.payment_status,
-                'payment_intent': session.payment_intent,
-                'customer': session.customer,
-                'metadata': session.metadata
-            }
+            return StripeService._session_info(session)
+        except stripe.error.StripeError as e:
+            logger.error(f"Error retrieving session: {e}")
+            return None
+
+    @staticmethod
+    async def aretrieve_session(session_id: str) -> Optional[Dict]:
+        """Получает информацию о сессии, не блокируя цикл событий (httpx)"""
+        try:
+            session = await stripe.checkout.Session.retrieve_async(session_id)
+            return StripeService._session_info(session)
         except stripe.error.StripeError as e:
             logger.error(f"Error retrieving session: {e}")
             return None
 
+    @staticmethod
+    def _session_info(session) -> Dict:
+        return {
+            'status': session.payment_status,
+            'payment_intent': session.payment_intent,
+            'customer': session.customer,
+            'metadata': session.metadata
+        }
+
 
 class PaymentService:
     """Основной сервис для работы с платежами"""
@@ -1,3 +1,81 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
-# Create your tests here.
+from apps.accounts.models import User
+from apps.subscribe.models import Subscription, SubscriptionPlan
+from .models import Payment
+from .serializers import PaymentSerializer
+
+
+class PaymentSerializerTests(TestCase):
+    """Пользователь и подписка платежей загружаются пакетно: число запросов не зависит от числа платежей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        for i in range(3):
+            user = User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='x')
+            subscription = Subscription.objects.create(
+                user=user, plan=plan, status='active', start_date=timezone.now(), end_date=timezone.now(),
+            )
+            Payment.objects.create(user=user, subscription=subscription if i else None, amount=10)
+            Payment.objects.create(user=user, subscription=subscription, amount=20)
+        cls.payments = list(Payment.objects.order_by('pk'))
+
+    def serialize(self, payments):
+        request = Request(APIRequestFactory().get('/'))
+        return PaymentSerializer(payments, many=True, context={'request': request}).data
+
+    def test_related_info_in_constant_queries(self):
+        for payments in (self.payments[1:2], self.payments):
+            with self.subTest(payments=len(payments)):
+                # Пользователи и подписки с планами
+                with self.assertNumQueries(2):
+                    data = self.serialize(payments)
+                for row, payment in zip(data, payments):
+                    self.assertEqual(row['user_info']['username'], payment.user.username)
+                    self.assertEqual(row['subscription_info'] and row['subscription_info']['plan_name'],
+                                     payment.subscription and 'Plan')
+
+    def test_missing_subscription_skips_the_query(self):
+        with self.assertNumQueries(1):
+            data = self.serialize(self.payments[:1])
+        self.assertIsNone(data[0]['subscription_info'])
+
+
+class PaymentListViewTests(TestCase):
+    """Queryset списка платежей строится по полям PaymentSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='user@example.com', username='user', password='x')
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        subscription = Subscription.objects.create(
+            user=cls.user, plan=plan, status='active', start_date=timezone.now(), end_date=timezone.now(),
+        )
+        cls.payments = [Payment.objects.create(user=cls.user, subscription=subscription, amount=i) for i in range(5)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_queries_do_not_grow_with_rows(self):
+        for page_size in (1, 5):
+            with self.subTest(page_size=page_size):
+                # Страница, пользователи, подписки с планами
+                with self.assertNumQueries(3):
+                    response = self.client.get(f'/api/v1/payment/payments/?page_size={page_size}')
+                self.assertEqual(len(response.data['results']), page_size)
+                self.assertEqual(response.data['results'][0]['subscription_info']['plan_name'], 'Plan')
+
+    def test_optimization_header_only_in_debug(self):
+        self.assertNotIn('X-Queryset-Optimization', self.client.get('/api/v1/payment/payments/'))
+        with override_settings(DEBUG=True):
+            response = self.client.get('/api/v1/payment/payments/')
+        # Все поля сериализатора сопоставлены с моделью: без stripe_* и metadata
+        self.assertEqual(
+            response['X-Queryset-Optimization'],
+            'only=amount,created_at,currency,description,id,payment_method,processed_at,status,subscription,updated_at,user',
+        )
@@ -5,6 +5,9 @@ from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
+from adrf.decorators import api_view as async_api_view
+from adrf.shortcuts import aget_object_or_404
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -23,21 +26,25 @@ from .serializers import (
 )
 from .services import StripeService, PaymentService, WebhookService
 from apps.subscribe.models import SubscriptionPlan
+from config.db_router import replica_reads
+from config.fieldsets import QuerysetOptimizationMixin
+from config.pagination import KeysetCursorPagination
 
 
-class PaymentListView(generics.ListAPIView):
+class PaymentListView(QuerysetOptimizationMixin, generics.ListAPIView):
     """Список платежей пользователя"""
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         """Возвращает платежи текущего пользователя"""
         return Payment.objects.filter(
             user=self.request.user
-        ).select_related('subscription', 'subscription__plan').order_by('-created_at')
+        ).order_by('-created_at')
 
 
-class PaymentDetailView(generics.RetrieveAPIView):
+class PaymentDetailView(QuerysetOptimizationMixin, generics.RetrieveAPIView):
     """Детальная информация о платеже"""
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -46,7 +53,7 @@ class PaymentDetailView(generics.RetrieveAPIView):
         """Возвращает платежи текущего пользователя"""
         return Payment.objects.filter(
             user=self.request.user
-        ).select_related('subscription', 'subscription__plan')
+        )
     
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -95,45 +102,48 @@ def create_checkout_session(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def payment_status(request, payment_id):
-    """Проверяет статус платежа"""
-    try:
-        payment = get_object_or_404(
-            Payment, 
-            id=payment_id, 
-            user=request.user
-        )
-        
-        # Если есть session_id, проверяем статус в Stripe
-        if payment.stripe_session_id and payment.status in ['pending', 'processing']:
-            session_info = StripeService.retrieve_session(payment.stripe_session_id)
-            
-            if session_info:
-                if session_info['status'] == 'complete':
-                    PaymentService.process_successful_payment(payment)
-                elif session_info['status'] == 'failed':
-                    PaymentService.process_failed_payment(payment, "Session failed")
-        
-        response_data = {
-            'payment_id': payment.id,
-            'status': payment.status,
-            'message': f'Payment is {payment.status}',
-            'subscription_activated': False
-        }
-        
-        if payment.is_successful and payment.subscription:
-            response_data['subscription_activated'] = payment.subscription.is_active
-            response_data['message'] = 'Payment successful and subscription activated'
-        
-        serializer = PaymentStatusSerializer(response_data)
-        return Response(serializer.data)
+async def payment_status(request, payment_id):
+    """Проверяет статус платежа (ожидание Stripe не занимает воркер)"""
+    payment = await aget_object_or_404(
+        Payment.objects.select_related('subscription'),
+        id=payment_id, 
+        user=request.user
+    )
+    
+    # Если есть session_id, проверяем статус в Stripe
+    if payment.stripe_session_id and payment.status in ['pending', 'processing']:
+        session_info = await StripeService.aretrieve_session(payment.stripe_session_id)
         
-    except Payment.DoesNotExist:
-        return Response({
-            'error': 'Payment not found'
-        }, status=status.HTTP_404_NOT_FOUND)
+        if session_info:
+            payment = await sync_to_async(apply_session_status)(payment.pk, session_info)
+    
+    response_data = {
+        'payment_id': payment.id,
+        'status': payment.status,
+        'message': f'Payment is {payment.status}',
+        'subscription_activated': False
+    }
+    
+    if payment.is_successful and payment.subscription:
+        response_data['subscription_activated'] = payment.subscription.is_active
+        response_data['message'] = 'Payment successful and subscription activated'
+    
+    serializer = PaymentStatusSerializer(response_data)
+    return Response(serializer.data)
+
+
+@transaction.atomic
+def apply_session_status(payment_id, session_info):
+    """Применяет статус сессии Stripe; платеж блокируется, чтобы не обработать его дважды"""
+    payment = Payment.objects.select_for_update(of=('self',)).select_related('subscription').get(pk=payment_id)
+    if payment.status in ['pending', 'processing']:
+        if session_info['status'] == 'complete':
+            PaymentService.process_successful_payment(payment)
+        elif session_info['status'] == 'failed':
+            PaymentService.process_failed_payment(payment, "Session failed")
+    return payment
 
 
 @api_view(['POST'])
@@ -169,7 +179,7 @@ def cancel_payment(request, payment_id):
         }, status=status.HTTP_404_NOT_FOUND)
     
 
-class RefundListView(generics.ListAPIView):
+class RefundListView(QuerysetOptimizationMixin, generics.ListAPIView):
     """Список возвратов для администраторов"""
     serializer_class = RefundSerializer
     permission_classes = [permissions.IsAdminUser]
@@ -180,7 +190,7 @@ class RefundListView(generics.ListAPIView):
         ).order_by('-created_at')
 
 
-class RefundDetailView(generics.RetrieveAPIView):
+class RefundDetailView(QuerysetOptimizationMixin, generics.RetrieveAPIView):
     """Детальная информация о возврате"""
     serializer_class = RefundSerializer
     permission_classes = [permissions.IsAdminUser]
@@ -283,6 +293,7 @@ def stripe_webhook(request):
         logger.error(f"Unexpected error in webhook: {e}", exc_info=True)
         return HttpResponse(status=500)
     
+@replica_reads
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def payment_analytics(request):
@@ -341,7 +352,7 @@ def user_payment_history(request):
     """История платежей пользователя"""
     payments = Payment.objects.filter(
         user=request.user
-    ).select_related('subscription', 'subscription__plan').order_by('-created_at')
+    ).order_by('-created_at')
     
     serializer = PaymentSerializer(payments, many=True)
     return Response({
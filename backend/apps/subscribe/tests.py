@@ -1,3 +1,104 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from apps.accounts.models import User
+from apps.frontpage.models import Post
+from apps.frontpage.services import ViewCounterService
+from config.redis_client import get_redis
+from .models import PinnedPost, Subscription, SubscriptionHistory, SubscriptionPlan
+from .views import pinned_posts_list
+
+
+class SubscriptionHistoryViewTests(TestCase):
+    """Queryset истории подписки строится по полям SubscriptionHistorySerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='user@example.com', username='user', password='x')
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        cls.subscription = Subscription.objects.create(
+            user=cls.user, plan=plan, status='active', start_date=timezone.now(), end_date=timezone.now(),
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+
+    def test_queries_do_not_grow_with_rows(self):
+        for count in (1, 5):
+            while SubscriptionHistory.objects.count() < count:
+                SubscriptionHistory.objects.create(subscription=self.subscription, action='renewed')
+            self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+            with self.subTest(rows=count):
+                # Подписка пользователя, COUNT(*) и страница
+                with self.assertNumQueries(3):
+                    response = self.client.get('/api/v1/subscribe/history/')
+                self.assertEqual(len(response.data['results']), count)
+
+    def test_optimization_header_only_in_debug(self):
+        self.assertNotIn('X-Queryset-Optimization', self.client.get('/api/v1/subscribe/history/'))
+        with override_settings(DEBUG=True):
+            response = self.client.get('/api/v1/subscribe/history/')
+        # Колонка subscription нужна связанному менеджеру, без нее - запрос на каждую строку
+        self.assertEqual(response['X-Queryset-Optimization'], 'none')
+
+
+class PinnedPostsListTests(TestCase):
+    """Список закрепленных постов отдает просмотры с учетом буфера Redis"""
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = SubscriptionPlan.objects.create(name='Plan', price=1, stripe_price_id='price')
+        cls.posts = []
+        for i in range(3):
+            user = User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='x')
+            Subscription.objects.create(
+                user=user, plan=plan, status='active',
+                start_date=timezone.now(), end_date=timezone.now() + timedelta(days=10),
+            )
+            post = Post.objects.create(title=f'Post {i}', slug=f'post-{i}', content='text', author=user)
+            Post.objects.filter(pk=post.pk).update(views_count=10 * i)
+            PinnedPost.objects.create(user=user, post=post)
+            cls.posts.append(post)
+        cls.user = cls.posts[0].author
+
+    def setUp(self):
+        self.clear_views()
+        self.addCleanup(self.clear_views)
+
+    @staticmethod
+    def clear_views():
+        client = get_redis()
+        keys = client.keys('post_views:*')
+        if keys:
+            client.delete(*keys)
+
+    def get(self):
+        request = APIRequestFactory().get('/api/v1/subscribe/pinned-posts/')
+        force_authenticate(request, user=self.user)
+        response = pinned_posts_list(request)
+        self.assertEqual(response.status_code, 200)
+        return {row['id']: row['views_count'] for row in response.data['results']}
+
+    def test_views_include_pending(self):
+        first, second, third = self.posts
+        for _ in range(3):
+            ViewCounterService.record_view(first.pk)
+        ViewCounterService.record_view(third.pk)
+        # Просмотры из переносимой в БД порции тоже учитываются
+        batch_key = f'{ViewCounterService.BATCH_PREFIX}test'
+        get_redis().hset(batch_key, third.pk, 1)
+        get_redis().sadd(ViewCounterService.BATCHES_KEY, batch_key)
+        self.assertEqual(self.get(), {first.pk: 3, second.pk: 10, third.pk: 22})
+
+    def test_pending_read_once_per_list(self):
+        with self.assertNumQueries(1):
+            with mock.patch.object(
+                ViewCounterService, 'pending_for', wraps=ViewCounterService.pending_for
+            ) as pending_for:
+                self.get()
+        pending_for.assert_called_once()
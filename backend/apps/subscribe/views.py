@@ -18,14 +18,16 @@ from .serializers import (
 )
 
 from apps.frontpage.models import Post
+from apps.frontpage.services import ViewCounterService
+from config.fieldsets import QuerysetOptimizationMixin
 
-class SubscriptionPlanListView(generics.ListAPIView):
+class SubscriptionPlanListView(QuerysetOptimizationMixin, generics.ListAPIView):
     """Список доступных тарифных планов """
     queryset = SubscriptionPlan.objects.filter(is_active=True)
     serializer_class = SubscriptionPlanSerializer
     permission_classes = [permissions.AllowAny]
     
-class SubscriptionPlanDetailView(generics.RetrieveAPIView):
+class SubscriptionPlanDetailView(QuerysetOptimizationMixin, generics.RetrieveAPIView):
     """Детальная информация о тарифных планах """
     queryset = SubscriptionPlan.objects.filter(is_active=True)
     serializer_class = SubscriptionPlanSerializer
@@ -56,7 +58,7 @@ class UserSubscriptionView(generics.RetrieveAPIView):
                 "detail": "Подписка не найдена"
             }, status=status.HTTP_404_NOT_FOUND)
 
-class SubscriptionHistoryView(generics.ListAPIView):
+class SubscriptionHistoryView(QuerysetOptimizationMixin, generics.ListAPIView):
     """Список изменений подписок пользователя """
     serializer_class = SubscriptionHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -225,29 +227,25 @@ def cancel_subscription(request):
 @permission_classes([permissions.IsAuthenticated])
 def pinned_posts_list(request):
     """ Возвращает список всех закрепленных постов """    
-    pinned_posts = PinnedPost.objects.select_related(
-        'post', 'post__author', 'post__category', 'user__subscription'
-    ).filter(
-        user__subscription__status= 'active',
-        user__subscription__end_date__gt= timezone.now(),
-        post__status= 'published'
-    ).order_by('pinned_at')
+    pinned_posts = Post.objects.filter(
+        status='published',
+        is_effectively_pinned=True,
+    ).select_related('author', 'category').defer('content').order_by('pinned_at')
+
+    """ Непереданные в БД просмотры - одним запросом к Redis на весь список """
+    pinned_posts = list(pinned_posts)
+    pending = ViewCounterService.pending_for(post.pk for post in pinned_posts)
 
     """ Формирует ответ с информацией """
 
     posts_data = []
-    for pinned_post in pinned_posts:
-        post = pinned_post.post
-
+    for post in pinned_posts:
+        post._pending_views = pending.get(post.pk, 0)
         posts_data.append({
                 'id': post.id,
                 'title': post.title,
                 'slug': post.slug,
-                'content': (
-                    f'{post.content[:200]}...'
-                    if len(post.content) > 200
-                    else post.content
-                ),
+                'content': post.excerpt,
                 'image': post.image.url if post.image else None,
                 'category': post.category.name if post.category else None,
                 'author': {
@@ -255,15 +253,15 @@ def pinned_posts_list(request):
                     'username': post.author.username,
                     'full_name': post.author.full_name,
                 },
-                'views_count': post.views_count,
+                'views_count': post.current_views_count,
                 'comments_count': post.comments_count,
                 'created_at': post.created_at,
-                'pinned_at': pinned_post.pinned_at,
+                'pinned_at': post.pinned_at,
                 'is_pinned': True,
             })
 
     return Response({
-        "count": int(posts_data),
+        "count": len(posts_data),
         "results": posts_data
     })
 
@@ -7,10 +7,36 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+from config.transactions import AtomicWritesHandlerMixin
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+
+class BoundedASGIHandler(AtomicWritesHandlerMixin, ASGIHandler):
+    """
+    Под ASGI каждый запрос работает с БД в своем потоке и со своим соединением.
+    Чтобы тысяча открытых соединений не превратилась в тысячу соединений с
+    Postgres, одновременно обрабатывается не больше ASGI_MAX_CONCURRENT_REQUESTS
+    запросов на процесс. Чтение тела запроса и отправка ответа медленным
+    клиентам в лимит не входят.
+    Запись выполняется в транзакции (AtomicWritesHandlerMixin).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.semaphore = asyncio.Semaphore(settings.ASGI_MAX_CONCURRENT_REQUESTS)
+
+    async def run_get_response(self, request):
+        async with self.semaphore:
+            return await super().run_get_response(request)
+
+
+django.setup(set_prefix=False)
+application = BoundedASGIHandler()
@@ -0,0 +1,25 @@
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+def batch_ids(request, param):
+    """Id из ?param=1,2,3 без повторов, в порядке запроса; не больше BATCH_MAX_IDS"""
+    values = [value.strip() for value in request.query_params.get(param, '').split(',') if value.strip()]
+    try:
+        ids = list(dict.fromkeys(int(value) for value in values))
+    except ValueError:
+        raise ValidationError({param: 'Ожидается список id через запятую.'})
+    if not ids:
+        raise ValidationError({param: 'Укажите хотя бы один id.'})
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise ValidationError({param: f'Не больше {settings.BATCH_MAX_IDS} id за запрос.'})
+    return ids
+
+
+def batch_response(ids, found):
+    """Ответ пакетного чтения: найденные объекты по id и список ненайденных id"""
+    return Response({
+        'results': {object_id: found[object_id] for object_id in ids if object_id in found},
+        'missing': [object_id for object_id in ids if object_id not in found],
+    })
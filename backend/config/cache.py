@@ -0,0 +1,248 @@
+import gzip
+import hashlib
+import logging
+import uuid
+from functools import wraps
+
+import redis
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_KEY = 'response:{digest}'
+TAG_KEY = 'cache_tag:{tag}'
+CACHEABLE_MEDIA_TYPES = ('application/json', 'application/msgpack')
+ACCEPTS_GZIP = _lazy_re_compile(r'\bgzip\b')
+
+
+def _tag_keys(tags):
+    return {tag: TAG_KEY.format(tag=tag) for tag in tags}
+
+
+def invalidate_cache_tags(*tags):
+    """Сбрасывает все ответы с этими тегами (после коммита транзакции)"""
+    def bump():
+        try:
+            cache.set_many(
+                {key: uuid.uuid4().hex for key in _tag_keys(tags).values()},
+                timeout=None,
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Response cache unavailable, tags {tags} not invalidated: {e}")
+
+    transaction.on_commit(bump)
+
+
+def cache_response(*tags, timeout=None, compress=False, anonymous_only=False):
+    """
+    Кеш готовых ответов для GET-представлений, одинаковых для всех посетителей.
+
+    Запись хранит версии своих тегов на момент сохранения. Ответ и текущие
+    версии тегов читаются одним get_many: если какой-то тег с тех пор
+    сброшен (invalidate_cache_tags), запись считается устаревшей.
+    Кешируются только успешные ответы в JSON и MessagePack. Асинхронные
+    представления обращаются к кешу вне цикла событий.
+
+    compress - запись хранится сжатой gzip и отдается клиентам с
+    Accept-Encoding: gzip без повторного сжатия. anonymous_only - запросы
+    с JWT или сессией идут мимо кеша.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != 'GET' or (anonymous_only and _has_credentials(request)):
+                    return await view_func(request, *args, **kwargs)
+
+                key, tag_keys, versions, cached = await sync_to_async(_lookup)(request, tags)
+                if cached is not None:
+                    return cached
+                response = await view_func(request, *args, **kwargs)
+                if key is None:
+                    return response
+                return await sync_to_async(_finish)(response, key, tag_keys, versions, timeout, compress)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or (anonymous_only and _has_credentials(request)):
+                return view_func(request, *args, **kwargs)
+
+            key, tag_keys, versions, cached = _lookup(request, tags)
+            if cached is not None:
+                return cached
+            response = view_func(request, *args, **kwargs)
+            if key is None:
+                return response
+            return _finish(response, key, tag_keys, versions, timeout, compress)
+        return wrapper
+    return decorator
+
+
+def _lookup(request, tags):
+    """
+    Ключ ответа, текущие версии тегов и сохраненный ответ, если он не устарел.
+    Если кеш недоступен, ключ None: ответ не читается и не сохраняется.
+    Схема и хост входят в ключ: в ответах абсолютные ссылки на изображения.
+    """
+    source = f"{request.build_absolute_uri()}|{request.META.get('HTTP_ACCEPT', '')}"
+    key = RESPONSE_KEY.format(digest=hashlib.md5(source.encode('utf-8')).hexdigest())
+    tag_keys = _tag_keys(tags)
+
+    try:
+        values = cache.get_many([key, *tag_keys.values()])
+    except redis.RedisError as e:
+        logger.warning(f"Response cache unavailable: {e}")
+        return None, tag_keys, {}, None
+
+    versions = {tag: values.get(tag_key) for tag, tag_key in tag_keys.items()}
+    entry = values.get(key)
+    if entry is not None and None not in versions.values() and entry['versions'] == versions:
+        return key, tag_keys, versions, _cached_response(request, entry)
+    return key, tag_keys, versions, None
+
+
+def _has_credentials(request):
+    """Запрос от пользователя (JWT или сессия); проверяется без обращения к БД"""
+    return 'HTTP_AUTHORIZATION' in request.META or settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def _cached_response(request, entry):
+    content = entry['content']
+    compressed = entry.get('encoding') == 'gzip'
+    if compressed and not ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        content, compressed = gzip.decompress(content), False
+
+    response = HttpResponse(content, status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    if compressed:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _finish(response, key, tag_keys, versions, timeout, compress=False):
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+
+    media_type = getattr(response, 'accepted_media_type', '') or ''
+    if response.status_code == 200 and media_type.startswith(CACHEABLE_MEDIA_TYPES):
+        if compress:
+            # Из кеша ответ отдается сжатым или нет в зависимости от Accept-Encoding
+            patch_vary_headers(response, ('Accept-Encoding',))
+        _store(key, tag_keys, versions, response, timeout, compress)
+    return response
+
+
+def _store(key, tag_keys, versions, response, timeout, compress=False):
+    try:
+        missing = {tag_keys[tag]: uuid.uuid4().hex for tag, version in versions.items() if version is None}
+        if missing:
+            # Версия тега появляется при первом сохранении; add не перетирает чужую
+            for tag_key, version in missing.items():
+                cache.add(tag_key, version, timeout=None)
+            current = cache.get_many(list(tag_keys.values()))
+            versions = {tag: current.get(tag_key) for tag, tag_key in tag_keys.items()}
+
+        content = gzip.compress(response.content, compresslevel=9, mtime=0) if compress else response.content
+        cache.set(
+            key,
+            {
+                'versions': versions,
+                'status': response.status_code,
+                'content': content,
+                'encoding': 'gzip' if compress else None,
+                'headers': list(response.items()),
+            },
+            timeout if timeout is not None else settings.RESPONSE_CACHE_TIMEOUT,
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Response cache unavailable: {e}")
+
+
+class ObjectCache:
+    """
+    Кеш представлений отдельных объектов по id (пост, дерево комментариев поста).
+
+    У каждого объекта своя версия: записи и версии всех запрошенных объектов
+    читаются одним get_many, промахи строятся одним вызовом build(ids).
+    Версия фиксируется до построения, поэтому изменение во время сборки
+    делает запись устаревшей. invalidate() меняет версии после коммита.
+    """
+
+    def __init__(self, prefix, timeout_setting):
+        self.prefix = prefix
+        self.timeout_setting = timeout_setting
+
+    def key(self, object_id):
+        return f'{self.prefix}:{object_id}'
+
+    def version_key(self, object_id):
+        return f'{self.prefix}_version:{object_id}'
+
+    def get_many(self, object_ids, build):
+        """
+        {id: представление}; build(ids) возвращает представления промахов,
+        id, которых нет в его результате, не кешируются и в ответ не попадают.
+        """
+        object_ids = list(dict.fromkeys(object_ids))
+        if not object_ids:
+            return {}
+        try:
+            values = cache.get_many([
+                key for object_id in object_ids for key in (self.key(object_id), self.version_key(object_id))
+            ])
+            new_versions = {
+                self.version_key(object_id): uuid.uuid4().hex
+                for object_id in object_ids if self.version_key(object_id) not in values
+            }
+            if new_versions:
+                cache.set_many(new_versions, timeout=None)
+                values.update(new_versions)
+        except redis.RedisError as e:
+            logger.warning(f"Object cache {self.prefix} unavailable: {e}")
+            return build(object_ids)
+
+        found, missing = {}, []
+        for object_id in object_ids:
+            entry = values.get(self.key(object_id))
+            if entry is not None and entry['version'] == values[self.version_key(object_id)]:
+                found[object_id] = entry['data']
+            else:
+                missing.append(object_id)
+        if not missing:
+            return found
+
+        built = build(missing)
+        try:
+            cache.set_many(
+                {
+                    self.key(object_id): {'version': values[self.version_key(object_id)], 'data': data}
+                    for object_id, data in built.items()
+                },
+                getattr(settings, self.timeout_setting),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Object cache {self.prefix} unavailable: {e}")
+        found.update(built)
+        return found
+
+    def invalidate(self, object_ids):
+        """Новые версии объектов (после коммита транзакции)"""
+        keys = {self.version_key(object_id) for object_id in object_ids}
+        if not keys:
+            return
+
+        def bump():
+            try:
+                cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+            except redis.RedisError as e:
+                logger.warning(f"Object cache {self.prefix} unavailable, {len(keys)} entries not invalidated: {e}")
+
+        transaction.on_commit(bump)
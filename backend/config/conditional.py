@@ -0,0 +1,59 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from .fieldsets import requested_fieldset
+
+
+def make_etag(*parts, weak=False):
+    """ETag из значений, определяющих представление ответа"""
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def not_modified_response(request, etag=None, last_modified=None):
+    """304 (или 412 для If-Match) с заголовками валидатора, если клиент уже держит эту версию"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None and response.status_code == 304 and etag:
+        response['ETag'] = etag
+    return response
+
+
+class ConditionalListMixin:
+    """
+    Слабый ETag для страницы списка.
+
+    ETag считается по уже выбранной странице (id, updated_at и полям из
+    etag_fields), поэтому при совпадении If-None-Match ответ 304 отдается
+    без сериализации. Учитываются пользователь, формат ответа и набор
+    полей (?fields= / ?omit=).
+    """
+    etag_fields = ('pk', 'updated_at')
+
+    def get_list_etag(self, objects, next_link=None):
+        request = self.request
+        parts = [
+            request.user.pk, request.accepted_media_type, requested_fieldset(request), next_link, len(objects),
+        ]
+        for obj in objects:
+            parts.extend(getattr(obj, field, None) for field in self.etag_fields)
+        return make_etag(*parts, weak=True)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(page if page is not None else queryset)
+
+        etag = self.get_list_etag(objects, self.paginator.get_next_link() if page is not None else None)
+        not_modified = not_modified_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        serializer = self.get_serializer(objects, many=True)
+        if page is not None:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,247 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_COOKIE = 'db_primary'
+PRIMARY_PIN_KEY = 'db:primary_pin:{user_id}'
+
+# Задержка реплики в секундах; 0, если она догнала мастер или сама мастер
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+@dataclass
+class RoutingState:
+    replica: Optional[str] = None
+    wrote: bool = False
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar('db_routing_state', default=None)
+
+
+class ReplicaRouter:
+    """
+    Чтение в рамках запроса, для которого ReplicaRoutingMiddleware выбрала
+    реплику, идет на нее. После первой записи запрос до конца читает с мастера,
+    чтобы видеть свои же изменения. Вне запросов (Celery, команды) - только мастер.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.wrote:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и мастер
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPool:
+    """
+    Исправные реплики процесса. Задержка проверяется не чаще раза в
+    REPLICA_LAG_CHECK_INTERVAL секунд; отстающие больше чем на
+    REPLICA_MAX_LAG_SECONDS или недоступные реплики исключаются до следующей проверки.
+    """
+    _lock = threading.Lock()
+    _healthy = None
+    _ejected = set()
+    _checked_at = 0.0
+
+    @staticmethod
+    def lag(alias: str) -> float:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            return float(cursor.fetchone()[0])
+
+    @classmethod
+    def healthy(cls) -> tuple:
+        if not settings.DATABASE_REPLICAS:
+            return ()
+
+        if cls._healthy is None or time.monotonic() - cls._checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL:
+            # Проверяет один поток; остальные пока используют прошлый результат
+            if cls._lock.acquire(blocking=cls._healthy is None):
+                try:
+                    if cls._healthy is None or time.monotonic() - cls._checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL:
+                        cls._healthy = tuple(alias for alias in settings.DATABASE_REPLICAS if cls._check(alias))
+                        cls._checked_at = time.monotonic()
+                finally:
+                    cls._lock.release()
+        return cls._healthy or ()
+
+    @classmethod
+    def choose(cls) -> Optional[str]:
+        aliases = cls.healthy()
+        return random.choice(aliases) if aliases else None
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._healthy = None
+            cls._ejected = set()
+            cls._checked_at = 0.0
+
+    @classmethod
+    def _check(cls, alias: str) -> bool:
+        try:
+            lag = cls.lag(alias)
+        except DatabaseError as e:
+            connections[alias].close()
+            return cls._mark(alias, False, f"unavailable: {e}")
+
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            return cls._mark(alias, False, f"lagging {lag:.1f}s behind primary")
+        return cls._mark(alias, True, f"lag {lag:.1f}s")
+
+    @classmethod
+    def _mark(cls, alias: str, healthy: bool, reason: str) -> bool:
+        if not healthy and alias not in cls._ejected:
+            cls._ejected.add(alias)
+            logger.warning(f"Replica {alias} ejected: {reason}")
+        elif healthy and alias in cls._ejected:
+            cls._ejected.discard(alias)
+            logger.info(f"Replica {alias} restored: {reason}")
+        return healthy
+
+
+def replica_reads(view_func):
+    """
+    Аналитика: читает с реплики даже сразу после записи пользователя
+    (небольшое отставание для отчетов не важно).
+    """
+    view_func.replica_reads = True
+    return view_func
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Безопасные запросы к API и спискам админки читают с реплики, если
+    пользователь недавно ничего не записывал. После запроса с записью он
+    на READ_YOUR_WRITES_SECONDS закрепляется за мастером: подписанной cookie
+    и ключом в кеше по user_id из JWT (для клиентов без cookie).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            self._pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            await sync_to_async(self._pin)(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is None or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+
+        analytics = getattr(view_func, 'replica_reads', False) or getattr(
+            getattr(view_func, 'cls', None), 'replica_reads', False
+        )
+        if request.resolver_match.app_name == 'admin':
+            # Формы редактирования читают с мастера: иначе можно сохранить устаревшие данные
+            analytics = (request.resolver_match.url_name or '').endswith('_changelist')
+            if not analytics:
+                return None
+
+        if analytics or not self._pinned(request):
+            state.replica = ReplicaPool.choose()
+        return None
+
+    @staticmethod
+    def _pinned(request) -> bool:
+        if not settings.DATABASE_REPLICAS:
+            return True
+        if request.get_signed_cookie(PRIMARY_COOKIE, default=None, max_age=settings.READ_YOUR_WRITES_SECONDS):
+            return True
+
+        user_id = _token_user_id(request)
+        if user_id is None:
+            return False
+        try:
+            return cache.get(PRIMARY_PIN_KEY.format(user_id=user_id)) is not None
+        except redis.RedisError as e:
+            logger.warning(f"Primary pin cache unavailable, reading from primary: {e}")
+            return True
+
+    @staticmethod
+    def _pin(request, response):
+        response.set_signed_cookie(
+            PRIMARY_COOKIE, '1',
+            max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True, samesite='Lax',
+        )
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            try:
+                cache.set(PRIMARY_PIN_KEY.format(user_id=user.pk), 1, settings.READ_YOUR_WRITES_SECONDS)
+            except redis.RedisError as e:
+                logger.warning(f"Primary pin cache unavailable for user {user.pk}: {e}")
+
+
+def _token_user_id(request):
+    """user_id из access-токена без обращения к БД (подпись и срок проверяются)"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
@@ -0,0 +1,307 @@
+import logging
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, QuerySet
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer, Serializer
+
+from .loaders import BatchLoadedField
+
+logger = logging.getLogger(__name__)
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _parse(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def requested_fieldset(request):
+    """
+    Нормализованные ?fields= и ?omit= (порядок и пробелы не важны) для
+    валидаторов и ключей кеша. None - параметров нет.
+    """
+    fields = _parse(request.query_params.get(FIELDS_PARAM))
+    omit = _parse(request.query_params.get(OMIT_PARAM))
+    if not fields and not omit:
+        return None
+    return ','.join(sorted(fields)), ','.join(sorted(omit))
+
+
+def selected_field_names(request, available):
+    """
+    Поля ответа по ?fields=a,b и ?omit=c. None - параметров нет, отдаются все поля.
+    Неизвестные имена игнорируются.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = _parse(request.query_params.get(FIELDS_PARAM))
+    omit = _parse(request.query_params.get(OMIT_PARAM))
+    if not fields and not omit:
+        return None
+    names = set(available) & fields if fields else set(available)
+    return names - omit
+
+
+class SparseFieldsetMixin:
+    """
+    Сериализатор, отдающий только запрошенные клиентом поля (?fields= / ?omit=).
+
+    Meta.field_dependencies описывает, что нужно вычисляемым полям из БД:
+    {'поле': {'only': [...], 'select_related': [...], 'prefetch_related': [...]}}.
+    Для полей-колонок модели зависимости выводятся автоматически
+    (см. optimize_queryset).
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = selected_field_names(self.context.get('request'), fields)
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+def ordering_columns(queryset):
+    """Колонки, по которым сортируется queryset (нужны пагинации по ключу)"""
+    columns = set()
+    for item in queryset.query.order_by:
+        if isinstance(item, str):
+            columns.add(item.lstrip('-'))
+        elif isinstance(getattr(item, 'expression', None), F):
+            columns.add(item.expression.name)
+    return columns
+
+
+@dataclass
+class QuerysetPlan:
+    """Что нужно загрузить для полей сериализатора; unresolved - поля, которые не удалось сопоставить с моделью"""
+    only: set = field(default_factory=lambda: {'pk'})
+    select_related: set = field(default_factory=set)
+    prefetch_related: set = field(default_factory=set)
+    unresolved: list = field(default_factory=list)
+
+    @property
+    def complete(self):
+        return not self.unresolved
+
+
+def _key_field_name(model, key):
+    """Имя поля модели для атрибута-ключа загрузчика ('author_id' -> 'author')"""
+    if key == 'pk':
+        return 'pk'
+    for model_field in model._meta.concrete_fields:
+        if key in (model_field.name, model_field.attname):
+            return model_field.name
+    return None
+
+
+def _add_nested(plan, serializer, model, path, many):
+    """Связи вложенного сериализатора с префиксом пути; внутри prefetch - тоже prefetch"""
+    nested = queryset_plan(serializer, model)
+    for name in nested.select_related:
+        (plan.prefetch_related if many else plan.select_related).add(f'{path}__{name}')
+    plan.prefetch_related.update(f'{path}__{name}' for name in nested.prefetch_related)
+
+
+def queryset_plan(serializer, model):
+    """
+    Колонки, select_related и prefetch_related для полей сериализатора:
+    по Meta.field_dependencies, source (в том числе через точку: 'author.username'),
+    вложенным сериализаторам и ключам BatchLoadedField.
+    """
+    dependencies = getattr(getattr(serializer, 'Meta', None), 'field_dependencies', {})
+    plan = QuerysetPlan()
+
+    for name, serializer_field in serializer.fields.items():
+        if serializer_field.write_only:
+            continue
+        if name in dependencies:
+            spec = dependencies[name]
+            plan.only.update(spec.get('only', ()))
+            plan.select_related.update(spec.get('select_related', ()))
+            plan.prefetch_related.update(spec.get('prefetch_related', ()))
+            continue
+        if isinstance(serializer_field, BatchLoadedField) and isinstance(serializer_field.key, str):
+            key_name = _key_field_name(model, serializer_field.key)
+            if key_name is None:
+                plan.unresolved.append(name)
+            else:
+                plan.only.add(key_name)
+            continue
+        if serializer_field.source == '*':
+            plan.unresolved.append(name)
+            continue
+
+        current, path, many = model, [], False
+        for attr in serializer_field.source_attrs:
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # Свойство модели: верхнего уровня - не знаем, что оно читает; у связанной модели она загружена целиком
+                if not path:
+                    plan.unresolved.append(name)
+                break
+            if not path and model_field.concrete:
+                plan.only.add(model_field.name)
+            if not model_field.is_relation:
+                break
+            if not path and isinstance(serializer_field, PrimaryKeyRelatedField) and len(serializer_field.source_attrs) == 1:
+                # Достаточно колонки *_id
+                break
+            path.append(model_field.name)
+            many = many or model_field.many_to_many or model_field.one_to_many
+            (plan.prefetch_related if many else plan.select_related).add('__'.join(path))
+            current = model_field.related_model
+
+        if path and isinstance(serializer_field, BaseSerializer):
+            nested = serializer_field.child if isinstance(serializer_field, ListSerializer) else serializer_field
+            _add_nested(plan, nested, current, '__'.join(path), many)
+
+    plan.only.update(name.split('__')[0] for name in plan.select_related)
+    return plan
+
+
+def optimize_queryset(queryset, serializer_class, request, keep=()):
+    """
+    Сужает queryset под запрошенные поля: только нужные колонки (.only())
+    и связи. Без ?fields=/?omit= queryset не меняется. Колонки из keep
+    (ETag, сортировка) загружаются всегда.
+    """
+    if not isinstance(queryset, QuerySet) or not issubclass(serializer_class, SparseFieldsetMixin):
+        return queryset
+    if selected_field_names(request, ()) is None:
+        return queryset
+
+    plan = queryset_plan(serializer_class(context={'request': request}), queryset.model)
+    if not plan.complete:
+        return queryset
+    only = plan.only | _kept_columns(queryset, keep)
+    only.discard('pk')
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    if plan.prefetch_related:
+        queryset = queryset.prefetch_related(*plan.prefetch_related)
+    return queryset.only('pk', *only)
+
+
+def _kept_columns(queryset, keep):
+    # Queryset связанного менеджера (subscription.history) проставляет объектам
+    # владельца по внешнему ключу: без его колонки - запрос на каждую строку
+    columns = {field.name for field in queryset._known_related_objects}
+    for name in {*keep, *ordering_columns(queryset)}:
+        # Аннотации (например, rank поиска) загружаются и без .only()
+        try:
+            queryset.model._meta.get_field(name.split('__')[0])
+        except FieldDoesNotExist:
+            continue
+        columns.add(name)
+    return columns
+
+
+def _selected_relations(queryset):
+    """select_related, уже заданные queryset ('author__subscription')"""
+    def walk(tree, prefix):
+        for name, subtree in tree.items():
+            yield prefix + name
+            yield from walk(subtree, f'{prefix}{name}__')
+
+    selected = queryset.query.select_related
+    return set(walk(selected, '')) if isinstance(selected, dict) else set()
+
+
+def _prefetched_lookups(queryset):
+    return {getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups}
+
+
+def auto_optimize_queryset(queryset, serializer_class, request, keep=()):
+    """
+    Дополняет queryset всем, что читает сериализатор: недостающие
+    select_related/prefetch_related и, если все поля сопоставлены с моделью
+    и колонки еще не выбраны вручную (.only()/.defer()), - .only().
+    Существующие связи queryset сохраняются. Возвращает (queryset, отчет).
+    """
+    report = {'select_related': [], 'prefetch_related': [], 'only': [], 'unresolved': []}
+    if not isinstance(queryset, QuerySet):
+        return queryset, report
+
+    plan = queryset_plan(serializer_class(context={'request': request}), queryset.model)
+    report['unresolved'] = sorted(plan.unresolved)
+
+    selected = _selected_relations(queryset)
+    # select_related=True (все связи) покрывает любые связи
+    if queryset.query.select_related is not True:
+        missing = sorted(plan.select_related - selected)
+        if missing:
+            queryset = queryset.select_related(*missing)
+            report['select_related'] = missing
+            selected.update(missing)
+
+    missing = sorted(plan.prefetch_related - _prefetched_lookups(queryset))
+    if missing:
+        queryset = queryset.prefetch_related(*missing)
+        report['prefetch_related'] = missing
+
+    deferred_fields, defer = queryset.query.deferred_loading
+    if plan.complete and defer and not deferred_fields and queryset.query.select_related is not True:
+        only = plan.only | _kept_columns(queryset, keep) | {name.split('__')[0] for name in selected}
+        only.discard('pk')
+        model_fields = {model_field.name for model_field in queryset.model._meta.concrete_fields}
+        if model_fields - only:
+            queryset = queryset.only('pk', *only)
+            report['only'] = sorted(only)
+    return queryset, report
+
+
+class QuerysetOptimizationMixin:
+    """
+    Представление, queryset которого строится по полям своего сериализатора:
+    с ?fields= / ?omit= - только под запрошенные поля (optimize_queryset),
+    иначе дополняется недостающими связями и колонками (auto_optimize_queryset).
+    Добавленное пишется в лог на уровне DEBUG, а при settings.DEBUG -
+    в заголовок ответа X-Queryset-Optimization.
+    """
+    queryset_report = None
+
+    def filter_queryset(self, queryset):
+        return self.optimize_for_serializer(super().filter_queryset(queryset))
+
+    async def afilter_queryset(self, queryset):
+        # Асинхронные представления (adrf) фильтруют через afilter_queryset
+        return self.optimize_for_serializer(await super().afilter_queryset(queryset))
+
+    def optimize_for_serializer(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if self.request.method not in SAFE_METHODS or not issubclass(serializer_class, Serializer):
+            return queryset
+
+        keep = getattr(self, 'etag_fields', ())
+        if selected_field_names(self.request, ()) is not None:
+            return optimize_queryset(queryset, serializer_class, self.request, keep=keep)
+
+        queryset, report = auto_optimize_queryset(queryset, serializer_class, self.request, keep=keep)
+        self.queryset_report = report
+        if report['select_related'] or report['prefetch_related'] or report['only']:
+            logger.debug(
+                f"{type(self).__name__} queryset optimized for {serializer_class.__name__}: "
+                f"{format_report(report)}"
+            )
+        return queryset
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if settings.DEBUG and self.queryset_report is not None:
+            response['X-Queryset-Optimization'] = format_report(self.queryset_report)
+        return response
+
+
+def format_report(report):
+    """select_related=author; only=content,created_at; unresolved=is_successful"""
+    return '; '.join(
+        f"{key}={','.join(values)}" for key, values in report.items() if values
+    ) or 'none'
@@ -0,0 +1,245 @@
+import logging
+import math
+import os
+from io import BytesIO
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from kombu.exceptions import OperationalError
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Форматы производных: расширение, формат Pillow и параметры сохранения
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'optimize': True, 'progressive': True}),
+}
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def derivative_name(name, width, fmt):
+    """Производная хранится рядом с оригиналом: posts/photo.jpg -> posts/photo.w640.webp"""
+    root, _ = os.path.splitext(name)
+    return f"{root}.w{width}.{FORMATS[fmt][0]}"
+
+
+def build_derivatives(name, widths, storage=default_storage):
+    """
+    Генерирует производные изображения name фиксированной ширины и blurhash.
+
+    Не обращается к БД (подходит для пула процессов). Изображения не
+    увеличиваются: ширины больше оригинала пропускаются, а если оригинал уже
+    самой маленькой ширины, сохраняется одна производная в его размере.
+    Возвращает описание для поля *_variants.
+    """
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    width, height = image.size
+
+    targets = sorted({w for w in widths if w < width} | {min(max(widths), width)})
+    files = {fmt: {} for fmt in FORMATS}
+    for target in targets:
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.LANCZOS
+        )
+        for fmt, (_, pillow_format, options) in FORMATS.items():
+            frame = resized
+            if pillow_format == 'JPEG' and has_alpha:
+                frame = Image.new('RGB', resized.size, (255, 255, 255))
+                frame.paste(resized, mask=resized.getchannel('A'))
+            buffer = BytesIO()
+            frame.save(buffer, pillow_format, quality=settings.IMAGE_DERIVATIVE_QUALITY, **options)
+            target_name = derivative_name(name, target, fmt)
+            if storage.exists(target_name):
+                storage.delete(target_name)
+            files[fmt][str(target)] = storage.save(target_name, ContentFile(buffer.getvalue()))
+
+    return {
+        'source': name,
+        'width': width,
+        'height': height,
+        'blurhash': blurhash_encode(image.convert('RGB')),
+        'files': files,
+    }
+
+
+def delete_derivatives(variants, keep=None):
+    """Удаляет файлы производных, кроме тех, что есть в keep"""
+    keep_names = {
+        file_name
+        for sizes in (keep or {}).get('files', {}).values()
+        for file_name in sizes.values()
+    }
+    for sizes in (variants or {}).get('files', {}).values():
+        for file_name in sizes.values():
+            if file_name not in keep_names:
+                try:
+                    default_storage.delete(file_name)
+                except OSError as e:
+                    logger.warning(f"Failed to delete image derivative {file_name}: {e}")
+
+
+def needs_refresh(instance, field_name, update_fields=None):
+    """Сохранение объекта изменило изображение, для которого нет актуальных производных"""
+    if update_fields is not None and field_name not in update_fields:
+        return False
+    if field_name in instance.get_deferred_fields():
+        return False
+    name = getattr(instance, field_name).name or ''
+    return name != (getattr(instance, f'{field_name}_variants') or {}).get('source', '')
+
+
+def schedule_refresh(task, pk):
+    """Ставит задачу генерации производных после коммита; недоступность брокера не ломает сохранение"""
+    def enqueue():
+        try:
+            task.delay(pk)
+        except OperationalError as e:
+            logger.warning(f"Image derivatives for {pk} not scheduled: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+def refresh_derivatives(model, pk, field_name, widths):
+    """
+    Пересобирает производные для изображения объекта и сохраняет описание
+    в поле <field_name>_variants. Запись условная (по имени исходного
+    файла), поэтому замена изображения во время обработки не затирается.
+    Возвращает True, если описание изменилось.
+    """
+    variants_field = f'{field_name}_variants'
+    row = model._default_manager.filter(pk=pk).values(field_name, variants_field).first()
+    if row is None:
+        return False
+
+    name, previous = row[field_name] or '', row[variants_field] or {}
+    if not name:
+        if not previous:
+            return False
+        updated = model._default_manager.filter(
+            Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True}), pk=pk
+        ).update(**{variants_field: {}})
+        if updated:
+            delete_derivatives(previous)
+        return bool(updated)
+
+    if previous.get('source') == name:
+        return False
+
+    variants = build_derivatives(name, widths)
+    return store_derivatives(model, pk, field_name, variants, previous)
+
+
+def store_derivatives(model, pk, field_name, variants, previous):
+    """Сохраняет описание производных, если исходный файл объекта не сменился"""
+    updated = model._default_manager.filter(pk=pk, **{field_name: variants['source']}).update(
+        **{f'{field_name}_variants': variants}
+    )
+    if updated:
+        delete_derivatives(previous, keep=variants)
+    else:
+        delete_derivatives(variants)
+    return bool(updated)
+
+
+def blurhash_encode(image, x_components=4, y_components=3, size=32):
+    """Blurhash (https://blurha.sh) по уменьшенной копии изображения, вычисления в NumPy"""
+    image = image.copy()
+    image.thumbnail((size, size))
+    pixels = np.asarray(image, dtype=np.float64) / 255
+    linear = np.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+    height, width = linear.shape[:2]
+
+    basis_x = np.cos(np.pi * np.outer(np.arange(x_components), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(y_components), np.arange(height)) / height)
+    factors = np.einsum('jy,ix,yxc->jic', basis_y, basis_x, linear) / (width * height)
+    factors[1:, :] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, math.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += _base83(0, 1)
+
+    r, g, b = (_linear_to_srgb(value) for value in dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+
+    quantised = np.clip(
+        np.floor(np.sign(ac) * np.sqrt(np.abs(ac / maximum)) * 9 + 9.5), 0, 18
+    ).astype(int)
+    for qr, qg, qb in quantised:
+        result += _base83(qr * 19 * 19 + qg * 19 + qb, 2)
+    return result
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, float(value)))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _base83(value, length):
+    return ''.join(
+        BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length)
+    )
+
+
+def variants_representation(image, variants, request=None):
+    """
+    Карта производных для клиента: {формат: {ширина: url}} и blurhash.
+    None, если производные еще не готовы для текущего файла.
+    image - файл поля или имя файла (строки .values()).
+    """
+    if not image or not variants or variants.get('source') != getattr(image, 'name', image):
+        return None
+
+    def url(name):
+        location = default_storage.url(name)
+        return request.build_absolute_uri(location) if request is not None else location
+
+    return {
+        'width': variants['width'],
+        'height': variants['height'],
+        'blurhash': variants['blurhash'],
+        **{
+            fmt: {width: url(name) for width, name in sizes.items()}
+            for fmt, sizes in variants['files'].items()
+        },
+    }
+
+
+class ImageVariantsField(serializers.Field):
+    """Производные изображения (srcset) для поля image_field модели"""
+
+    def __init__(self, image_field, absolute=True, **kwargs):
+        self.image_field = image_field
+        self.absolute = absolute
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return variants_representation(
+            getattr(instance, self.image_field),
+            getattr(instance, f'{self.image_field}_variants'),
+            self.context.get('request') if self.absolute else None,
+        )
@@ -0,0 +1,126 @@
+from django.apps import apps
+from django.db.models import Count
+from django.db.models.manager import BaseManager
+from rest_framework import serializers
+
+LOADERS_ATTR = 'batch_loaders'
+
+
+def _loaded(context, loader):
+    """Уже загруженные значения загрузчика: общие на весь запрос, без запроса - на сериализатор"""
+    request = context.get('request')
+    # DRF Request оборачивает HttpRequest; храним на нем, чтобы все сериализаторы запроса видели одно и то же
+    holder = getattr(request, '_request', request)
+    if holder is None:
+        store = context.setdefault(LOADERS_ATTR, {})
+    else:
+        store = holder.__dict__.setdefault(LOADERS_ATTR, {})
+    return store.setdefault(loader, {})
+
+
+class BatchLoader:
+    """
+    Пакетная загрузка данных для вычисляемых полей (по образцу DataLoader).
+
+    batch_load получает все ключи сразу и отдает {ключ: значение} одним
+    запросом. Загруженное запоминается на время HTTP-запроса: повторный
+    ключ (тот же автор, та же подписка) в БД уже не уходит.
+    """
+    default = None
+
+    def batch_load(self, keys):
+        raise NotImplementedError
+
+    def load_many(self, context, keys):
+        loaded = _loaded(context, self)
+        missing = {key for key in keys if key is not None and key not in loaded}
+        if missing:
+            found = self.batch_load(missing)
+            for key in missing:
+                loaded[key] = found.get(key, self.default)
+        return loaded
+
+    def load(self, context, key):
+        if key is None:
+            return self.default
+        return self.load_many(context, (key,))[key]
+
+
+class ModelLoader(BatchLoader):
+    """Объекты модели по первичному ключу"""
+
+    def __init__(self, model, select_related=()):
+        self.model = model
+        self.select_related = select_related
+
+    def batch_load(self, keys):
+        model = apps.get_model(self.model) if isinstance(self.model, str) else self.model
+        queryset = model._default_manager.filter(pk__in=keys)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        return {obj.pk: obj for obj in queryset}
+
+
+class CountLoader(BatchLoader):
+    """Количество объектов модели на значение поля (GROUP BY field)"""
+    default = 0
+
+    def __init__(self, model, field, **filters):
+        self.model = model
+        self.field = field
+        self.filters = filters
+
+    def batch_load(self, keys):
+        model = apps.get_model(self.model) if isinstance(self.model, str) else self.model
+        return dict(
+            model._default_manager.filter(**{f'{self.field}__in': keys}, **self.filters)
+            .order_by().values_list(self.field).annotate(count=Count('pk'))
+        )
+
+
+class FunctionLoader(BatchLoader):
+    """Загрузчик из готовой функции ключи -> {ключ: значение}"""
+
+    def __init__(self, function, default=None):
+        self.function = function
+        self.default = default
+
+    def batch_load(self, keys):
+        return self.function(list(keys))
+
+
+class BatchLoadedField(serializers.Field):
+    """
+    Поле только для чтения со значением загрузчика. key - атрибут объекта
+    или функция объект -> ключ (None - загружать нечего). Если у сериализатора
+    есть get_<поле>(obj, value), ответ оформляет он.
+    """
+
+    def __init__(self, loader, key='pk', **kwargs):
+        self.loader = loader
+        self.key = key
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def key_for(self, instance):
+        return self.key(instance) if callable(self.key) else getattr(instance, self.key)
+
+    def prime(self, instances):
+        self.loader.load_many(self.context, [self.key_for(instance) for instance in instances])
+
+    def to_representation(self, instance):
+        value = self.loader.load(self.context, self.key_for(instance))
+        method = getattr(self.parent, f'get_{self.field_name}', None)
+        return method(instance, value) if method is not None else value
+
+
+class BatchListSerializer(serializers.ListSerializer):
+    """Перед сериализацией списка загружает значения BatchLoadedField для всех объектов разом"""
+
+    def to_representation(self, data):
+        instances = list(data.all() if isinstance(data, BaseManager) else data)
+        for field in self.child.fields.values():
+            if isinstance(field, BatchLoadedField):
+                field.prime(instances)
+        return super().to_representation(instances)
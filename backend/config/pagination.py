@@ -0,0 +1,188 @@
+import json
+from base64 import b64decode, b64encode
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Курсорная пагинация по ключу (поле сортировки, id) без OFFSET и COUNT(*).
+
+    Курсор непрозрачный (base64 JSON) и хранит значение поля сортировки
+    и id последней записи, поэтому страница N стоит столько же, сколько первая.
+    Поле сортировки берется из OrderingFilter представления, размер
+    страницы - из ?page_size= (не больше max_page_size).
+
+    Представление может определить get_pinned_section(queryset): эти объекты
+    выводятся в начале первой страницы (и когда previous приводит к ней)
+    и исключаются из остальных.
+    Последовательности с методом keyset_page() (индекс ленты) пагинируются сами.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.has_next = self.has_previous = False
+        self.next_position = self.previous_position = None
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        if hasattr(queryset, 'keyset_page'):
+            results, self.next_position = queryset.keyset_page(position, self.page_size)
+            self.has_next = self.next_position is not None
+            self.is_first_page = position is None
+            return results
+
+        pinned = []
+        get_pinned_section = getattr(view, 'get_pinned_section', None)
+        if get_pinned_section is not None:
+            pinned = list(get_pinned_section(queryset))
+            if pinned:
+                queryset = queryset.exclude(pk__in=[obj.pk for obj in pinned])
+
+        field = self.get_ordering(request, queryset, view)
+        name = field.lstrip('-')
+        reverse = bool(position and position.get('r'))
+        descending = field.startswith('-') != reverse
+
+        if position is not None:
+            if 'v' not in position or 'i' not in position:
+                raise NotFound(self.invalid_cursor_message)
+            value = self.to_python(queryset.model, name, position.get('v'))
+            try:
+                pk = int(position.get('i'))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if descending:
+                condition = Q(**{f'{name}__lte': value}) & ~Q(**{name: value, 'pk__gte': pk})
+            else:
+                condition = Q(**{f'{name}__gte': value}) & ~Q(**{name: value, 'pk__lte': pk})
+            queryset = queryset.filter(condition)
+
+        order = (f'-{name}', '-pk') if descending else (name, 'pk')
+        results = list(queryset.order_by(*order)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_previous = has_more
+            self.has_next = True
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        if results:
+            if self.has_next:
+                self.next_position = self.make_position(results[-1], name)
+            if self.has_previous:
+                self.previous_position = dict(self.make_position(results[0], name), r=1)
+
+        # Первая страница, в том числе пришедшая по previous, начинается с закрепленных
+        self.is_first_page = position is None or (reverse and not has_more)
+        if self.is_first_page:
+            results = pinned + results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """Первое поле сортировки из OrderingFilter или значение по умолчанию"""
+        ordering = None
+        for backend in getattr(view, 'filter_backends', None) or []:
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or [self.ordering]
+        if isinstance(ordering, str):
+            ordering = [ordering]
+
+        field = ordering[0]
+        try:
+            queryset.model._meta.get_field(field.lstrip('-'))
+        except FieldDoesNotExist:
+            return self.ordering
+        return field
+
+    def make_position(self, instance, name):
+        value = getattr(instance, name)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        return {'v': value, 'i': instance.pk}
+
+    def to_python(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, dict):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        encoded = b64encode(
+            json.dumps(position, separators=(',', ':')).encode('utf-8'), altchars=b'-_'
+        ).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.previous_position is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.previous_position)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,17 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Общий клиент Redis для индексов, счетчиков и кеша на уровне приложения."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
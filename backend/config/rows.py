@@ -0,0 +1,30 @@
+from django.db.models.query import ValuesIterable
+
+
+class Row(dict):
+    """
+    Строка .values() с доступом к колонкам как к атрибутам (row.created_at, row.pk),
+    чтобы пагинация, ETag и прочий код, читающий атрибуты объектов, работали без модели.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name == 'pk':
+            name = 'id'
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class RowIterable(ValuesIterable):
+    def __iter__(self):
+        for row in super().__iter__():
+            yield Row(row)
+
+
+def as_rows(queryset, *fields):
+    """queryset.values(*fields), возвращающий Row вместо dict (сохраняется при filter/order_by/срезах)"""
+    queryset = queryset.values(*fields)
+    queryset._iterable_class = RowIterable
+    return queryset
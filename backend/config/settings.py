@@ -19,6 +19,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,10 +93,39 @@ DATABASES = {
         'PASSWORD': config('POSTGRES_PASSWORD'),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='5432', cast=int),
-        'ATOMIC_REQUESTS': True,
+        # Транзакции на запрос открывает обработчик запросов (config.transactions, только для записи)
+        'ATOMIC_REQUESTS': False,
+        # Веб-сервер работает под ASGI: каждый запрос ходит в БД из своего потока, и постоянные
+        # соединения не переиспользуются, а копятся. Поэтому по умолчанию 0 - соединение на запрос.
+        # Положительное значение (постоянные соединения) - только для синхронных процессов: Celery, WSGI
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS="host1:5432,host2:5432" (те же имя БД и учетные данные)
+DATABASE_REPLICAS = []
+for index, replica in enumerate(config('DB_REPLICA_HOSTS', default='', cast=lambda v: [h.strip() for h in v.split(',') if h.strip()]), 1):
+    host, _, port = replica.rpartition(':')
+    if not port.isdigit():
+        host, port = replica, DATABASES['default']['PORT']
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=host, PORT=int(port),
+        OPTIONS={'connect_timeout': 2}, TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
+
+# Одновременных запросов на процесс (и соединений с каждой БД) не больше этого числа
+ASGI_MAX_CONCURRENT_REQUESTS = config('ASGI_MAX_CONCURRENT_REQUESTS', default=25, cast=int)
+
+# Исключение отстающих реплик (с) и закрепление за мастером после записи (с)
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=5, cast=float)
+REPLICA_LAG_CHECK_INTERVAL = config('REPLICA_LAG_CHECK_INTERVAL', default=5, cast=float)
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=10, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -138,6 +169,14 @@ STATICFILES_FINDERS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Быстрая сериализация списков постов из строк .values() (PostListRowSerializer)
+FAST_LIST_SERIALIZATION = config('FAST_LIST_SERIALIZATION', default=True, cast=bool)
+
+# Производные изображений (ширины в пикселях, качество WebP/JPEG)
+POST_IMAGE_WIDTHS = (320, 640, 1280)
+AVATAR_WIDTHS = (48, 96, 192)
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=80, cast=int)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -160,10 +199,12 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'config.renderers.ORJSONRenderer',
+        'config.renderers.MessagePackRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'config.renderers.ORJSONParser',
+        'config.renderers.MessagePackParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
@@ -217,6 +258,45 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@newssite.com')
 
+# Redis (индекс ленты, счетчики)
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+REDIS_SOCKET_TIMEOUT = config('REDIS_SOCKET_TIMEOUT', default=0.5, cast=float)
+
+# Подсказки при вводе: TTL кеша на префикс (с) и лимит времени запроса к БД (мс)
+AUTOCOMPLETE_CACHE_TIMEOUT = config('AUTOCOMPLETE_CACHE_TIMEOUT', default=60, cast=int)
+AUTOCOMPLETE_STATEMENT_TIMEOUT = config('AUTOCOMPLETE_STATEMENT_TIMEOUT', default=50, cast=int)
+
+# Популярное сейчас: окно почасовых просмотров, период полураспада (ч), размер списков
+TRENDING_WINDOW_HOURS = config('TRENDING_WINDOW_HOURS', default=48, cast=int)
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=6, cast=float)
+TRENDING_TOP_K = config('TRENDING_TOP_K', default=20, cast=int)
+
+# Дерево комментариев поста: TTL снимка в кеше (с) и предел числа комментариев в нем
+COMMENT_TREE_CACHE_TIMEOUT = config('COMMENT_TREE_CACHE_TIMEOUT', default=600, cast=int)
+COMMENT_TREE_MAX_NODES = config('COMMENT_TREE_MAX_NODES', default=2000, cast=int)
+
+# Закрепленные посты и первая страница ленты категории в кеше, секунды
+CATEGORY_FEED_CACHE_TIMEOUT = config('CATEGORY_FEED_CACHE_TIMEOUT', default=300, cast=int)
+
+# Пакетное чтение (posts/batch/, comments/batch/): id за запрос и TTL кеша постов по id, секунды
+BATCH_MAX_IDS = config('BATCH_MAX_IDS', default=100, cast=int)
+POST_OBJECT_CACHE_TIMEOUT = config('POST_OBJECT_CACHE_TIMEOUT', default=300, cast=int)
+
+# Кеш ответов виджетов (популярные, последние, закрепленные), секунды
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'news',
+        'OPTIONS': {
+            'socket_timeout': REDIS_SOCKET_TIMEOUT,
+            'socket_connect_timeout': REDIS_SOCKET_TIMEOUT,
+        },
+    }
+}
+
 # Celery настройки (опционально)
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
@@ -247,4 +327,28 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.payment.tasks.retry_failed_webhook_events',
         'schedule': 3600.0,  # Каждый час
     },
+    'sweep-expired-pins': {
+        'task': 'apps.frontpage.tasks.sweep_expired_pins',
+        'schedule': 60.0,  # Каждую минуту
+    },
+    'compute-trending-posts': {
+        'task': 'apps.frontpage.tasks.compute_trending_posts',
+        'schedule': 300.0,  # Каждые 5 минут
+    },
+    'flush-post-views': {
+        'task': 'apps.frontpage.tasks.flush_post_views',
+        'schedule': 60.0,  # Каждую минуту
+    },
+    'rebuild-feed-index': {
+        'task': 'apps.frontpage.tasks.rebuild_feed_index',
+        'schedule': 86400.0,  # Каждый день
+    },
+    'reconcile-comment-counters': {
+        'task': 'apps.comments.tasks.reconcile_comment_counters',
+        'schedule': 86400.0,  # Каждый день
+    },
+    'reconcile-category-counters': {
+        'task': 'apps.frontpage.tasks.reconcile_category_counters',
+        'schedule': 86400.0,  # Каждый день
+    },
 }
\ No newline at end of file
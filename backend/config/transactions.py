@@ -0,0 +1,54 @@
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections, transaction
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AtomicWritesHandlerMixin:
+    """
+    Замена ATOMIC_REQUESTS для обработчиков запросов (WSGI и ASGI): как
+    BaseHandler.make_view_atomic, но представление выполняется в транзакции
+    только для небезопасных методов. GET-запросы (лента, пост, комментарии)
+    идут в autocommit, без BEGIN/COMMIT и без удержания транзакции на время
+    сериализации.
+
+    Оборачивается только само представление: process_view и process_exception
+    промежуточных слоев работают как обычно, исключение откатывает транзакцию
+    до process_exception. Ответ DRF с обработанной ошибкой (response.exception)
+    тоже откатывается - как set_rollback() DRF при ATOMIC_REQUESTS.
+
+    Учитывает transaction.non_atomic_requests. Асинхронные представления не
+    оборачиваются (Django не поддерживает для них ATOMIC_REQUESTS): их
+    обработчики записи открывают транзакцию сами, как PostDetailView.
+    """
+
+    def make_view_atomic(self, view):
+        view = super().make_view_atomic(view)
+        if iscoroutinefunction(view):
+            return view
+        non_atomic = getattr(view, '_non_atomic_requests', set())
+        aliases = [
+            alias for alias in connections
+            if alias not in non_atomic and alias not in settings.DATABASE_REPLICAS
+        ]
+        if not aliases:
+            return view
+
+        @wraps(view)
+        def atomic_view(request, *args, **kwargs):
+            if request.method in SAFE_METHODS:
+                return view(request, *args, **kwargs)
+            with ExitStack() as stack:
+                for alias in aliases:
+                    stack.enter_context(transaction.atomic(using=alias))
+                response = view(request, *args, **kwargs)
+                if getattr(response, 'exception', False):
+                    for alias in aliases:
+                        transaction.set_rollback(True, using=alias)
+                return response
+
+        return atomic_view
@@ -9,8 +9,17 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+import django
+from django.core.handlers.wsgi import WSGIHandler
+
+from config.transactions import AtomicWritesHandlerMixin
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_wsgi_application()
+
+class AtomicWritesWSGIHandler(AtomicWritesHandlerMixin, WSGIHandler):
+    """ WSGI-обработчик с транзакцией вокруг представлений записи """
+
+
+django.setup(set_prefix=False)
+application = AtomicWritesWSGIHandler()
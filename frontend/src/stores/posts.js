@@ -11,13 +11,15 @@ export const usePostsStore = defineStore('posts', () => {
   const recentPosts = ref([])
   const myPosts = ref([])
   
-  // Пагинация
+  // Пагинация курсорная: cursors[i] - курсор страницы i + 1 (у первой курсора нет).
+  // Общее число постов API не считает, поэтому доступны уже открытые страницы и следующая
   const pagination = ref({
-    count: 0,
+    count: null,
     next: null,
     previous: null,
     currentPage: 1,
-    pageSize: 20
+    pageSize: 20,
+    cursors: [null]
   })
   
   // Фильтры и поиск
@@ -45,22 +47,27 @@ export const usePostsStore = defineStore('posts', () => {
   )
   
   const hasNextPage = computed(() => !!pagination.value.next)
-  const hasPreviousPage = computed(() => !!pagination.value.previous)
+  const hasPreviousPage = computed(() => pagination.value.currentPage > 1)
   
-  const totalPages = computed(() => 
-    Math.ceil(pagination.value.count / pagination.value.pageSize)
-  )
+  const totalPages = computed(() => pagination.value.cursors.length)
+
+  const cursorFromLink = (link) => new URL(link).searchParams.get('cursor')
 
   // Действия для постов
   const fetchPosts = async (params = {}) => {
     isLoading.value = true
     try {
+      // Страница, курсор которой еще неизвестен, открывается как первая
+      const requestedPage = params.page || pagination.value.currentPage
+      const page = requestedPage <= pagination.value.cursors.length ? requestedPage : 1
+      const pageSize = params.page_size || pagination.value.pageSize
       const queryParams = {
         ...filters.value,
         ...params,
-        page: params.page || pagination.value.currentPage,
-        page_size: params.page_size || pagination.value.pageSize
+        cursor: pagination.value.cursors[page - 1],
+        page_size: pageSize
       }
+      delete queryParams.page
       
       // Удаляем пустые параметры
       Object.keys(queryParams).forEach(key => {
@@ -73,12 +80,17 @@ export const usePostsStore = defineStore('posts', () => {
       const data = response.data
       
       posts.value = data.results || []
+      const cursors = pagination.value.cursors.slice(0, page)
+      if (data.next) {
+        cursors.push(cursorFromLink(data.next))
+      }
       pagination.value = {
-        count: data.count || 0,
+        count: data.count ?? null,
         next: data.next,
         previous: data.previous,
-        currentPage: params.page || pagination.value.currentPage,
-        pageSize: params.page_size || pagination.value.pageSize
+        currentPage: page,
+        pageSize,
+        cursors
       }
       
       return data
@@ -122,7 +134,9 @@ export const usePostsStore = defineStore('posts', () => {
       
       // Добавляем новый пост в начало списка
       posts.value.unshift(newPost)
-      pagination.value.count += 1
+      if (pagination.value.count !== null) {
+        pagination.value.count += 1
+      }
       
       return newPost
     } catch (error) {
@@ -194,7 +208,9 @@ export const usePostsStore = defineStore('posts', () => {
       const index = posts.value.findIndex(post => post.slug === slug)
       if (index !== -1) {
         posts.value.splice(index, 1)
-        pagination.value.count -= 1
+        if (pagination.value.count !== null) {
+          pagination.value.count -= 1
+        }
       }
       
       // Очищаем текущий пост
@@ -300,7 +316,9 @@ export const usePostsStore = defineStore('posts', () => {
   // Утилиты для фильтрации и поиска
   const setFilters = (newFilters) => {
     filters.value = { ...filters.value, ...newFilters }
-    pagination.value.currentPage = 1 // Сбрасываем на первую страницу
+    // Сбрасываем на первую страницу: курсоры относятся к прежним фильтрам
+    pagination.value.currentPage = 1
+    pagination.value.cursors = [null]
   }
 
   const clearFilters = () => {
@@ -312,6 +330,7 @@ export const usePostsStore = defineStore('posts', () => {
       ordering: '-created_at'
     }
     pagination.value.currentPage = 1
+    pagination.value.cursors = [null]
   }
 
   const searchPosts = async (searchQuery) => {
@@ -353,11 +372,12 @@ export const usePostsStore = defineStore('posts', () => {
   const clearPosts = () => {
     posts.value = []
     pagination.value = {
-      count: 0,
+      count: null,
       next: null,
       previous: null,
       currentPage: 1,
-      pageSize: 20
+      pageSize: 20,
+      cursors: [null]
     }
   }
 